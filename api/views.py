@@ -9,17 +9,28 @@ from rest_framework.permissions import (
 )
 import logging
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import HttpResponse
 from rest_framework.decorators import (
+    action,
     api_view,
     permission_classes,
 )
 from products.models import Product, Category
 from checkout.models import Order, Payment
-from products.serializers import ProductSerializer
+from core.pagination import KeysetPagination
+from products.filters import ProductSearchFilter
+from products.serializers import (
+    ProductListSerializer,
+    ProductSerializer,
+    get_media_host,
+)
+from products.services.attributes import AttributeIndexService
+from products.services.categories import CategoryTreeService
+from products.services.merchandising import MerchandisingService
 from .serializers import (
     OrderSerializer,
     PaymentSerializer,
@@ -31,6 +42,23 @@ User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
+class ProductPagination(KeysetPagination):
+    """
+    Keyset pagination over the supported product sorts.
+    """
+
+    orderings = (
+        "-created_at",
+        "created_at",
+        "effective_price",
+        "-effective_price",
+        "name",
+        "-name",
+    )
+    # Price sorts follow the sale-aware effective price
+    ordering_aliases = {"price": "effective_price", "-price": "-effective_price"}
+
+
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for products - digital-only focus.
@@ -40,14 +68,98 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ProductSerializer
     lookup_field = "slug"
     permission_classes = [AllowAny]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = ProductPagination
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
     search_fields = ["name", "description", "category__name"]
     ordering_fields = [
         "name",
         "price",
+        "effective_price",
         "created_at",
     ]
 
+    @action(detail=False, methods=["get"])
+    def merchandising(self, request):
+        """Featured, new arrival and on-sale product cards"""
+        return Response(
+            {
+                name: MerchandisingService.get_cards(
+                    MerchandisingService.get_block(name), request=request
+                )
+                for name in MerchandisingService.BLOCKS
+            }
+        )
+
+    @action(detail=True, methods=["get"])
+    def related(self, request, slug=None):
+        """Precomputed related product cards"""
+        product = self.get_object()
+        return Response(
+            MerchandisingService.get_cards(
+                MerchandisingService.get_related(product), request=request
+            )
+        )
+
+    @action(detail=True, methods=["get"])
+    def variants(self, request, slug=None):
+        """The product's whole variant matrix, keyed by attribute signature"""
+        product = self.get_object()
+        return Response(AttributeIndexService.get_variant_matrix(product))
+
+    def get_fieldset(self):
+        """
+        Resolve the sparse fieldset requested with ?fields= and ?expand=.
+
+        ?fields=id,name,price picks top-level fields and ?expand=images,variants
+        adds nested relations. Returns None when neither is given, and
+        raises ValidationError when they name no known field.
+        """
+        fields = self.request.query_params.get("fields")
+        expand = self.request.query_params.get("expand")
+        if not fields and not expand:
+            return None
+
+        available = ProductSerializer.Meta.fields
+        if fields:
+            fieldset = [
+                name
+                for name in fields.split(",")
+                if name in available and name not in ProductSerializer.EXPANDABLE_FIELDS
+            ]
+        elif self.action == "list":
+            fieldset = list(ProductListSerializer.Meta.fields)
+        else:
+            fieldset = [
+                name
+                for name in available
+                if name not in ProductSerializer.EXPANDABLE_FIELDS
+            ]
+
+        if expand:
+            fieldset.extend(
+                name
+                for name in expand.split(",")
+                if name in ProductSerializer.EXPANDABLE_FIELDS and name not in fieldset
+            )
+        if not fieldset:
+            raise ValidationError(
+                {"fields": "None of the requested fields exist on products."}
+            )
+        return fieldset
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return ProductListSerializer
+        return ProductSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            kwargs["fields"] = fieldset
+            kwargs.setdefault("context", self.get_serializer_context())
+            return ProductSerializer(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         queryset = super().get_queryset()
 
@@ -71,15 +183,24 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(product_type=product_type)
 
         if min_price:
-            queryset = queryset.filter(price__gte=min_price)
+            queryset = queryset.filter(effective_price__gte=min_price)
 
         if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-
-        # Add prefetching to reduce DB queries
-        return queryset.select_related("category").prefetch_related(
-            "images", "variants"
-        )
+            queryset = queryset.filter(effective_price__lte=max_price)
+
+        # Only join and prefetch the relations the response includes
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            fieldset = self.get_serializer_class().Meta.fields
+        if "category" in fieldset:
+            queryset = queryset.select_related("category")
+        # main_image falls back to the product's images
+        prefetches = [name for name in ("images", "variants") if name in fieldset]
+        if "main_image" in fieldset and "images" not in prefetches:
+            prefetches.append("images")
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
 
 
 class CategoryViewSet(ReadOnlyModelViewSet):
@@ -91,6 +212,42 @@ class CategoryViewSet(ReadOnlyModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
+    def _with_media_host(self, nodes, host, nested):
+        results = []
+        for node in nodes:
+            image = node["image"]
+            if image and image.startswith("/"):
+                image = f"{host}{image}"
+            item = {
+                "id": node["id"],
+                "name": node["name"],
+                "slug": node["slug"],
+                "description": node["description"],
+                "image": image,
+            }
+            children = self._with_media_host(node["children"], host, nested)
+            results.append(item)
+            if nested:
+                item["children"] = children
+            else:
+                results.extend(children)
+        return results
+
+    def list(self, request, *args, **kwargs):
+        """
+        Active categories, served from the cached category tree. Inactive
+        categories and everything under them are left out; retrieve still
+        finds any category by id.
+        """
+        tree = CategoryTreeService.get_tree()
+        return Response(self._with_media_host(tree, get_media_host(request), False))
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """Nested tree of active categories for navigation menus"""
+        tree = CategoryTreeService.get_tree()
+        return Response(self._with_media_host(tree, get_media_host(request), True))
+
 
 class OrderViewSet(viewsets.ModelViewSet):
     """
@@ -151,6 +308,7 @@ def create_payment_intent(request):
         from django.conf import settings
         from accounts.models import Profile
         from accounts.utils import send_verification_email
+        from checkout.services.checkout import CheckoutService
         from django.db import transaction
 
         logger.info("\n=== PAYMENT INTENT REQUEST ===")
@@ -202,9 +360,10 @@ def create_payment_intent(request):
                 "item_count": str(cart.items.count()),
             }
 
-            # Calculate amount
-            cart_total = float(cart.total)
-            stripe_amount = int(cart_total * 100)
+            # Charge the revalidated snapshot total, already in cents
+            CheckoutService.revalidate_cart(cart)
+            cart_total = cart.pricing.total
+            stripe_amount = cart.pricing.total_cents
 
             logger.info(
                 f"Creating payment intent for authenticated user: ${cart_total}"
@@ -310,9 +469,10 @@ def create_payment_intent(request):
             metadata["user_id"] = str(new_user.id)
             metadata["new_user"] = "true"
 
-        # Calculate amount
-        cart_total = float(cart.total)
-        stripe_amount = int(cart_total * 100)
+        # Charge the revalidated snapshot total, already in cents
+        CheckoutService.revalidate_cart(cart)
+        cart_total = cart.pricing.total
+        stripe_amount = cart.pricing.total_cents
 
         logger.info(f"Creating payment intent for guest/new user: ${cart_total}")
 
@@ -344,6 +504,26 @@ def create_payment_intent(request):
         )
 
 
+def _created_order_response(request, order, payment_intent, email):
+    """Response for an order created (now or earlier) from a payment."""
+    serializer = OrderSerializer(order, context={"request": request})
+
+    response_data = {
+        "order": serializer.data,
+        "message": "Order created successfully",
+        "success": True,
+        "has_digital_items": order.has_digital_items,
+        "email": email,
+    }
+
+    # Add verification reminder for new users
+    if payment_intent["metadata"].get("new_user") == "true":
+        response_data["verification_required"] = True
+        response_data["new_account_created"] = True
+
+    return Response(response_data, status=status.HTTP_201_CREATED)
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def create_order(request):
@@ -358,11 +538,9 @@ def create_order(request):
 
     try:
         from checkout.services.checkout import CheckoutService
+        from checkout.services.intents import PaymentIntentCache
         from django.db import transaction
-        from checkout.models import Payment
         from cart.models import Cart
-        import stripe
-        from django.conf import settings
 
         # Get payment intent ID
         payment_intent_id = request.data.get("payment_intent_id")
@@ -373,17 +551,19 @@ def create_order(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Verify payment with Stripe
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
+        # Verify payment from the webhook-fed cache, asking Stripe again
+        # if the cached state is not final
         try:
-            logger.info("Retrieving payment intent from Stripe...")
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            logger.info(f"Payment intent status: {payment_intent.status}")
-            logger.info(f"Payment intent metadata: {payment_intent.metadata}")
-
-            if payment_intent.status != "succeeded":
-                logger.error(f"Payment not completed. Status: {payment_intent.status}")
+            payment_intent = PaymentIntentCache.get(payment_intent_id)
+            if payment_intent["status"] != "succeeded":
+                payment_intent = PaymentIntentCache.get(payment_intent_id, refresh=True)
+            logger.info(f"Payment intent status: {payment_intent['status']}")
+            logger.info(f"Payment intent metadata: {payment_intent['metadata']}")
+
+            if payment_intent["status"] != "succeeded":
+                logger.error(
+                    f"Payment not completed. Status: {payment_intent['status']}"
+                )
                 return Response(
                     {"error": "Payment not completed"},
                     status=status.HTTP_400_BAD_REQUEST,
@@ -397,8 +577,18 @@ def create_order(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # The webhook worker may have created the order already
+        order = Order.objects.filter(stripe_payment_intent_id=payment_intent_id).first()
+        if order is not None:
+            logger.info(f"Order {order.order_number} already exists for payment")
+            CheckoutService.record_stripe_payment(
+                order, payment_intent_id, payment_intent["amount"]
+            )
+            email = order.user.email if order.user else order.guest_email
+            return _created_order_response(request, order, payment_intent, email)
+
         # Get cart ID from payment intent metadata
-        cart_id = payment_intent.metadata.get("cart_id")
+        cart_id = payment_intent["metadata"].get("cart_id")
         if not cart_id:
             logger.error("No cart_id in payment intent metadata")
             return Response(
@@ -406,10 +596,11 @@ def create_order(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Get the cart
+        # Get the cart. It may have been emptied by the webhook worker
+        # since, which create_order_for_cart checks under the cart lock
         try:
             cart = Cart.objects.get(id=cart_id, is_active=True)
-            logger.info(f"Found cart {cart.id} with {cart.items.count()} items")
+            logger.info(f"Found cart {cart.id}")
         except Cart.DoesNotExist:
             logger.error(f"Cart {cart_id} not found")
             return Response(
@@ -417,14 +608,6 @@ def create_order(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Verify cart has items
-        if cart.items.count() == 0:
-            logger.error("Cart is empty")
-            return Response(
-                {"error": "Cart is empty"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         # Get or verify user
         user = None
 
@@ -440,7 +623,7 @@ def create_order(request):
 
         # Check payment intent metadata
         else:
-            user_id = payment_intent.metadata.get("user_id")
+            user_id = payment_intent["metadata"].get("user_id")
             if user_id:
                 try:
                     user = User.objects.get(id=user_id)
@@ -450,7 +633,7 @@ def create_order(request):
 
         # Last resort: find by email
         if not user:
-            email = payment_intent.metadata.get("email")
+            email = payment_intent["metadata"].get("email")
             if email:
                 try:
                     user = User.objects.get(email=email)
@@ -465,65 +648,37 @@ def create_order(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Ensure cart is assigned to user
-        if cart.user != user:
-            cart.user = user
-            cart.save(update_fields=["user"])
-
-        # Prepare order data
-        order_data = {
-            "email": user.email,
-            "notes": request.data.get("notes", ""),
-            "payment_method": "stripe",
-            "digital_delivery_email": user.email,
-            "stripe_payment_intent_id": payment_intent_id,
-        }
-
         logger.info(f"Creating order for user {user.email} with cart {cart.id}")
 
         # Create the order
         with transaction.atomic():
             try:
-                # Create a request-like object with the user
-                class MockRequest:
-                    def __init__(self, user, session):
-                        self.user = user
-                        self.session = session
-
-                mock_request = MockRequest(user, request.session)
-
-                # Create order
-                success, order, error_message = CheckoutService.create_order_from_cart(
-                    mock_request, **order_data
+                # Returns the order the webhook worker created for this
+                # payment, if any, and assigns the cart to the user
+                order = CheckoutService.create_order_for_cart(
+                    cart,
+                    user,
+                    email=user.email,
+                    digital_delivery_email=user.email,
+                    notes=request.data.get("notes", ""),
+                    stripe_payment_intent_id=payment_intent_id,
                 )
 
-                if not success:
-                    logger.error(f"CheckoutService failed: {error_message}")
+                if order is None:
+                    logger.error(f"Cart {cart.id} is empty")
                     return Response(
-                        {"error": error_message or "Failed to create order"},
+                        {"error": "Cart is empty"},
                         status=status.HTTP_400_BAD_REQUEST,
                     )
 
-                logger.info(f"Order created successfully: {order.order_number}")
+                logger.info(f"Order ready: {order.order_number}")
 
-                # Record the payment
-                payment = Payment.objects.create(
-                    order=order,
-                    payment_method="stripe",
-                    transaction_id=payment_intent_id,
-                    amount=order.total,
-                    status="completed",
-                    payment_data={"payment_intent": payment_intent_id},
+                # Record the payment and fulfill the order, unless the
+                # webhook worker already did
+                payment, created = CheckoutService.record_stripe_payment(
+                    order, payment_intent_id, payment_intent["amount"]
                 )
-                logger.info(f"Payment created: {payment.id}")
-
-                # The Payment model's save() method will automatically:
-                # 1. Update order payment status to 'paid'
-                # 2. Set up digital downloads via setup_digital_product()
-                # 3. Update order status
-
-                # Process successful payment (sends emails, marks as complete)
-                CheckoutService.process_successful_payment(order)
+                logger.info(f"Payment {payment.id} recorded: {created}")
 
                 # Verify digital products were set up
                 digital_items_count = 0
@@ -543,24 +698,8 @@ def create_order(request):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 )
 
-        # Prepare response
-        serializer = OrderSerializer(order, context={"request": request})
-
-        response_data = {
-            "order": serializer.data,
-            "message": "Order created successfully",
-            "success": True,
-            "has_digital_items": order.has_digital_items,
-            "email": user.email,
-        }
-
-        # Add verification reminder for new users
-        if payment_intent.metadata.get("new_user") == "true":
-            response_data["verification_required"] = True
-            response_data["new_account_created"] = True
-
         logger.info(f"Order creation completed successfully: {order.order_number}")
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        return _created_order_response(request, order, payment_intent, user.email)
 
     except Exception as e:
         logger.error(f"Unexpected error in create_order: {str(e)}", exc_info=True)
@@ -578,7 +717,7 @@ def check_payment_status(request):
     """
     try:
         import stripe
-        from django.conf import settings
+        from checkout.services.intents import PaymentIntentCache
 
         payment_intent_id = request.query_params.get("payment_intent")
         if not payment_intent_id:
@@ -587,10 +726,9 @@ def check_payment_status(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            # Cached or webhook-reported state; Stripe only on a miss
+            payment_intent = PaymentIntentCache.get(payment_intent_id)
 
             # Check if order exists for this payment
             order = (
@@ -601,8 +739,8 @@ def check_payment_status(request):
             )
 
             response_data = {
-                "success": payment_intent.status == "succeeded",
-                "status": payment_intent.status,
+                "success": payment_intent["status"] == "succeeded",
+                "status": payment_intent["status"],
             }
 
             if order:
@@ -651,10 +789,10 @@ def check_payment_status(request):
                     response_data["order"]["items"].append(item_data)
 
             # Add verification info from payment intent metadata
-            if payment_intent.metadata.get("new_user") == "true":
+            if payment_intent["metadata"].get("new_user") == "true":
                 response_data["verification_required"] = True
                 response_data["new_account_created"] = True
-                response_data["email"] = payment_intent.metadata.get(
+                response_data["email"] = payment_intent["metadata"].get(
                     "email", response_data.get("email")
                 )
 
@@ -146,6 +146,10 @@ class BlogPost(TimestampedModel):
         verbose_name = "Blog Post"
         verbose_name_plural = "Blog Posts"
         ordering = ["-published_at", "-created_at"]
+        indexes = [
+            # Keyset pagination seeks on (published_at, id)
+            models.Index(fields=["published_at", "id"], name="blog_post_published_id"),
+        ]
 
     def __str__(self):
         return self.title
@@ -5,6 +5,7 @@ from rest_framework import viewsets, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from core.pagination import KeysetPagination
 from .models import BlogCategory, BlogPost
 from .serializers import BlogCategorySerializer, BlogPostSerializer
 
@@ -135,6 +136,15 @@ class BlogCategoryViewSet(viewsets.ModelViewSet):
     search_fields = ["name"]
 
 
+class BlogPostPagination(KeysetPagination):
+    """
+    Keyset pagination for published posts, newest first.
+    """
+
+    page_size = 10
+    orderings = ("-published_at",)
+
+
 class BlogPostViewSet(viewsets.ModelViewSet):
     """
     API endpoint for blog posts.
@@ -142,6 +152,7 @@ class BlogPostViewSet(viewsets.ModelViewSet):
 
     queryset = BlogPost.objects.all()
     serializer_class = BlogPostSerializer
+    pagination_class = BlogPostPagination
     lookup_field = "slug"
     filter_backends = [filters.SearchFilter]
     search_fields = ["title", "content", "meta_keywords"]
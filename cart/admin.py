@@ -23,7 +23,7 @@ class CartAdmin(admin.ModelAdmin):
         "user",
         "session_key",
         "is_active",
-        "total_items",
+        "item_count",
         "subtotal_display",
         "total_display",
         "created_at",
@@ -52,7 +52,7 @@ class CartAdmin(admin.ModelAdmin):
         return f"${obj.subtotal:.2f}"
 
     subtotal_display.short_description = "Subtotal"
-    subtotal_display.admin_order_field = "subtotal"
+    subtotal_display.admin_order_field = "summary_subtotal"
 
     def total_display(self, obj):
         return f"${obj.total:.2f}"
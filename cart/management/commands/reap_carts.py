@@ -0,0 +1,40 @@
+# cart/management/commands/reap_carts.py
+from django.core.management.base import BaseCommand
+from cart.services.reaper import CartReaper
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned and inactive carts, their items and expired sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CartReaper.BATCH_SIZE,
+            help="Rows deleted per batch",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=CartReaper.PAUSE,
+            help="Seconds to sleep between batches",
+        )
+        parser.add_argument(
+            "--skip-sessions",
+            action="store_true",
+            help="Leave expired sessions alone",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        pause = options["pause"]
+
+        reclaimed = CartReaper.reap_carts(batch_size, pause)
+        if not options["skip_sessions"]:
+            reclaimed.update(CartReaper.reap_sessions(batch_size, pause))
+
+        for label, count in sorted(reclaimed.items()):
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Reclaimed {sum(reclaimed.values())} rows")
+        )
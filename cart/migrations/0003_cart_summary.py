@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Items without a variant were never unique; fold duplicates into the
+    # oldest row before adding the constraint
+    CartItem = apps.get_model('cart', 'CartItem')
+    kept = {}
+    for item in CartItem.objects.filter(variant__isnull=True).order_by('pk'):
+        key = (item.cart_id, item.product_id)
+        if key in kept:
+            kept[key].quantity += item.quantity
+            kept[key].save(update_fields=['quantity'])
+            item.delete()
+        else:
+            kept[key] = item
+
+
+def populate_cart_summaries(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    summaries = {}
+    items = CartItem.objects.select_related('product', 'variant')
+    for item in items:
+        product = item.product
+        if item.variant_id:
+            unit_price = product.price + item.variant.price_adjustment
+        else:
+            unit_price = product.effective_price or product.price
+        count, subtotal = summaries.get(item.cart_id, (0, Decimal('0.00')))
+        summaries[item.cart_id] = (count + 1, subtotal + unit_price * item.quantity)
+
+    carts = list(Cart.objects.filter(pk__in=summaries))
+    for cart in carts:
+        cart.item_count, cart.summary_subtotal = summaries[cart.pk]
+    Cart.objects.bulk_update(carts, ['item_count', 'summary_subtotal'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_alter_cart_options_and_more'),
+        ('products', '0009_productvariant_attribute_signature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='summary_subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.RunPython(populate_cart_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('variant__isnull', True)), fields=('cart', 'product'), name='unique_cart_product_without_variant'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+def snapshot_item_prices(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    items = list(CartItem.objects.select_related('product', 'variant'))
+    for item in items:
+        product = item.product
+        if item.variant_id:
+            unit_price = product.price + item.variant.price_adjustment
+        else:
+            unit_price = product.effective_price or product.price
+        item.unit_price_cents = int((unit_price * 100).to_integral_value())
+        item.price_version = product.pricing_version
+    CartItem.objects.bulk_update(
+        items, ['unit_price_cents', 'price_version'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cart_version'),
+        ('products', '0010_product_pricing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='price_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price_cents',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(snapshot_item_prices, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 # cart/models.py
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from decimal import Decimal
 from core.models import TimestampedModel
 from products.models import Product, ProductVariant
@@ -22,10 +23,21 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized badge summary, refreshed by every cart mutation.
+    # Checkout prices the cart live through cart.pricing.
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    summary_subtotal = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    # Bumped by every mutation; cart responses use it as their ETag
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         indexes = [
             models.Index(fields=["session_key", "is_active"]),
             models.Index(fields=["user", "is_active"]),
+            # Oldest-first scans of the cart reaper
+            models.Index(fields=["is_active", "updated_at"]),
         ]
         ordering = ["-created_at"]
 
@@ -36,38 +48,87 @@ class Cart(models.Model):
             return f"Cart {self.id} (Session: {self.session_key[:8]}...)"
         return f"Cart {self.id} (No session)"
 
+    def save(self, *args, **kwargs):
+        from .services.store import CartStore
+
+        # Items are saved before their cart is touched, so start afresh
+        self.reset_pricing()
+        super().save(*args, **kwargs)
+        CartStore.put_on_commit(self)
+
+    @property
+    def pricing(self):
+        """Pricing engine for this cart, computed once per instance."""
+        if getattr(self, "_pricing", None) is None:
+            from .services.pricing import CartPricing
+
+            self._pricing = CartPricing(self)
+        return self._pricing
+
+    def reset_pricing(self):
+        """Forget computed totals after the items changed."""
+        self._pricing = None
+
+    def refresh_summary(self):
+        """
+        Recompute the denormalized item_count and summary_subtotal with one
+        aggregate and store them, with a version bump, in one UPDATE.
+        """
+        from .services.store import CartStore
+
+        self.reset_pricing()
+        pricing = self.pricing
+        self.item_count = pricing.total_items
+        self.summary_subtotal = pricing.subtotal
+        self.updated_at = timezone.now()
+        self.version = (self.version or 0) + 1
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=self.item_count,
+            summary_subtotal=self.summary_subtotal,
+            updated_at=self.updated_at,
+            version=models.F("version") + 1,
+        )
+        CartStore.put_on_commit(self)
+
+    @property
+    def etag(self):
+        """
+        Entity tag of the cart's contents, unquoted: the cart version and a
+        fingerprint of its lines and their products.
+        """
+        if self.pk is None:
+            return "cart-new"
+        return f"cart-{self.pk}-{self.version}-{self.pricing.fingerprint}"
+
     @property
     def subtotal(self):
         """Calculate cart subtotal."""
-        total = Decimal("0.00")
-        for item in self.items.all():
-            total += Decimal(str(item.total_price))
-        return total
+        return self.pricing.subtotal
 
     @property
     def tax(self):
         """Tax calculation - returns 0 for digital products."""
-        return Decimal("0.00")
+        return self.pricing.tax
 
     @property
     def shipping(self):
         """Shipping cost - returns 0 for digital products."""
-        return Decimal("0.00")
+        return self.pricing.shipping
 
     @property
     def total(self):
         """Calculate total amount (for digital products, equals subtotal)."""
-        return self.subtotal
+        return self.pricing.total
 
     @property
     def total_items(self):
         """Get total number of items in cart."""
-        return self.items.count()
+        return self.pricing.total_items
 
     @property
     def total_quantity(self):
         """Get total quantity of all items."""
-        return sum(item.quantity for item in self.items.all())
+        return self.pricing.total_quantity
 
     @property
     def has_physical_items(self):
@@ -77,36 +138,24 @@ class Cart(models.Model):
     @property
     def has_digital_items(self):
         """Check if cart has digital items."""
-        return self.items.exists()
+        return self.pricing.has_items
 
     def clear(self):
         """Clear all items from the cart."""
         self.items.all().delete()
+        self.refresh_summary()
 
     def merge_with(self, other_cart):
         """
-        Merge another cart into this one.
+        Merge another cart into this one and deactivate it.
         Used when anonymous user logs in.
         """
+        from .services.cart import CartOperations
+
         if not other_cart or other_cart.id == self.id:
             return
 
-        for item in other_cart.items.all():
-            try:
-                # Check if product already exists in this cart
-                existing_item = self.items.get(
-                    product=item.product, variant=item.variant
-                )
-                existing_item.quantity += item.quantity
-                existing_item.save()
-            except CartItem.DoesNotExist:
-                # Move item to this cart
-                item.cart = self
-                item.save()
-
-        # Deactivate the other cart
-        other_cart.is_active = False
-        other_cart.save()
+        CartOperations.merge_carts(self, other_cart)
 
 
 class CartItem(TimestampedModel):
@@ -118,11 +167,26 @@ class CartItem(TimestampedModel):
         ProductVariant, on_delete=models.CASCADE, null=True, blank=True
     )
     quantity = models.PositiveIntegerField(default=1)
+    # Unit price in cents as of when the line was added, and the product
+    # pricing_version it was taken at. Revalidated in one query at checkout.
+    unit_price_cents = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    price_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Cart Item"
         verbose_name_plural = "Cart Items"
         unique_together = ("cart", "product", "variant")
+        constraints = [
+            # NULL variants never conflict in unique_together, so items
+            # without a variant need their own key for upserts
+            models.UniqueConstraint(
+                fields=["cart", "product"],
+                condition=models.Q(variant__isnull=True),
+                name="unique_cart_product_without_variant",
+            ),
+        ]
         indexes = [
             models.Index(fields=["cart", "product"]),
         ]
@@ -132,9 +196,25 @@ class CartItem(TimestampedModel):
             return f"{self.quantity} x {self.product.name} ({self.variant})"
         return f"{self.quantity} x {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        if self.unit_price_cents is None:
+            self.snapshot_price()
+        super().save(*args, **kwargs)
+
+    def snapshot_price(self):
+        """Store the live unit price and the product's pricing version."""
+        from .services.pricing import to_cents
+
+        self.unit_price_cents = None
+        self.unit_price_cents = to_cents(self.unit_price)
+        self.price_version = self.product.pricing_version
+
     @property
     def unit_price(self):
         """Get the unit price of the item."""
+        # Price snapshot taken when the item was added
+        if self.unit_price_cents is not None:
+            return Decimal(self.unit_price_cents).scaleb(-2)
         if self.variant and self.variant.price:
             return self.variant.price
         return self.product.current_price or self.product.price
@@ -44,8 +44,69 @@ class CartItemSerializer(serializers.ModelSerializer):
         return value
 
 
+class CartBatchOperationSerializer(serializers.Serializer):
+    """One add, update or remove operation of a batch cart mutation."""
+
+    op = serializers.ChoiceField(choices=["add", "update", "remove"])
+    product_id = serializers.IntegerField(required=False)
+    variant_id = serializers.IntegerField(required=False, allow_null=True)
+    item_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(required=False, default=1, min_value=0)
+
+    def validate(self, attrs):
+        if attrs["op"] == "add":
+            if "product_id" not in attrs:
+                raise serializers.ValidationError(
+                    {"product_id": "This field is required."}
+                )
+            if attrs["quantity"] < 1:
+                raise serializers.ValidationError(
+                    {"quantity": "Quantity must be at least 1"}
+                )
+        elif "item_id" not in attrs:
+            raise serializers.ValidationError({"item_id": "This field is required."})
+        return attrs
+
+
+class CartLineSerializer(CartItemSerializer):
+    """A cart line with product and variant ids instead of nested objects."""
+
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
+    variant = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class CompactCartSerializer(serializers.Serializer):
+    """
+    Compact mutation response: the changed line, if any, and the new
+    totals. The full cart is only re-fetched when the version moves on.
+    """
+
+    id = serializers.IntegerField(read_only=True)
+    version = serializers.IntegerField(read_only=True)
+    subtotal = serializers.SerializerMethodField()
+    total = serializers.SerializerMethodField()
+    total_items = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+
+    def get_subtotal(self, obj):
+        """Return subtotal as a float"""
+        return float(obj.subtotal)
+
+    def get_total(self, obj):
+        """Return total as a float"""
+        return float(obj.total)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        item = self.context.get("item")
+        data["item"] = CartLineSerializer(item).data if item is not None else None
+        data["removed_item_id"] = self.context.get("removed_item_id")
+        return data
+
+
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+    # Priced items and totals all come from the cart's pricing engine
+    items = CartItemSerializer(many=True, read_only=True, source="pricing.items")
     subtotal = serializers.SerializerMethodField()
     tax = serializers.SerializerMethodField()
     shipping = serializers.SerializerMethodField()
@@ -63,6 +124,7 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = [
             "id",
+            "version",
             "items",
             "subtotal",
             "tax",
@@ -78,6 +140,7 @@ class CartSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             "id",
+            "version",
             "created_at",
             "token",
             "has_digital_items",
@@ -104,7 +167,7 @@ class CartSerializer(serializers.ModelSerializer):
 
     def get_has_digital_items(self, obj):
         """Always True for digital-only system"""
-        return obj.items.exists()
+        return obj.has_digital_items
 
     def get_has_physical_items(self, obj):
         """Always False for digital-only system"""
@@ -116,4 +179,4 @@ class CartSerializer(serializers.ModelSerializer):
 
     def get_is_digital_only(self, obj):
         """Always True for digital-only system"""
-        return obj.items.exists()
+        return obj.has_digital_items
@@ -1,5 +1,12 @@
 # cart/services/cart.py
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from ..models import Cart, CartItem
+from .store import CartStore
 
 class CartOperations:
     """
@@ -8,10 +15,27 @@ class CartOperations:
     calculating discounts, applying coupons, etc.
     """
     
+    @staticmethod
+    def _matching_items(cart):
+        """
+        Items of a cart with the same product and variant as the outer
+        cart item. A NULL variant matches a NULL variant.
+        """
+        return CartItem.objects.annotate(
+            variant_key=Coalesce('variant_id', Value(0))
+        ).filter(
+            cart=cart,
+            product_id=OuterRef('product_id'),
+            variant_key=Coalesce(OuterRef('variant_id'), Value(0)),
+        )
+    
     @staticmethod
     def merge_carts(user_cart, session_cart):
         """
-        Merge a session cart into a user cart.
+        Merge a session cart into a user cart with a fixed number of
+        queries, whatever the size of either cart: one UPDATE adds the
+        quantities of items both carts hold, one UPDATE moves the rest of
+        the session items over, and one UPDATE deactivates the session cart.
         
         Args:
             user_cart: The destination cart (authenticated user)
@@ -22,26 +46,252 @@ class CartOperations:
         """
         if not user_cart or not session_cart:
             return user_cart or session_cart
+        if user_cart.pk == session_cart.pk:
+            return user_cart
+        
+        now = timezone.now()
+        with CartOperations.mutation(user_cart):
+            source = CartOperations._matching_items(session_cart)
+            CartItem.objects.filter(cart=user_cart).filter(Exists(source)).update(
+                quantity=F('quantity') + Subquery(source.values('quantity')[:1]),
+                updated_at=now,
+            )
+            CartItem.objects.filter(cart=session_cart).exclude(
+                Exists(CartOperations._matching_items(user_cart))
+            ).update(cart=user_cart, updated_at=now)
+            Cart.objects.filter(pk=session_cart.pk).update(
+                is_active=False, updated_at=now
+            )
+            CartStore.invalidate_on_commit(session_cart.pk)
+        
+        session_cart.is_active = False
+        session_cart.updated_at = now
+        session_cart.reset_pricing()
+        return user_cart
+    
+    @staticmethod
+    @contextmanager
+    def mutation(cart):
+        """
+        Run a cart mutation atomically. The cart row is locked so concurrent
+        mutations of the same cart serialize, and new price snapshots, the
+        denormalized summary and the version are written before the
+        transaction commits.
+        
+        Args:
+            cart: The cart being changed
+        """
+        with transaction.atomic():
+            # Locking read of the version keeps the bump below exact
+            cart.version = Cart.objects.select_for_update().filter(
+                pk=cart.pk
+            ).values_list('version', flat=True).first()
+            yield cart
+            # Snapshot the price of lines added or topped up
+            cart.pricing.revalidate(missing_only=True)
+            cart.refresh_summary()
+    
+    @staticmethod
+    def _upsert_sql(variant_id, rows=1):
+        """
+        INSERT ... ON CONFLICT statement adding to the quantity of existing
+        items, for rows that all have or all lack a variant. Price snapshots
+        of topped-up items are dropped for the mutation to take afresh.
+        """
+        table = connection.ops.quote_name(CartItem._meta.db_table)
+        if variant_id is None:
+            target = '(cart_id, product_id) WHERE variant_id IS NULL'
+        else:
+            target = '(cart_id, product_id, variant_id)'
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * rows)
+        return f"""
+            INSERT INTO {table}
+                (cart_id, product_id, variant_id, quantity, created_at, updated_at)
+            VALUES {values}
+            ON CONFLICT {target} DO UPDATE SET
+                quantity = {table}.quantity + excluded.quantity,
+                updated_at = excluded.updated_at,
+                unit_price_cents = NULL,
+                price_version = NULL
+            """
+    
+    @staticmethod
+    def _upsert_item(cart, product_id, variant_id, quantity):
+        """
+        Insert an item or add to its quantity in one statement.
+        
+        Returns:
+            int: The cart item id
+        """
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            return CartOperations._update_or_create_item(
+                cart, product_id, variant_id, quantity
+            )
+        
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                CartOperations._upsert_sql(variant_id) + 'RETURNING id',
+                [cart.pk, product_id, variant_id, quantity, now, now],
+            )
+            return cursor.fetchone()[0]
+    
+    @staticmethod
+    def _bulk_upsert_items(cart, quantities):
+        """
+        Upsert many items with at most two statements, one for items
+        without a variant and one for items with one.
+        
+        Args:
+            cart: The cart
+            quantities (dict): Quantity to add per (product_id, variant_id)
+        """
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            for (product_id, variant_id), quantity in quantities.items():
+                CartOperations._update_or_create_item(
+                    cart, product_id, variant_id, quantity
+                )
+            return
+        
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        groups = {}
+        for (product_id, variant_id), quantity in quantities.items():
+            groups.setdefault(variant_id is None, []).append(
+                [cart.pk, product_id, variant_id, quantity, now, now]
+            )
+        with connection.cursor() as cursor:
+            for rows in groups.values():
+                cursor.execute(
+                    CartOperations._upsert_sql(rows[0][2], len(rows)),
+                    [value for row in rows for value in row],
+                )
+    
+    @staticmethod
+    def _update_or_create_item(cart, product_id, variant_id, quantity):
+        # Portable fallback: atomic increment, insert when missing
+        items = CartItem.objects.filter(
+            cart=cart, product_id=product_id, variant_id=variant_id
+        )
+        changes = {
+            'quantity': F('quantity') + quantity,
+            'updated_at': timezone.now(),
+            'unit_price_cents': None,
+            'price_version': None,
+        }
+        if items.update(**changes):
+            return items.values_list('pk', flat=True).get()
+        try:
+            with transaction.atomic():
+                return CartItem.objects.create(
+                    cart=cart, product_id=product_id, variant_id=variant_id,
+                    quantity=quantity
+                ).pk
+        except IntegrityError:
+            items.update(**changes)
+            return items.values_list('pk', flat=True).get()
+    
+    @staticmethod
+    def add_item(cart, product, quantity=1, variant=None):
+        """
+        Add a quantity of a product to the cart with one atomic upsert.
+        
+        Args:
+            cart: The cart
+            product: The product to add
+            quantity (int): Quantity to add
+            variant (optional): The product variant
+            
+        Returns:
+            int: The id of the cart item
+        """
+        variant_id = variant.pk if variant else None
+        with CartOperations.mutation(cart):
+            return CartOperations._upsert_item(cart, product.pk, variant_id, quantity)
+    
+    @staticmethod
+    def set_quantity(cart, item_id, quantity):
+        """
+        Set the quantity of a cart item, removing it when quantity is 0.
+        
+        Args:
+            cart: The cart
+            item_id (int): Cart item id
+            quantity (int): New quantity
+            
+        Returns:
+            bool: False if the item is not in the cart
+        """
+        if cart.pk is None:
+            return False
+        with CartOperations.mutation(cart):
+            items = CartItem.objects.filter(cart=cart, pk=item_id)
+            if quantity > 0:
+                return bool(items.update(quantity=quantity, updated_at=timezone.now()))
+            return bool(items.delete()[0])
+    
+    @staticmethod
+    def remove_item(cart, item_id):
+        """
+        Remove an item from the cart.
+        
+        Args:
+            cart: The cart
+            item_id (int): Cart item id
+            
+        Returns:
+            bool: False if the item is not in the cart
+        """
+        if cart.pk is None:
+            return False
+        with CartOperations.mutation(cart):
+            return bool(CartItem.objects.filter(cart=cart, pk=item_id).delete()[0])
+    
+    @staticmethod
+    def clear(cart):
+        """
+        Remove every item from the cart.
+        
+        Args:
+            cart: The cart
+        """
+        if cart.pk is None:
+            return
+        with CartOperations.mutation(cart):
+            CartItem.objects.filter(cart=cart).delete()
+    
+    @staticmethod
+    def apply_batch(cart, adds=None, quantities=None, removals=None):
+        """
+        Apply many changes in one transaction with set-based statements:
+        bulk upserts for the additions, one UPDATE for the new quantities
+        and one DELETE for the removals, in that order. A quantity of 0
+        removes the item.
+        
+        Args:
+            cart: The cart
+            adds (dict, optional): Quantity to add per (product_id, variant_id)
+            quantities (dict, optional): New quantity per cart item id
+            removals (iterable, optional): Ids of cart items to remove
+        """
+        adds = adds or {}
+        quantities = dict(quantities or {})
+        removals = set(removals or ())
+        removals.update(pk for pk, quantity in quantities.items() if quantity <= 0)
+        quantities = {
+            pk: quantity for pk, quantity in quantities.items() if pk not in removals
+        }
         
-        # Copy items from session cart to user cart
-        for item in session_cart.items.all():
-            try:
-                # Try to find matching item in user cart
-                user_item = CartItem.objects.get(
-                    cart=user_cart,
-                    product=item.product,
-                    variant=item.variant
+        with CartOperations.mutation(cart):
+            if adds:
+                CartOperations._bulk_upsert_items(cart, adds)
+            if quantities:
+                CartItem.objects.filter(cart=cart, pk__in=quantities).update(
+                    quantity=Case(
+                        *[When(pk=pk, then=Value(q)) for pk, q in quantities.items()],
+                        default=F('quantity'),
+                        output_field=CartItem._meta.get_field('quantity'),
+                    ),
+                    updated_at=timezone.now(),
                 )
-                # Update quantity
-                user_item.quantity += item.quantity
-                user_item.save()
-            except CartItem.DoesNotExist:
-                # Create new item in user cart
-                item.pk = None  # Reset primary key to create a new record
-                item.cart = user_cart
-                item.save()
-        
-        # Delete the session cart
-        session_cart.delete()
-        
-        return user_cart
\ No newline at end of file
+            if removals:
+                CartItem.objects.filter(cart=cart, pk__in=removals).delete()
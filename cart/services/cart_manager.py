@@ -11,36 +11,32 @@ class CartService:
     def get_cart_data(request, cart_token=None):
         """
         Get cart data using Django sessions.
-        """
-        # Ensure session exists
-        if not request.session.session_key:
-            request.session.create()
 
+        Visitors without a cart get an unsaved, empty cart, so read-only
+        browsing writes neither a session nor a cart row.
+        """
         session_key = request.session.session_key
+        user = request.user if request.user.is_authenticated else None
 
-        # Get or create cart for this session
-        cart, created = Cart.objects.get_or_create(
-            session_key=session_key,
-            is_active=True,
-            defaults={"user": request.user if request.user.is_authenticated else None},
-        )
+        cart = None
+        if session_key:
+            cart = Cart.objects.filter(session_key=session_key, is_active=True).first()
 
-        # If user is authenticated and cart has no user, assign it
-        if request.user.is_authenticated and not cart.user:
-            cart.user = request.user
+        if cart is None:
+            cart = Cart(session_key=session_key, user=user)
+        elif user and not cart.user:
+            # If user is authenticated and cart has no user, assign it
+            cart.user = user
             cart.save(update_fields=["user"])
 
-        # Get cart items
-        items = cart.items.select_related("product", "variant").all()
-
-        # Calculate subtotal safely
-        subtotal = float(cart.subtotal) if cart.subtotal else 0.0
+        # Priced items and totals from the cart's pricing engine
+        pricing = cart.pricing
 
         return {
             "cart": cart,
-            "items": items,
-            "subtotal": subtotal,
-            "item_count": cart.total_items,
+            "items": pricing.items,
+            "subtotal": float(pricing.subtotal),
+            "item_count": pricing.total_items,
             "cart_token": session_key,  # Use session_key as token for compatibility
             # Digital-only flags
             "has_digital_items": True,
@@ -0,0 +1,224 @@
+# cart/services/pricing.py
+import hashlib
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def unit_price_expression():
+    """
+    Database expression for a cart item's live unit price, matching
+    CartItem.unit_price without a snapshot: the variant price when there
+    is one, otherwise the product's effective (sale-aware) price.
+
+    Returns:
+        Case: The unit price expression
+    """
+    return Case(
+        When(
+            variant__isnull=False,
+            then=F("product__price") + F("variant__price_adjustment"),
+        ),
+        # A zero sale price falls back to the regular price
+        When(product__effective_price=0, then=F("product__price")),
+        default=F("product__effective_price"),
+        output_field=MONEY,
+    )
+
+
+def to_cents(amount):
+    """Convert a Decimal amount to integer cents."""
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+class CartPricing:
+    """
+    Pricing engine for one cart. Lines carry an integer price snapshot, so
+    every total comes from a single aggregate over stored integers, or from
+    the items when they were loaded anyway, and is computed once per
+    instance. revalidate() brings stale snapshots up to date.
+    """
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    def _items(self):
+        return self.cart.items.select_related(
+            "product", "product__category", "variant", "variant__product"
+        )
+
+    @cached_property
+    def items(self):
+        """
+        Cart items with their product and variant, in one query plus
+        prefetches.
+        """
+        if self.cart.pk is None:
+            return []
+        return list(
+            self._items()
+            .prefetch_related("product__images", "product__variants")
+            .order_by("id")
+        )
+
+    def get_item(self, item_id):
+        """
+        One cart item, without the product's images and variants.
+
+        Args:
+            item_id (int): Cart item id
+
+        Returns:
+            CartItem: The item, or None if it is not in the cart
+        """
+        if self.cart.pk is None:
+            return None
+        return self._items().filter(pk=item_id).first()
+
+    def revalidate(self, missing_only=False):
+        """
+        Bring price snapshots up to date. One query finds the lines whose
+        product pricing_version moved on since the snapshot, priced live
+        in the database; only those lines are rewritten.
+
+        Args:
+            missing_only (bool): Only snapshot lines that have none yet
+
+        Returns:
+            list: Ids of items whose unit price changed
+        """
+        from cart.models import CartItem
+
+        if self.cart.pk is None:
+            return []
+
+        stale = Q(price_version__isnull=True) | Q(unit_price_cents__isnull=True)
+        if not missing_only:
+            stale |= ~Q(price_version=F("product__pricing_version"))
+        rows = (
+            self.cart.items.filter(stale)
+            .annotate(live_price=unit_price_expression())
+            .values_list(
+                "pk", "unit_price_cents", "live_price", "product__pricing_version"
+            )
+        )
+
+        items = []
+        changed = []
+        for pk, cents, live_price, version in rows:
+            live_cents = to_cents(live_price)
+            if cents is not None and cents != live_cents:
+                changed.append(pk)
+            items.append(
+                CartItem(pk=pk, unit_price_cents=live_cents, price_version=version)
+            )
+        if items:
+            CartItem.objects.bulk_update(items, ["unit_price_cents", "price_version"])
+            self.cart.reset_pricing()
+        return changed
+
+    @cached_property
+    def totals(self):
+        if "items" in self.__dict__:
+            items = self.items
+            return {
+                "subtotal_cents": sum(
+                    (item.unit_price_cents or 0) * item.quantity for item in items
+                ),
+                "total_items": len(items),
+                "total_quantity": sum(item.quantity for item in items),
+            }
+
+        if self.cart.pk is None:
+            totals = {}
+        else:
+            totals = self.cart.items.aggregate(
+                subtotal_cents=Sum(F("unit_price_cents") * F("quantity")),
+                total_items=Count("id"),
+                total_quantity=Coalesce(Sum("quantity"), 0),
+            )
+        return {
+            "subtotal_cents": totals.get("subtotal_cents") or 0,
+            "total_items": totals.get("total_items") or 0,
+            "total_quantity": totals.get("total_quantity") or 0,
+        }
+
+    @cached_property
+    def fingerprint(self):
+        """
+        Digest of the lines and of the products shown in them, so it
+        changes with any line, however it was written, and with any change
+        to a line's product. One query unless the items are loaded.
+        """
+        if "items" in self.__dict__:
+            rows = [
+                (
+                    item.pk,
+                    item.quantity,
+                    item.variant_id,
+                    item.unit_price_cents,
+                    item.product.pricing_version,
+                    item.product.updated_at,
+                )
+                for item in self.items
+            ]
+        elif self.cart.pk is None:
+            rows = []
+        else:
+            rows = self.cart.items.order_by("id").values_list(
+                "id",
+                "quantity",
+                "variant_id",
+                "unit_price_cents",
+                "product__pricing_version",
+                "product__updated_at",
+            )
+        digest = hashlib.md5()
+        for row in rows:
+            digest.update(
+                repr(row[:-1] + (row[-1].timestamp() if row[-1] else 0,)).encode()
+            )
+        return digest.hexdigest()[:12]
+
+    @property
+    def subtotal_cents(self):
+        return self.totals["subtotal_cents"]
+
+    @property
+    def total_cents(self):
+        """Amount to charge in cents - no tax or shipping on digital products."""
+        return self.subtotal_cents
+
+    @property
+    def subtotal(self):
+        return Decimal(self.subtotal_cents).scaleb(-2)
+
+    @property
+    def tax(self):
+        """Tax calculation - returns 0 for digital products."""
+        return Decimal("0.00")
+
+    @property
+    def shipping(self):
+        """Shipping cost - returns 0 for digital products."""
+        return Decimal("0.00")
+
+    @property
+    def total(self):
+        return self.subtotal + self.tax + self.shipping
+
+    @property
+    def total_items(self):
+        return self.totals["total_items"]
+
+    @property
+    def total_quantity(self):
+        return self.totals["total_quantity"]
+
+    @property
+    def has_items(self):
+        return self.total_items > 0
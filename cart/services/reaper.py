@@ -0,0 +1,139 @@
+# cart/services/reaper.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from ..models import Cart
+from .store import CartStore
+
+class CartReaper:
+    """
+    Deletes carts nobody can reach any more, with their items, and expired
+    database sessions. Rows are removed oldest first in small batches, each
+    its own short statement, with a pause in between so the cart and
+    session tables are never locked for long.
+    """
+    
+    BATCH_SIZE = 500
+    PAUSE = 0.1
+    # Merged or replaced carts are kept briefly for support lookups
+    INACTIVE_AGE = timedelta(days=1)
+    # Sessions are extended by requests that do not touch the cart
+    ABANDONED_MARGIN = timedelta(days=1)
+    DB_SESSION_ENGINES = (
+        'django.contrib.sessions.backends.db',
+        'django.contrib.sessions.backends.cached_db',
+    )
+    
+    @staticmethod
+    def abandoned_age():
+        """
+        Age after which an untouched cart can no longer be reached through
+        its session cookie. A session outlives the cart's last change when
+        later requests save it, hence the margin.
+        """
+        return (
+            timedelta(seconds=settings.SESSION_COOKIE_AGE)
+            + CartReaper.ABANDONED_MARGIN
+        )
+    
+    @staticmethod
+    def stale_carts(now=None):
+        """
+        Get the carts that can be deleted: inactive carts past
+        INACTIVE_AGE, and active carts untouched for longer than a session
+        lives that are anonymous or empty. With database sessions an
+        anonymous cart is only deleted once its session has expired too.
+        Non-empty user carts are kept, since their owner gets them back on
+        the next login.
+        
+        Args:
+            now (datetime, optional): Reference time
+            
+        Returns:
+            QuerySet: Stale carts
+        """
+        now = now or timezone.now()
+        abandoned = Q(
+            is_active=True,
+            updated_at__lt=now - CartReaper.abandoned_age(),
+        ) & (Q(user__isnull=True) | Q(item_count=0))
+        if settings.SESSION_ENGINE in CartReaper.DB_SESSION_ENGINES:
+            from django.contrib.sessions.models import Session
+            
+            abandoned &= ~Exists(
+                Session.objects.filter(
+                    session_key=OuterRef('session_key'), expire_date__gte=now
+                )
+            )
+        inactive = Q(is_active=False, updated_at__lt=now - CartReaper.INACTIVE_AGE)
+        return Cart.objects.filter(abandoned | inactive)
+    
+    @staticmethod
+    def _reap(queryset, order_by, batch_size, pause, on_delete=None):
+        # Rows are deleted as we go, so every batch starts from the oldest
+        reclaimed = {}
+        while True:
+            ids = list(
+                queryset.order_by(*order_by).values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return reclaimed
+            _, counts = queryset.model.objects.filter(pk__in=ids).delete()
+            if on_delete is not None:
+                on_delete(*ids)
+            for label, count in counts.items():
+                reclaimed[label] = reclaimed.get(label, 0) + count
+            if len(ids) < batch_size:
+                return reclaimed
+            if pause:
+                time.sleep(pause)
+    
+    @staticmethod
+    def reap_carts(batch_size=None, pause=None, now=None):
+        """
+        Delete stale carts and their items in batches keyed by updated_at.
+        
+        Args:
+            batch_size (int, optional): Carts per batch
+            pause (float, optional): Seconds to sleep between batches
+            now (datetime, optional): Reference time
+            
+        Returns:
+            dict: Rows deleted per model label
+        """
+        return CartReaper._reap(
+            CartReaper.stale_carts(now),
+            ('updated_at', 'pk'),
+            batch_size or CartReaper.BATCH_SIZE,
+            CartReaper.PAUSE if pause is None else pause,
+            on_delete=CartStore.invalidate,
+        )
+    
+    @staticmethod
+    def reap_sessions(batch_size=None, pause=None, now=None):
+        """
+        Delete expired sessions in batches keyed by expire_date. Only
+        database-backed session engines keep rows to delete.
+        
+        Args:
+            batch_size (int, optional): Sessions per batch
+            pause (float, optional): Seconds to sleep between batches
+            now (datetime, optional): Reference time
+            
+        Returns:
+            dict: Rows deleted per model label
+        """
+        if settings.SESSION_ENGINE not in CartReaper.DB_SESSION_ENGINES:
+            return {}
+        
+        from django.contrib.sessions.models import Session
+        
+        return CartReaper._reap(
+            Session.objects.filter(expire_date__lt=now or timezone.now()),
+            ('expire_date',),
+            batch_size or CartReaper.BATCH_SIZE,
+            CartReaper.PAUSE if pause is None else pause,
+        )
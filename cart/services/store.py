@@ -0,0 +1,131 @@
+# cart/services/store.py
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from ..models import Cart
+
+class CartStore:
+    """
+    Optional cache in front of the cart tables, enabled by naming a cache
+    alias in settings.CART_STORE_CACHE. Active cart rows and their
+    serialized representation are read from the cache; the database stays
+    the source of truth and is written only by real cart changes, which
+    write through to the cache once they commit. Without the setting every
+    method is a no-op and carts are read from the database.
+    """
+
+    CACHE_KEY = 'cart:store:{}'
+    DATA_KEY = 'cart:store:data:{}'
+    CACHE_TIMEOUT = 60 * 60
+    FIELDS = (
+        'id', 'user_id', 'session_key', 'is_active', 'created_at', 'updated_at',
+        'item_count', 'summary_subtotal', 'version',
+    )
+
+    @staticmethod
+    def get_cache():
+        alias = getattr(settings, 'CART_STORE_CACHE', None)
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def get(cart_id):
+        """
+        Get an active cart by id, from the cache when possible.
+
+        Args:
+            cart_id (int): Cart id
+
+        Returns:
+            Cart: The cart, or None if it is not active
+        """
+        cache = CartStore.get_cache()
+        if cache is not None:
+            values = cache.get(CartStore.CACHE_KEY.format(cart_id))
+            if values is not None:
+                # from_db expects values in concrete field order
+                names = [
+                    field.attname for field in Cart._meta.concrete_fields
+                    if field.attname in values
+                ]
+                return Cart.from_db(
+                    'default', names, [values[name] for name in names]
+                )
+
+        cart = Cart.objects.filter(pk=cart_id, is_active=True).first()
+        if cart is not None:
+            CartStore.put(cart)
+        return cart
+
+    @staticmethod
+    def put(cart):
+        """
+        Store an active cart row, or drop an inactive one.
+
+        Args:
+            cart (Cart): A fully loaded cart
+        """
+        cache = CartStore.get_cache()
+        if cache is None or cart.pk is None:
+            return
+        if not cart.is_active:
+            CartStore.invalidate(cart.pk)
+            return
+        cache.set(
+            CartStore.CACHE_KEY.format(cart.pk),
+            {field: getattr(cart, field) for field in CartStore.FIELDS},
+            CartStore.CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def put_on_commit(cart):
+        """
+        Write a cart through to the cache once the current transaction
+        commits, so a rolled back change is never cached.
+
+        Args:
+            cart (Cart): The changed cart
+        """
+        if CartStore.get_cache() is not None:
+            transaction.on_commit(lambda: CartStore.put(cart))
+
+    @staticmethod
+    def invalidate(*cart_ids):
+        """
+        Drop cached cart rows.
+
+        Args:
+            *cart_ids (int): Ids of carts that changed or were deleted
+        """
+        cache = CartStore.get_cache()
+        if cache is not None and cart_ids:
+            cache.delete_many([CartStore.CACHE_KEY.format(pk) for pk in cart_ids])
+
+    @staticmethod
+    def invalidate_on_commit(*cart_ids):
+        if CartStore.get_cache() is not None:
+            transaction.on_commit(lambda: CartStore.invalidate(*cart_ids))
+
+    @staticmethod
+    def get_representation(cart, serialize):
+        """
+        Get the serialized cart for its current contents, serializing on a
+        miss. Entries are keyed by the cart's ETag, which covers the
+        pricing_version and updated_at of every line's product, so neither
+        a changed cart nor a changed product reads a stale entry.
+
+        Args:
+            cart (Cart): The cart
+            serialize (callable): Builds the representation of the cart
+
+        Returns:
+            dict: The representation
+        """
+        cache = CartStore.get_cache()
+        if cache is None or cart.pk is None:
+            return serialize(cart)
+        key = CartStore.DATA_KEY.format(cart.etag)
+        data = cache.get(key)
+        if data is None:
+            data = serialize(cart)
+            cache.set(key, data, CartStore.CACHE_TIMEOUT)
+        return data
@@ -1,3 +1,394 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Category, Product, ProductVariant
+
+from .models import Cart, CartItem
+from .services.cart import CartOperations
+from .services.reaper import CartReaper
+
+
+class CartOperationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.ebook = Product.objects.create(
+            name="Ebook", category=category, price=Decimal("10.00")
+        )
+        cls.course = Product.objects.create(
+            name="Course", category=category, price=Decimal("25.00")
+        )
+        cls.template = Product.objects.create(
+            name="Template", category=category, price=Decimal("5.00")
+        )
+        cls.pdf = ProductVariant.objects.create(
+            product=cls.ebook, name="PDF", sku="EBOOK-PDF"
+        )
+        cls.epub = ProductVariant.objects.create(
+            product=cls.ebook,
+            name="EPUB",
+            sku="EBOOK-EPUB",
+            price_adjustment=Decimal("2.00"),
+        )
+
+    def setUp(self):
+        self.cart = Cart.objects.create(session_key="session-a")
+
+    def test_add_item_without_variant_upserts_one_line(self):
+        first = CartOperations.add_item(self.cart, self.course, 1)
+        second = CartOperations.add_item(self.cart, self.course, 2)
+
+        self.assertEqual(first, second)
+        item = CartItem.objects.get(cart=self.cart)
+        self.assertIsNone(item.variant_id)
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(item.unit_price_cents, 2500)
+
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, 1)
+        self.assertEqual(self.cart.summary_subtotal, Decimal("75.00"))
+        self.assertEqual(self.cart.version, 2)
+
+    def test_add_item_with_variant_upserts_per_variant(self):
+        pdf = CartOperations.add_item(self.cart, self.ebook, 1, self.pdf)
+        self.assertEqual(
+            CartOperations.add_item(self.cart, self.ebook, 1, self.pdf), pdf
+        )
+        epub = CartOperations.add_item(self.cart, self.ebook, 1, self.epub)
+        plain = CartOperations.add_item(self.cart, self.ebook, 1)
+
+        self.assertEqual(len({pdf, epub, plain}), 3)
+        quantities = dict(
+            CartItem.objects.filter(cart=self.cart).values_list(
+                "variant_id", "quantity"
+            )
+        )
+        self.assertEqual(quantities, {self.pdf.pk: 2, self.epub.pk: 1, None: 1})
+        self.assertEqual(CartItem.objects.get(pk=epub).unit_price_cents, 1200)
+
+    def test_merge_carts_adds_shared_lines_and_moves_the_rest(self):
+        user = get_user_model().objects.create_user(
+            username="shopper", email="shopper@example.com", password="secret"
+        )
+        user_cart = Cart.objects.create(user=user)
+        CartOperations.add_item(user_cart, self.ebook, 1, self.pdf)
+        CartOperations.add_item(user_cart, self.course, 1)
+        CartOperations.add_item(self.cart, self.ebook, 2, self.pdf)
+        CartOperations.add_item(self.cart, self.ebook, 1)
+        CartOperations.add_item(self.cart, self.template, 4)
+
+        merged = CartOperations.merge_carts(user_cart, self.cart)
+
+        self.assertEqual(merged, user_cart)
+        quantities = {
+            (product_id, variant_id): quantity
+            for product_id, variant_id, quantity in CartItem.objects.filter(
+                cart=user_cart
+            ).values_list("product_id", "variant_id", "quantity")
+        }
+        self.assertEqual(
+            quantities,
+            {
+                (self.ebook.pk, self.pdf.pk): 3,
+                (self.ebook.pk, None): 1,
+                (self.course.pk, None): 1,
+                (self.template.pk, None): 4,
+            },
+        )
+        self.cart.refresh_from_db()
+        self.assertFalse(self.cart.is_active)
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.item_count, 4)
+        self.assertEqual(user_cart.summary_subtotal, Decimal("85.00"))
+
+    def test_merge_carts_with_itself_is_a_no_op(self):
+        CartOperations.add_item(self.cart, self.course, 1)
+
+        self.assertEqual(CartOperations.merge_carts(self.cart, self.cart), self.cart)
+        self.assertTrue(Cart.objects.get(pk=self.cart.pk).is_active)
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 1)
+
+
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db")
+class CartReaperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.ebook = Product.objects.create(
+            name="Ebook", category=category, price=Decimal("10.00")
+        )
+        cls.user = get_user_model().objects.create_user(
+            username="shopper", email="shopper@example.com", password="secret"
+        )
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.abandoned = self.now - CartReaper.abandoned_age() - timedelta(hours=1)
+
+    def make_cart(self, updated_at, items=1, **kwargs):
+        cart = Cart.objects.create(**kwargs)
+        if items:
+            CartOperations.add_item(cart, self.ebook, items)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=updated_at)
+        return cart
+
+    def make_session(self, key, expire_date):
+        Session.objects.create(
+            session_key=key, session_data="", expire_date=expire_date
+        )
+
+    def test_only_unreachable_carts_are_reaped(self):
+        reaped = [
+            self.make_cart(self.abandoned, session_key="gone"),
+            self.make_cart(self.abandoned, session_key="expired"),
+            self.make_cart(self.abandoned, items=0, user=self.user),
+            self.make_cart(
+                self.now - timedelta(days=2), session_key="merged", is_active=False
+            ),
+        ]
+        kept = [
+            self.make_cart(self.abandoned, session_key="live"),
+            self.make_cart(self.abandoned, user=self.user),
+            self.make_cart(self.now, session_key="recent"),
+            self.make_cart(self.now, session_key="replaced", is_active=False),
+        ]
+        self.make_session("expired", self.now - timedelta(minutes=1))
+        self.make_session("live", self.now + timedelta(days=1))
+
+        reclaimed = CartReaper.reap_carts(pause=0, now=self.now)
+
+        self.assertEqual(reclaimed, {"cart.Cart": 4, "cart.CartItem": 3})
+        self.assertEqual(
+            set(Cart.objects.values_list("pk", flat=True)), {c.pk for c in kept}
+        )
+        self.assertFalse(Cart.objects.filter(pk__in=[c.pk for c in reaped]).exists())
+
+    def test_carts_are_reaped_oldest_first_in_batches(self):
+        carts = [
+            self.make_cart(self.abandoned - timedelta(minutes=i), session_key=f"s{i}")
+            for i in range(5)
+        ]
+
+        with mock.patch.object(
+            Cart.objects, "filter", wraps=Cart.objects.filter
+        ) as delete_filter, mock.patch("cart.services.reaper.time.sleep") as sleep:
+            reclaimed = CartReaper.reap_carts(batch_size=2, pause=0.5, now=self.now)
+
+        self.assertEqual(reclaimed, {"cart.Cart": 5, "cart.CartItem": 5})
+        batches = [
+            list(call.kwargs["pk__in"])
+            for call in delete_filter.call_args_list
+            if "pk__in" in call.kwargs
+        ]
+        oldest_first = [cart.pk for cart in reversed(carts)]
+        self.assertEqual(
+            batches, [oldest_first[:2], oldest_first[2:4], oldest_first[4:]]
+        )
+        self.assertEqual(sleep.call_args_list, [mock.call(0.5)] * 2)
+
+    def test_expired_sessions_are_reaped(self):
+        self.make_session("expired", self.now - timedelta(minutes=1))
+        self.make_session("live", self.now + timedelta(minutes=1))
+
+        reclaimed = CartReaper.reap_sessions(pause=0, now=self.now)
+
+        self.assertEqual(reclaimed, {"sessions.Session": 1})
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)), ["live"]
+        )
+
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cache"):
+            self.assertEqual(CartReaper.reap_sessions(now=self.now), {})
+
+
+class CartApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.ebook = Product.objects.create(
+            name="Ebook", category=category, price=Decimal("10.00")
+        )
+        cls.course = Product.objects.create(
+            name="Course", category=category, price=Decimal("25.00")
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+
+    def add(self, product, quantity=1, **params):
+        return self.client.post(
+            "/api/v1/cart/add/",
+            {"product_id": product.pk, "quantity": quantity, **params},
+            format="json",
+        )
+
+
+class CartETagTests(CartApiTestCase):
+    def test_unchanged_cart_is_not_modified(self):
+        etag = self.add(self.ebook)["ETag"]
+
+        response = self.client.get("/api/v1/cart/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.data["total_items"], 1)
+
+        for header in (etag, f"W/{etag}", f'"other", {etag}'):
+            response = self.client.get("/api/v1/cart/", HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_cart_and_price_changes_move_the_etag(self):
+        first = self.add(self.ebook)["ETag"]
+        second = self.add(self.course)["ETag"]
+        self.assertNotEqual(first, second)
+
+        response = self.client.get("/api/v1/cart/", HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["subtotal"], 35.0)
+
+        self.course.price = Decimal("30.00")
+        self.course.save()
+
+        response = self.client.get("/api/v1/cart/", HTTP_IF_NONE_MATCH=second)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], second)
+
+    def test_compact_responses_carry_the_changed_line_and_totals(self):
+        self.add(self.ebook)
+        response = self.add(self.course, 2, compact=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("items", response.data)
+        self.assertEqual(response.data["subtotal"], 60.0)
+        self.assertEqual(response.data["total_items"], 2)
+        item = response.data["item"]
+        self.assertEqual((item["product"], item["quantity"]), (self.course.pk, 2))
+        self.assertIsNone(response.data["removed_item_id"])
+
+        response = self.client.post(
+            "/api/v1/cart/update_item/?compact=1",
+            {"item_id": item["id"], "quantity": 0},
+            format="json",
+        )
+        self.assertEqual(response.data["removed_item_id"], item["id"])
+        self.assertIsNone(response.data["item"])
+        self.assertEqual(response.data["subtotal"], 10.0)
+        etag = response["ETag"]
+        response = self.client.get("/api/v1/cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class CartBatchTests(CartApiTestCase):
+    def batch(self, operations):
+        return self.client.post(
+            "/api/v1/cart/batch/", {"operations": operations}, format="json"
+        )
+
+    def quantities(self):
+        return dict(CartItem.objects.values_list("product_id", "quantity"))
+
+    def test_operations_are_applied_together(self):
+        response = self.batch(
+            [
+                {"op": "add", "product_id": self.ebook.pk},
+                {"op": "add", "product_id": self.course.pk, "quantity": 2},
+                {"op": "add", "product_id": self.ebook.pk, "quantity": 2},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["subtotal"], 80.0)
+        self.assertEqual(self.quantities(), {self.ebook.pk: 3, self.course.pk: 2})
+
+        items = {item["product"]["id"]: item["id"] for item in response.data["items"]}
+        response = self.batch(
+            [
+                {"op": "update", "item_id": items[self.ebook.pk], "quantity": 1},
+                {"op": "remove", "item_id": items[self.course.pk]},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.ebook.pk: 1})
+        self.assertEqual(Cart.objects.get().item_count, 1)
+
+    def test_invalid_batches_apply_nothing(self):
+        self.batch([{"op": "add", "product_id": self.ebook.pk}])
+        other = ProductVariant.objects.create(
+            product=self.course, name="Video", sku="COURSE-VIDEO"
+        )
+        invalid = [
+            ([], 400),
+            ([{"op": "rename"}], 400),
+            ([{"op": "add"}], 400),
+            ([{"op": "add", "product_id": self.course.pk, "quantity": 0}], 400),
+            ([{"op": "update", "quantity": 2}], 400),
+            (
+                [
+                    {"op": "add", "product_id": self.course.pk},
+                    {"op": "add", "product_id": 0},
+                ],
+                400,
+            ),
+            (
+                [
+                    {
+                        "op": "add",
+                        "product_id": self.ebook.pk,
+                        "variant_id": other.pk,
+                    }
+                ],
+                400,
+            ),
+            (
+                [
+                    {"op": "add", "product_id": self.course.pk},
+                    {"op": "remove", "item_id": 0},
+                ],
+                404,
+            ),
+        ]
+        for operations, status_code in invalid:
+            with self.subTest(operations=operations):
+                response = self.batch(operations)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(self.quantities(), {self.ebook.pk: 1})
+
+        response = self.batch(
+            [
+                {"op": "add", "product_id": self.course.pk},
+                {"op": "add", "product_id": 0},
+            ]
+        )
+        self.assertEqual(
+            response.data, {"operations": {1: {"product_id": "Product not found"}}}
+        )
+
+    def test_failed_batch_is_rolled_back(self):
+        response = self.batch([{"op": "add", "product_id": self.ebook.pk}])
+        item_id = response.data["items"][0]["id"]
+        version = Cart.objects.get().version
+
+        with mock.patch(
+            "django.db.models.query.QuerySet.delete",
+            side_effect=DatabaseError("deadlock"),
+        ), self.assertRaises(DatabaseError):
+            self.batch(
+                [
+                    {"op": "add", "product_id": self.course.pk},
+                    {"op": "update", "item_id": item_id, "quantity": 5},
+                    {"op": "remove", "item_id": item_id},
+                ]
+            )
+
+        self.assertEqual(self.quantities(), {self.ebook.pk: 1})
+        self.assertEqual(Cart.objects.get().version, version)
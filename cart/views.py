@@ -4,9 +4,17 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
-from products.models import Product
+from .serializers import (
+    CartBatchOperationSerializer,
+    CartSerializer,
+    CartItemSerializer,
+    CompactCartSerializer,
+)
+from .services.cart import CartOperations
+from .services.store import CartStore
+from products.models import Product, ProductVariant
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,14 +29,40 @@ class CartViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     authentication_classes = []
 
-    def get_cart_from_request(self, request):
-        """Get or create cart using Django sessions with improved merging."""
-        # Ensure session exists
+    # Session keys caching the resolved cart and the user it was bound to
+    CART_ID_SESSION_KEY = "cart_id"
+    CART_USER_SESSION_KEY = "cart_user_id"
+
+    def get_cart_from_request(self, request, create=True):
+        """Get the request's active cart, creating one unless create is False."""
+        user_id = request.user.pk if request.user.is_authenticated else None
         if not request.session.session_key:
+            if not create:
+                return Cart(user_id=user_id)
+            # Ensure session exists
             request.session.create()
 
+        cart_id = request.session.get(self.CART_ID_SESSION_KEY)
+        if cart_id and request.session.get(self.CART_USER_SESSION_KEY) == user_id:
+            cart = CartStore.get(cart_id)
+            if cart is not None and cart.user_id == user_id:
+                return cart
+
+        cart = self.resolve_cart(request, create=create)
+        if cart is None:
+            return Cart(user_id=user_id)
+        CartStore.put(cart)
+        request.session[self.CART_ID_SESSION_KEY] = cart.id
+        request.session[self.CART_USER_SESSION_KEY] = user_id
+        return cart
+
+    def resolve_cart(self, request, create=True):
+        """
+        Get or create cart using Django sessions with improved merging.
+        Returns None instead of creating a cart when create is False.
+        """
         session_key = request.session.session_key
-        logger.info(f"Getting cart for session: {session_key}, User: {request.user}")
+        logger.debug(f"Resolving cart for session: {session_key}, User: {request.user}")
 
         with transaction.atomic():
             cart = None
@@ -70,7 +104,7 @@ class CartViewSet(viewsets.ViewSet):
                     session_cart.user = request.user
                     session_cart.save(update_fields=["user", "updated_at"])
                     cart = session_cart
-                else:
+                elif create:
                     # Create new cart for user
                     cart = Cart.objects.create(
                         user=request.user, session_key=session_key, is_active=True
@@ -84,6 +118,8 @@ class CartViewSet(viewsets.ViewSet):
                         session_key=session_key, is_active=True, user__isnull=True
                     )
                 except Cart.DoesNotExist:
+                    if not create:
+                        return None
                     cart = Cart.objects.create(session_key=session_key, is_active=True)
                     logger.info(f"Created new session cart {cart.id}")
                 except Cart.MultipleObjectsReturned:
@@ -106,19 +142,70 @@ class CartViewSet(viewsets.ViewSet):
                         cart.is_active = True
                         cart.save()
 
-            logger.info(f"Returning cart {cart.id} with {cart.items.count()} items")
             return cart
 
+    def wants_compact(self, request):
+        """Whether the client asked for the compact mutation response."""
+        compact = request.query_params.get("compact")
+        if compact is None and isinstance(request.data, dict):
+            compact = request.data.get("compact")
+        return str(compact).lower() in ("1", "true", "yes")
+
+    def cart_response(
+        self,
+        request,
+        cart,
+        status_code=status.HTTP_200_OK,
+        item_id=None,
+        removed_item_id=None,
+    ):
+        """
+        Respond with the full cart, or in compact mode with only the changed
+        line and the new totals. Either way the ETag carries the cart version.
+        """
+        if self.wants_compact(request):
+            item = cart.pricing.get_item(item_id) if item_id else None
+            serializer = CompactCartSerializer(
+                cart, context={"item": item, "removed_item_id": removed_item_id}
+            )
+            data = serializer.data
+        else:
+            data = CartStore.get_representation(
+                cart, lambda cart: dict(CartSerializer(cart).data)
+            )
+        response = Response(data, status=status_code)
+        response["ETag"] = quote_etag(cart.etag)
+        return response
+
     def list(self, request):
-        """Get the current cart."""
-        cart = self.get_cart_from_request(request)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        """Get the current cart, or 304 if the client's copy is current."""
+        cart = self.get_cart_from_request(request, create=False)
+        etag = quote_etag(cart.etag)
+        client_etags = [
+            tag.removeprefix("W/")
+            for tag in parse_etags(request.headers.get("If-None-Match", ""))
+        ]
+        if etag in client_etags or "*" in client_etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return self.cart_response(request, cart)
 
     def retrieve(self, request, pk=None):
         """Get cart - redirects to list for session-based cart."""
         return self.list(request)
 
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """Cart badge: item count and subtotal from the denormalized summary."""
+        cart = self.get_cart_from_request(request, create=False)
+        return Response(
+            {
+                "id": cart.id,
+                "version": cart.version,
+                "item_count": cart.item_count,
+                "subtotal": float(cart.summary_subtotal),
+            }
+        )
+
     @action(detail=False, methods=["post"])
     def add(self, request):
         """Add item to cart."""
@@ -139,78 +226,137 @@ class CartViewSet(viewsets.ViewSet):
                 {"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get or create cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, defaults={"quantity": 0}
+        # Atomic upsert: insert the item or add to its quantity
+        item_id = CartOperations.add_item(cart, product, quantity)
+
+        # Return updated cart
+        return self.cart_response(
+            request, cart, status.HTTP_201_CREATED, item_id=item_id
         )
 
-        # Update quantity
-        cart_item.quantity += quantity
-        cart_item.save()
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Apply a list of add, update and remove operations in one transaction
+        and return the cart once. Nothing is applied if any operation is
+        invalid. Additions run first, then updates, then removals.
+        """
+        operations = request.data
+        if isinstance(operations, dict):
+            operations = operations.get("operations")
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {"error": "A list of operations is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        # Update cart timestamp
-        cart.save(update_fields=["updated_at"])
+        serializer = CartBatchOperationSerializer(data=operations, many=True)
+        if not serializer.is_valid():
+            return Response(
+                {"operations": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        operations = serializer.validated_data
+
+        adds = [op for op in operations if op["op"] == "add"]
+        # Every product and variant is validated with one IN query each
+        product_ids = set()
+        variants = {}
+        if adds:
+            product_ids = set(
+                Product.objects.filter(
+                    pk__in={op["product_id"] for op in adds}, is_active=True
+                ).values_list("pk", flat=True)
+            )
+            variant_ids = {op.get("variant_id") for op in adds} - {None}
+            if variant_ids:
+                variants = dict(
+                    ProductVariant.objects.filter(
+                        pk__in=variant_ids, is_active=True
+                    ).values_list("pk", "product_id")
+                )
 
-        # Return updated cart
-        serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        errors = {}
+        for index, op in enumerate(operations):
+            if op["op"] != "add":
+                continue
+            if op["product_id"] not in product_ids:
+                errors[index] = {"product_id": "Product not found"}
+            elif op.get("variant_id") and (
+                variants.get(op["variant_id"]) != op["product_id"]
+            ):
+                errors[index] = {"variant_id": "Variant not found"}
+        if errors:
+            return Response({"operations": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = self.get_cart_from_request(request, create=bool(adds))
+        item_ops = [op for op in operations if op["op"] != "add"]
+        if item_ops:
+            if cart.pk is None:
+                found = set()
+            else:
+                found = set(
+                    cart.items.filter(
+                        pk__in={op["item_id"] for op in item_ops}
+                    ).values_list("pk", flat=True)
+                )
+            missing = [op["item_id"] for op in item_ops if op["item_id"] not in found]
+            if missing:
+                return Response(
+                    {"error": "Item not found in cart", "item_ids": missing},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+        quantities = {}
+        for op in adds:
+            key = (op["product_id"], op.get("variant_id"))
+            quantities[key] = quantities.get(key, 0) + op["quantity"]
+        CartOperations.apply_batch(
+            cart,
+            adds=quantities,
+            quantities={
+                op["item_id"]: op["quantity"] for op in item_ops if op["op"] == "update"
+            },
+            removals=[op["item_id"] for op in item_ops if op["op"] == "remove"],
+        )
+
+        return self.cart_response(request, cart)
 
     @action(detail=False, methods=["post"])
     def update_item(self, request):
         """Update cart item quantity."""
-        cart = self.get_cart_from_request(request)
+        cart = self.get_cart_from_request(request, create=False)
         item_id = request.data.get("item_id")
         quantity = int(request.data.get("quantity", 1))
 
-        try:
-            cart_item = cart.items.get(id=item_id)
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-            else:
-                cart_item.delete()
-
-            # Update cart timestamp
-            cart.save(update_fields=["updated_at"])
-
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
-        except CartItem.DoesNotExist:
+        if not CartOperations.set_quantity(cart, item_id, quantity):
             return Response(
                 {"error": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND
             )
 
+        if quantity > 0:
+            return self.cart_response(request, cart, item_id=item_id)
+        return self.cart_response(request, cart, removed_item_id=item_id)
+
     @action(detail=False, methods=["post"])
     def remove_item(self, request):
         """Remove item from cart."""
-        cart = self.get_cart_from_request(request)
+        cart = self.get_cart_from_request(request, create=False)
         item_id = request.data.get("item_id")
 
-        try:
-            cart_item = cart.items.get(id=item_id)
-            cart_item.delete()
-
-            # Update cart timestamp
-            cart.save(update_fields=["updated_at"])
-
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
-        except CartItem.DoesNotExist:
+        if not CartOperations.remove_item(cart, item_id):
             return Response(
                 {"error": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND
             )
 
+        return self.cart_response(request, cart, removed_item_id=item_id)
+
     @action(detail=False, methods=["post"])
     def clear(self, request):
         """Clear all items from cart."""
-        cart = self.get_cart_from_request(request)
-        cart.clear()
+        cart = self.get_cart_from_request(request, create=False)
+        CartOperations.clear(cart)
 
-        # Update cart timestamp
-        cart.save(update_fields=["updated_at"])
-
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return self.cart_response(request, cart)
 
     @action(detail=False, methods=["post"])
     def merge_session_cart(self, request):
@@ -222,7 +368,7 @@ class CartViewSet(viewsets.ViewSet):
             )
 
         # This will automatically handle merging
-        cart = self.get_cart_from_request(request)
+        cart = self.get_cart_from_request(request, create=False)
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
@@ -237,19 +383,21 @@ class CartItemViewSet(viewsets.ModelViewSet):
     authentication_classes = []
     serializer_class = CartItemSerializer
 
-    def get_cart(self):
+    def get_cart(self, create=False):
         """Get cart from request."""
         cart_viewset = CartViewSet()
-        return cart_viewset.get_cart_from_request(self.request)
+        return cart_viewset.get_cart_from_request(self.request, create=create)
 
     def get_queryset(self):
         """Get cart items for current session."""
         cart = self.get_cart()
+        if cart.pk is None:
+            return CartItem.objects.none()
         return CartItem.objects.filter(cart=cart).select_related("product", "variant")
 
     def create(self, request, *args, **kwargs):
         """Add item to cart."""
-        cart = self.get_cart()
+        cart = self.get_cart(create=True)
 
         product_id = request.data.get("product")
         quantity = int(request.data.get("quantity", 1))
@@ -261,18 +409,12 @@ class CartItemViewSet(viewsets.ModelViewSet):
                 {"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get or create cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, defaults={"quantity": 0}
+        # Atomic upsert: insert the item or add to its quantity
+        item_id = CartOperations.add_item(cart, product, quantity)
+        cart_item = CartItem.objects.select_related("product", "variant").get(
+            pk=item_id
         )
 
-        # Update quantity
-        cart_item.quantity += quantity
-        cart_item.save()
-
-        # Update cart timestamp
-        cart.save(update_fields=["updated_at"])
-
         serializer = self.get_serializer(cart_item)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -281,31 +423,15 @@ class CartItemViewSet(viewsets.ModelViewSet):
         cart_item = self.get_object()
         quantity = int(request.data.get("quantity", 1))
 
+        CartOperations.set_quantity(cart_item.cart, cart_item.pk, quantity)
         if quantity > 0:
             cart_item.quantity = quantity
-            cart_item.save()
-
-            # Update cart timestamp
-            cart_item.cart.save(update_fields=["updated_at"])
-
             serializer = self.get_serializer(cart_item)
             return Response(serializer.data)
-        else:
-            cart = cart_item.cart
-            cart_item.delete()
-
-            # Update cart timestamp
-            cart.save(update_fields=["updated_at"])
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def destroy(self, request, *args, **kwargs):
         """Remove item from cart."""
         cart_item = self.get_object()
-        cart = cart_item.cart
-        cart_item.delete()
-
-        # Update cart timestamp
-        cart.save(update_fields=["updated_at"])
-
+        CartOperations.remove_item(cart_item.cart, cart_item.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, Payment, OrderSettings
+from .models import Order, OrderItem, Payment, OrderSettings, StripeEvent
 from django.db import models
 from tinymce.widgets import TinyMCE as RichTextEditorWidget
 
@@ -257,6 +257,32 @@ class PaymentAdmin(admin.ModelAdmin):
     date_hierarchy = "created_at"
 
 
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "event_id",
+        "event_type",
+        "object_id",
+        "status",
+        "attempts",
+        "created_at",
+        "processed_at",
+    )
+    list_filter = ("status", "event_type", "created_at")
+    search_fields = ("event_id", "object_id")
+    readonly_fields = (
+        "event_id",
+        "event_type",
+        "object_id",
+        "payload",
+        "attempts",
+        "processed_at",
+        "last_error",
+        "created_at",
+    )
+    date_hierarchy = "created_at"
+
+
 @admin.register(OrderSettings)
 class OrderSettingsAdmin(admin.ModelAdmin):
     """
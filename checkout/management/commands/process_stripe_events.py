@@ -0,0 +1,43 @@
+# checkout/management/commands/process_stripe_events.py
+import time
+
+from django.core.management.base import BaseCommand
+from checkout.services.events import StripeEventQueue
+
+
+class Command(BaseCommand):
+    help = "Process queued Stripe webhook events"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=StripeEventQueue.BATCH_SIZE,
+            help="Events claimed per batch",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new events instead of exiting when idle",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep between polls with --loop",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        while True:
+            processed, failed = StripeEventQueue.run(batch_size)
+            if processed or failed:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Processed {processed} event(s), {failed} failed"
+                    )
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
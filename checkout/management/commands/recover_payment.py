@@ -80,8 +80,8 @@ class Command(BaseCommand):
                     tax_amount=Decimal("0.00"),
                     discount_amount=Decimal("0.00"),
                     total=Decimal(str(intent.amount / 100)),
-                    payment_status="paid",
-                    status="processing",
+                    payment_status="unpaid",
+                    status="pending",
                     digital_delivery_email=user_email,
                 )
                 self.stdout.write(f"Created order: {order.order_number}")
@@ -112,13 +112,14 @@ class Command(BaseCommand):
                         is_digital=variant.product.is_digital,
                     )
 
-                    # Set up digital download if applicable
-                    if order_item.is_digital:
-                        order_item.setup_digital_product()
-
                     self.stdout.write(f"Created order item: {order_item.product_name}")
 
-                # Create payment record
+                order.has_digital_items = order.items.filter(is_digital=True).exists()
+                order.has_physical_items = order.items.filter(is_digital=False).exists()
+                order.save(update_fields=["has_digital_items", "has_physical_items"])
+
+                # Record the payment, which fulfills the order: downloads,
+                # status and the confirmation email
                 payment = Payment.objects.create(
                     order=order,
                     payment_method="stripe",
@@ -129,11 +130,6 @@ class Command(BaseCommand):
                 )
                 self.stdout.write(f"Created payment record: {payment.id}")
 
-                # Send confirmation email
-                from checkout.services.checkout import CheckoutService
-
-                CheckoutService.send_order_confirmation_email(order)
-
                 self.stdout.write(
                     self.style.SUCCESS(
                         f"Successfully recovered order: {order.order_number}"
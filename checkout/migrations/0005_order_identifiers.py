@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:09
+
+from django.db import migrations, models
+
+
+def clear_blank_download_tokens(apps, schema_editor):
+    OrderItem = apps.get_model('checkout', 'OrderItem')
+    OrderItem.objects.filter(download_token='').update(download_token=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0004_order_stripe_payment_intent_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Order Number Sequence',
+            },
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='download_token',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(clear_blank_download_tokens, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,6 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.utils.crypto import get_random_string
-from datetime import timedelta
 from core.models import TimestampedModel
 from products.models import Product, ProductVariant
 from decimal import Decimal
@@ -181,29 +179,28 @@ class Order(TimestampedModel):
 
     def generate_order_number(self):
         """
-        Generate a unique order number.
+        Generate a unique order number from the order sequence.
         """
-        import random
-        import string
+        from checkout.services.identifiers import new_order_number
 
-        # Use format COR + 8 digits
-        prefix = "COR"
-        order_number = prefix + "".join(random.choices(string.digits, k=8))
-
-        # Check if order number exists
-        if Order.objects.filter(order_number=order_number).exists():
-            return self.generate_order_number()
-
-        return order_number
+        return new_order_number()
 
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            self.order_number = self.generate_order_number()
+        from checkout.services.identifiers import save_with_unique_retry
 
         if not self.total:
             self.total = self.calculate_total()
 
-        super().save(*args, **kwargs)
+        if self.order_number:
+            super().save(*args, **kwargs)
+            return
+
+        # Numbers from before the sequence may collide; the unique index
+        # catches it and a fresh number is drawn
+        self.order_number = self.generate_order_number()
+        save_with_unique_retry(
+            self, "order_number", self.generate_order_number, *args, **kwargs
+        )
 
     def calculate_total(self):
         """
@@ -243,8 +240,10 @@ class OrderItem(TimestampedModel):
 
     # Digital product fields
     is_digital = models.BooleanField(default=False)
+    # NULL until the item is set up for download, since blank tokens
+    # would collide on the unique index
     download_token = models.CharField(
-        max_length=64, blank=True, unique=True, db_index=True
+        max_length=64, blank=True, null=True, unique=True, db_index=True
     )
     download_expires_at = models.DateTimeField(null=True, blank=True)
     download_count = models.PositiveIntegerField(default=0)
@@ -319,39 +318,24 @@ class OrderItem(TimestampedModel):
 
     def generate_download_token(self):
         """
-        Generate a unique download token for this item.
+        Generate a 256-bit download token. Uniqueness is left to the
+        unique index.
         """
-        token = get_random_string(32)
-
-        # Ensure uniqueness
-        while OrderItem.objects.filter(download_token=token).exists():
-            token = get_random_string(32)
+        from checkout.services.identifiers import new_download_token
 
-        return token
+        return new_download_token()
 
     def setup_digital_product(self):
         """
-        Set up digital product fields after order payment.
-        Call this when order is marked as paid.
+        Set up digital product fields after order payment. Orders are set
+        up as a whole by FulfillmentService.fulfill().
         """
+        from checkout.services.fulfillment import FulfillmentService
+
         if not self.is_digital:
             return
 
-        # Generate download token if not exists
-        if not self.download_token:
-            self.download_token = self.generate_download_token()
-
-        # Set download expiry
-        if self.product.download_expiry_days:
-            self.download_expires_at = timezone.now() + timedelta(
-                days=self.product.download_expiry_days
-            )
-
-        # Set download limit
-        if self.product.download_limit:
-            self.max_downloads = self.product.download_limit
-
-        self.save()
+        FulfillmentService.setup_downloads([self])
 
     def increment_download_count(self):
         """Increment download count when file is downloaded"""
@@ -378,6 +362,54 @@ class OrderItem(TimestampedModel):
         super().save(*args, **kwargs)
 
 
+class OrderNumberSequence(models.Model):
+    """
+    Backs the order number sequence. PostgreSQL draws values from the id
+    column's sequence without inserting; other databases insert a row per
+    order number.
+    """
+
+    class Meta:
+        verbose_name = _("Order Number Sequence")
+
+
+class StripeEvent(TimestampedModel):
+    """
+    A verified Stripe webhook event, stored as received and processed later
+    by the process_stripe_events command. The unique event id drops Stripe's
+    retries of an event that is already stored.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", _("Pending")),
+        ("processing", _("Processing")),
+        ("processed", _("Processed")),
+        ("failed", _("Failed")),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=255, blank=True, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _("Stripe Event")
+        verbose_name_plural = _("Stripe Events")
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+
 class Payment(TimestampedModel):
     """
     Payment model to store payment information.
@@ -419,16 +451,13 @@ class Payment(TimestampedModel):
         return f"Payment {self.transaction_id} for Order {self.order.order_number}"
 
     def save(self, *args, **kwargs):
+        from checkout.services.fulfillment import FulfillmentService
+
         super().save(*args, **kwargs)
 
-        # Update order payment status if needed
+        # Fulfill the order when payment completes; a paid order is skipped
         if self.status == "completed" and self.order.payment_status != "paid":
-            self.order.payment_status = "paid"
-            self.order.save()
-
-            # Set up digital downloads when payment is completed
-            for item in self.order.items.filter(is_digital=True):
-                item.setup_digital_product()
+            FulfillmentService.fulfill(self.order)
 
         elif self.status == "refunded" and self.order.payment_status != "refunded":
             self.order.payment_status = "refunded"
@@ -2,7 +2,9 @@
 from django.db import transaction
 from decimal import Decimal
 from cart.models import Cart
-from checkout.models import Order, OrderItem
+from cart.services.pricing import to_cents
+from checkout.models import Order, OrderItem, Payment
+from checkout.services.fulfillment import FulfillmentService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,21 @@ logger = logging.getLogger(__name__)
 class CheckoutService:
     """Service for handling checkout operations"""
 
+    @staticmethod
+    def revalidate_cart(cart):
+        """
+        Revalidate the cart's price snapshots against current prices with
+        one query, refreshing the cart summary if any price changed.
+
+        Returns:
+            list: Ids of items whose unit price changed
+        """
+        changed = cart.pricing.revalidate()
+        if changed:
+            logger.info(f"Repriced {len(changed)} item(s) in cart {cart.id}")
+            cart.refresh_summary()
+        return changed
+
     @staticmethod
     @transaction.atomic
     def create_order_from_cart(request, **kwargs):
@@ -34,67 +51,14 @@ class CheckoutService:
             if not cart and user:
                 cart = Cart.objects.filter(user=user, is_active=True).first()
 
-            if not cart or not cart.items.exists():
+            if not cart:
                 logger.error(f"Cart not found. Session: {session_key}, User: {user}")
                 return False, None, "Cart is empty"
 
-            # If cart belongs to session but we have a user, assign it
-            if cart and user and not cart.user:
-                cart.user = user
-                cart.save()
-
-            # Create order
-            order = Order.objects.create(
-                user=user,
-                guest_email=kwargs.get("email", ""),
-                digital_delivery_email=kwargs.get(
-                    "digital_delivery_email", kwargs.get("email", "")
-                ),
-                subtotal=cart.subtotal,
-                shipping_cost=Decimal("0.00"),  # Digital only - no shipping
-                tax_amount=Decimal("0.00"),  # Simplified - no tax calculation
-                discount_amount=Decimal("0.00"),
-                total=cart.subtotal,
-                customer_notes=kwargs.get("notes", ""),
-                payment_status="unpaid",
-                status="pending",
-                has_digital_items=cart.has_digital_items,
-                has_physical_items=cart.has_physical_items,
-            )
-
-            # Store payment intent ID if provided
-            if "stripe_payment_intent_id" in kwargs:
-                order.stripe_payment_intent_id = kwargs["stripe_payment_intent_id"]
-                order.save()
-
-            # Create order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    variant=cart_item.variant,
-                    product_name=cart_item.product.name,
-                    variant_name=cart_item.variant.name if cart_item.variant else "",
-                    sku=cart_item.product.sku
-                    if hasattr(cart_item.product, "sku")
-                    else "",
-                    price=cart_item.unit_price,
-                    quantity=cart_item.quantity,
-                    is_digital=cart_item.product.is_digital,
-                )
-
-                # Note: Digital product setup happens when payment is marked as complete
-                # via Payment.save() method which calls setup_digital_product()
-
-            # Update order totals to include digital/physical item flags
-            order.has_digital_items = any(item.is_digital for item in order.items.all())
-            order.has_physical_items = any(
-                not item.is_digital for item in order.items.all()
-            )
-            order.save()
-
-            # Clear the cart
-            cart.clear()
+            order = CheckoutService.create_order_for_cart(cart, user, **kwargs)
+            if order is None:
+                logger.error(f"Cart is empty. Session: {session_key}, User: {user}")
+                return False, None, "Cart is empty"
 
             # Log order creation
             logger.info(f"Order {order.order_number} created successfully")
@@ -105,44 +69,158 @@ class CheckoutService:
             logger.error(f"Error creating order: {str(e)}")
             return False, None, str(e)
 
+    @staticmethod
+    @transaction.atomic
+    def create_order_for_cart(cart, user=None, **kwargs):
+        """
+        Create an order from a cart and clear the cart. The cart row is
+        locked first, so the webhook worker and the checkout page cannot
+        both turn one payment into two orders: when an order already
+        exists for the given payment intent it is returned instead.
+
+        Args:
+            cart (Cart): The cart to order
+            user (User, optional): Customer to assign the cart and order to
+            **kwargs: email, digital_delivery_email, notes and
+                stripe_payment_intent_id for the order
+
+        Returns:
+            Order: The order, or None if the cart is empty
+        """
+        payment_intent_id = kwargs.get("stripe_payment_intent_id")
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        if payment_intent_id:
+            order = Order.objects.filter(
+                stripe_payment_intent_id=payment_intent_id
+            ).first()
+            if order is not None:
+                return order
+
+        # Bring price snapshots up to date, then read every line with
+        # its product and variant in one query
+        CheckoutService.revalidate_cart(cart)
+        cart_items = list(
+            cart.items.select_related("product", "variant").order_by("id")
+        )
+        if not cart_items:
+            return None
+
+        # If cart belongs to session but we have a user, assign it
+        if user and not cart.user:
+            cart.user = user
+            cart.save(update_fields=["user", "updated_at"])
+
+        # Totals and flags are computed up front, so the order is
+        # written once and its items with one bulk insert
+        subtotal = Decimal(
+            sum(item.unit_price_cents * item.quantity for item in cart_items)
+        ).scaleb(-2)
+        has_digital_items = any(item.product.is_digital for item in cart_items)
+        has_physical_items = any(not item.product.is_digital for item in cart_items)
+
+        order = Order.objects.create(
+            user=user,
+            guest_email=kwargs.get("email", ""),
+            digital_delivery_email=kwargs.get(
+                "digital_delivery_email", kwargs.get("email", "")
+            ),
+            subtotal=subtotal,
+            shipping_cost=Decimal("0.00"),  # Digital only - no shipping
+            tax_amount=Decimal("0.00"),  # Simplified - no tax calculation
+            discount_amount=Decimal("0.00"),
+            total=subtotal,
+            customer_notes=kwargs.get("notes", ""),
+            payment_status="unpaid",
+            status="pending",
+            has_digital_items=has_digital_items,
+            has_physical_items=has_physical_items,
+            stripe_payment_intent_id=payment_intent_id,
+        )
+
+        # Downloads are set up by FulfillmentService once payment completes
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    variant=item.variant,
+                    product_name=item.product.name,
+                    variant_name=item.variant.name if item.variant else "",
+                    sku=getattr(item.product, "sku", ""),
+                    price=item.unit_price,
+                    quantity=item.quantity,
+                    is_digital=item.product.is_digital,
+                )
+                for item in cart_items
+            ]
+        )
+
+        # Clear the cart
+        cart.clear()
+        return order
+
+    @staticmethod
+    @transaction.atomic
+    def record_stripe_payment(order, payment_intent_id, amount=None):
+        """
+        Record a succeeded Stripe payment for an order, once. Saving the
+        completed payment fulfills the order; the payment's unique
+        transaction id makes repeated calls for the same payment intent
+        no-ops. A payment whose amount differs from the order total is
+        recorded as pending and flagged instead, so the order is not
+        fulfilled until someone has looked at it.
+
+        Args:
+            order (Order): The paid order
+            payment_intent_id (str): Stripe PaymentIntent id
+            amount (int, optional): Amount Stripe charged, in cents
+
+        Returns:
+            tuple: (Payment, bool) - the payment and whether it was recorded now
+        """
+        expected = to_cents(order.total)
+        payment_data = {"payment_intent": payment_intent_id}
+        if amount is None or amount == expected:
+            status, paid = "completed", order.total
+        else:
+            logger.error(
+                f"Payment {payment_intent_id} of {amount} cents does not match "
+                f"order {order.order_number} total of {expected} cents"
+            )
+            status, paid = "pending", Decimal(amount).scaleb(-2)
+            payment_data["amount_mismatch"] = {
+                "expected": expected,
+                "received": amount,
+            }
+        return Payment.objects.get_or_create(
+            transaction_id=payment_intent_id,
+            defaults={
+                "order": order,
+                "payment_method": "stripe",
+                "amount": paid,
+                "status": status,
+                "payment_data": payment_data,
+            },
+        )
+
     @staticmethod
     def send_order_confirmation_email(order):
         """
         Send order confirmation email with download links
         """
-        from accounts.utils import send_order_confirmation_email as send_email
-
-        try:
-            send_email(order)
-            logger.info(f"Order confirmation email sent for order {order.order_number}")
-        except Exception as e:
-            logger.error(f"Failed to send order confirmation email: {str(e)}")
+        FulfillmentService.send_confirmation(order)
 
     @staticmethod
     def process_successful_payment(order):
         """
-        Process successful payment - enable downloads and send emails
+        Process successful payment - enable downloads and send emails.
+        Fulfillment runs once per order however often this is called.
         """
         try:
-            # Update order status
-            order.payment_status = "paid"
-            order.status = "processing"
-            order.save()
-
-            # Set up digital downloads for all digital items
-            for item in order.items.filter(is_digital=True):
-                item.setup_digital_product()
-
-            # Send order confirmation email
-            CheckoutService.send_order_confirmation_email(order)
-
-            # If order is digital only, mark as completed
-            if order.is_digital_only:
-                order.mark_as_completed()
-
-            logger.info(
-                f"Successfully processed payment for order {order.order_number}"
-            )
+            if FulfillmentService.fulfill(order):
+                logger.info(
+                    f"Successfully processed payment for order {order.order_number}"
+                )
 
         except Exception as e:
             logger.error(f"Error processing successful payment: {str(e)}")
@@ -0,0 +1,153 @@
+# checkout/services/events.py
+import json
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from checkout.models import StripeEvent
+
+logger = logging.getLogger(__name__)
+
+
+class StripeEventQueue:
+    """
+    Database-backed queue of Stripe webhook events. The webhook only stores
+    verified events; workers claim them in batches and run the handler for
+    their type. Handlers must be idempotent: an event is retried with
+    backoff when its handler raises, and a crashed worker's claim expires.
+    """
+
+    BATCH_SIZE = 50
+    MAX_ATTEMPTS = 5
+    # A claimed event is handed to another worker after this long
+    LOCK_TIMEOUT = timedelta(minutes=5)
+
+    @staticmethod
+    def enqueue(payload):
+        """
+        Store a verified webhook payload with a single insert. An event id
+        that is already stored is ignored, so Stripe's retries are no-ops.
+
+        Args:
+            payload (bytes): The raw request body
+
+        Returns:
+            dict: The decoded event
+        """
+        event = json.loads(payload)
+        data_object = event.get("data", {}).get("object", {})
+        StripeEvent.objects.bulk_create(
+            [
+                StripeEvent(
+                    event_id=event["id"],
+                    event_type=event.get("type", ""),
+                    object_id=data_object.get("id") or "",
+                    payload=event,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        return event
+
+    @staticmethod
+    @transaction.atomic
+    def claim(batch_size=BATCH_SIZE):
+        """
+        Claim a batch of due events for this worker. Rows locked by another
+        worker are skipped where the database supports it.
+
+        Args:
+            batch_size (int): Maximum number of events to claim
+
+        Returns:
+            list: The claimed events
+        """
+        now = timezone.now()
+        due = Q(status="pending", available_at__lte=now) | Q(
+            status="processing", locked_until__lt=now
+        )
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by("id")[:batch_size]
+        )
+        if events:
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                status="processing",
+                locked_until=now + StripeEventQueue.LOCK_TIMEOUT,
+                attempts=F("attempts") + 1,
+                updated_at=now,
+            )
+        return events
+
+    @staticmethod
+    def process(event):
+        """
+        Run the handler for one claimed event in its own transaction and
+        record the outcome.
+
+        Args:
+            event (StripeEvent): A claimed event
+
+        Returns:
+            bool: True if the event was processed
+        """
+        from checkout.webhooks import EVENT_HANDLERS
+
+        handler = EVENT_HANDLERS.get(event.event_type)
+        try:
+            if handler is None:
+                logger.info(f"Unhandled Stripe event type: {event.event_type}")
+            else:
+                with transaction.atomic():
+                    handler(event.payload["data"]["object"])
+        except Exception as e:
+            logger.error(
+                f"Error processing Stripe event {event.event_id}: {str(e)}",
+                exc_info=True,
+            )
+            # The claim already counted this attempt
+            attempts = event.attempts + 1
+            failed = attempts >= StripeEventQueue.MAX_ATTEMPTS
+            StripeEvent.objects.filter(pk=event.pk).update(
+                status="failed" if failed else "pending",
+                available_at=timezone.now() + timedelta(minutes=2**attempts),
+                locked_until=None,
+                last_error=str(e),
+                updated_at=timezone.now(),
+            )
+            return False
+
+        StripeEvent.objects.filter(pk=event.pk).update(
+            status="processed",
+            locked_until=None,
+            processed_at=timezone.now(),
+            last_error="",
+            updated_at=timezone.now(),
+        )
+        return True
+
+    @staticmethod
+    def run(batch_size=BATCH_SIZE):
+        """
+        Claim and process events until none are due.
+
+        Args:
+            batch_size (int): Events claimed per batch
+
+        Returns:
+            tuple: (processed, failed) - number of events in each outcome
+        """
+        processed = failed = 0
+        while True:
+            events = StripeEventQueue.claim(batch_size)
+            if not events:
+                return processed, failed
+            for event in events:
+                if StripeEventQueue.process(event):
+                    processed += 1
+                else:
+                    failed += 1
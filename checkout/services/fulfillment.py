@@ -0,0 +1,154 @@
+# checkout/services/fulfillment.py
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from checkout.models import Order, OrderItem
+from checkout.services.identifiers import new_download_token
+
+logger = logging.getLogger(__name__)
+
+
+class FulfillmentService:
+    """
+    The one place a paid order is fulfilled. Every payment path ends in
+    fulfill(), which claims the order's transition to paid with a
+    conditional UPDATE, so however many paths see the same payment, the
+    order, its downloads and its side effects are written once.
+    """
+
+    TOKEN_ATTEMPTS = 5
+
+    @staticmethod
+    @transaction.atomic
+    def fulfill(order):
+        """
+        Mark an order paid and fulfill it: set up its digital downloads,
+        confirm its appointment and send the confirmation email once the
+        transaction commits. Does nothing for an order that is already paid.
+
+        Args:
+            order (Order): The paid order
+
+        Returns:
+            bool: True if this call fulfilled the order
+        """
+        now = timezone.now()
+        status = "delivered" if order.is_digital_only else "processing"
+        claimed = (
+            Order.objects.filter(pk=order.pk)
+            .exclude(payment_status="paid")
+            .update(payment_status="paid", status=status, updated_at=now)
+        )
+        if not claimed:
+            return False
+        order.payment_status = "paid"
+        order.status = status
+        order.updated_at = now
+
+        if order.has_digital_items:
+            FulfillmentService.setup_downloads(
+                OrderItem.objects.filter(order=order, is_digital=True), now
+            )
+        if order.is_appointment_order:
+            FulfillmentService.confirm_appointment(order, now)
+
+        transaction.on_commit(lambda: FulfillmentService.send_confirmation(order))
+
+        logger.info(f"Fulfilled order {order.order_number}")
+        return True
+
+    @staticmethod
+    def setup_downloads(items, now=None):
+        """
+        Give digital items a download token, expiry and download limit from
+        their product, with one UPDATE. Existing tokens are kept.
+
+        Args:
+            items (QuerySet or list): Digital order items
+            now (datetime, optional): Time the downloads start from
+
+        Returns:
+            int: Number of items updated
+        """
+        now = now or timezone.now()
+        items = list(
+            items.select_related("product")
+            if hasattr(items, "select_related")
+            else items
+        )
+        if not items:
+            return 0
+
+        for item in items:
+            if item.product.download_expiry_days:
+                item.download_expires_at = now + timedelta(
+                    days=item.product.download_expiry_days
+                )
+            if item.product.download_limit:
+                item.max_downloads = item.product.download_limit
+            item.updated_at = now
+
+        # The unique index does the checking; a collision draws fresh tokens
+        missing = [item for item in items if not item.download_token]
+        for attempt in range(FulfillmentService.TOKEN_ATTEMPTS):
+            for item in missing:
+                item.download_token = new_download_token()
+            try:
+                with transaction.atomic():
+                    OrderItem.objects.bulk_update(
+                        items,
+                        [
+                            "download_token",
+                            "download_expires_at",
+                            "max_downloads",
+                            "updated_at",
+                        ],
+                    )
+                return len(items)
+            except IntegrityError as e:
+                if (
+                    "download_token" not in str(e)
+                    or attempt == FulfillmentService.TOKEN_ATTEMPTS - 1
+                ):
+                    raise
+
+    @staticmethod
+    def confirm_appointment(order, now=None):
+        """
+        Confirm the pending appointment booked with an order. It is saved
+        normally, so the appointment signals send their confirmation.
+
+        Args:
+            order (Order): The paid order
+            now (datetime, optional): Confirmation time
+        """
+        from appointments.models import Appointment
+
+        appointment = Appointment.objects.filter(order=order, status="pending").first()
+        if appointment is None:
+            return
+        appointment.status = "confirmed"
+        appointment.payment_status = "paid"
+        appointment.confirmed_at = now or timezone.now()
+        appointment.save()
+        logger.info(f"Appointment {appointment.id} confirmed after payment")
+
+    @staticmethod
+    def send_confirmation(order):
+        """
+        Send the order confirmation email, logging rather than raising on
+        failure.
+
+        Args:
+            order (Order): The fulfilled order
+        """
+        from accounts.utils import send_order_confirmation_email
+
+        try:
+            send_order_confirmation_email(order)
+            logger.info(f"Order confirmation email sent for order {order.order_number}")
+        except Exception as e:
+            logger.error(f"Failed to send order confirmation email: {str(e)}")
@@ -0,0 +1,126 @@
+# checkout/services/identifiers.py
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils.crypto import salted_hmac
+
+ORDER_NUMBER_PREFIX = "COR"
+ORDER_NUMBER_DIGITS = 8
+FEISTEL_ROUNDS = 4
+
+
+def next_order_sequence():
+    """
+    Next value of the order number sequence. PostgreSQL hands it out from
+    the sequence behind OrderNumberSequence's id column; other databases
+    insert a ticket row and use its id.
+
+    Returns:
+        int: A value never returned before
+    """
+    from checkout.models import OrderNumberSequence
+
+    if connection.vendor == "postgresql":
+        table = OrderNumberSequence._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+            return cursor.fetchone()[0]
+    return OrderNumberSequence.objects.create().pk
+
+
+def order_number_key():
+    """
+    Key of the order number permutation: settings.ORDER_NUMBER_KEY, or one
+    derived from SECRET_KEY. Changing it on a live site, including by
+    rotating SECRET_KEY without setting ORDER_NUMBER_KEY, can make new
+    numbers collide with existing ones; the unique index catches those.
+
+    Returns:
+        str: The key
+    """
+    key = getattr(settings, "ORDER_NUMBER_KEY", None)
+    if key:
+        return key
+    return salted_hmac("checkout.order_numbers", "permutation").hexdigest()
+
+
+def _round_value(key, round_number, half, modulus):
+    digest = hashlib.sha256(f"{key}:{round_number}:{half}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % modulus
+
+
+def permute(value, digits):
+    """
+    Keyed Feistel permutation of the numbers with the given (even) number
+    of digits. Distinct inputs give distinct outputs, so sequential values
+    become unique, non-guessable numbers.
+
+    Args:
+        value (int): Number to permute, below 10 ** digits
+        digits (int): Width of the number space
+
+    Returns:
+        int: The permuted number
+    """
+    key = order_number_key()
+    modulus = 10 ** (digits // 2)
+    left, right = divmod(value, modulus)
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = (
+            right,
+            (left + _round_value(key, round_number, right, modulus)) % modulus,
+        )
+    return left * modulus + right
+
+
+def new_order_number():
+    """
+    Generate an order number like COR04819275 from the order sequence,
+    without checking existing orders. The number space widens by two
+    digits whenever the sequence outgrows it.
+
+    Returns:
+        str: The order number
+    """
+    value = next_order_sequence()
+    digits = ORDER_NUMBER_DIGITS
+    while value >= 10**digits:
+        digits += 2
+    return f"{ORDER_NUMBER_PREFIX}{permute(value, digits):0{digits}d}"
+
+
+def new_download_token():
+    """
+    Generate a 256-bit URL-safe download token.
+
+    Returns:
+        str: The token
+    """
+    return secrets.token_urlsafe(32)
+
+
+def save_with_unique_retry(instance, field, generate, *args, attempts=5, **kwargs):
+    """
+    Save a model instance, drawing a fresh value for a unique field when
+    the insert or update collides on it. The unique index does the
+    checking, so no lookup precedes the write.
+
+    Args:
+        instance (Model): Instance to save
+        field (str): Name of the generated unique field
+        generate (callable): Returns a fresh value for the field
+        *args: Passed to save()
+        attempts (int): Saves to try before giving up
+        **kwargs: Passed to save()
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                instance.save(*args, **kwargs)
+            return
+        except IntegrityError as e:
+            if field not in str(e) or attempt == attempts - 1:
+                raise
+            setattr(instance, field, generate())
@@ -0,0 +1,160 @@
+# checkout/services/intents.py
+import time
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+
+from checkout.models import StripeEvent
+
+
+class PaymentIntentCache:
+    """
+    Cached PaymentIntent status, so order confirmation polling does not
+    call Stripe on every request. Webhook events feed the cache; on a miss
+    the stored events are read, and only an intent no webhook has reported
+    yet is fetched from Stripe. Concurrent misses for the same intent
+    share one fetch. States that can still change expire after
+    EVENT_TIMEOUT, or FETCH_TIMEOUT when fetched from Stripe.
+    """
+
+    CACHE_KEY = "checkout:intent:{}"
+    LOCK_KEY = "checkout:intent:lock:{}"
+    CACHE_TIMEOUT = 60 * 60 * 24
+    EVENT_TIMEOUT = 60
+    FETCH_TIMEOUT = 5
+    # How long a fetch may hold the lock, and how long others wait for it
+    LOCK_TIMEOUT = 10
+    WAIT = 3.0
+    POLL = 0.05
+    # States a PaymentIntent never leaves, and the events reporting them
+    FINAL_STATUSES = ("succeeded", "canceled")
+    FINAL_EVENTS = ("payment_intent.succeeded", "payment_intent.canceled")
+
+    @staticmethod
+    def _snapshot(payment_intent):
+        return {
+            "id": payment_intent["id"],
+            "status": payment_intent.get("status"),
+            "amount": payment_intent.get("amount") or 0,
+            "metadata": dict(payment_intent.get("metadata") or {}),
+        }
+
+    @staticmethod
+    def remember(snapshot, timeout=None):
+        """
+        Cache an intent snapshot. A final state is kept for CACHE_TIMEOUT
+        and is never replaced by a state that can still change.
+
+        Args:
+            snapshot (dict): id, status, amount and metadata of the intent
+            timeout (int, optional): Seconds to keep a non-final state,
+                EVENT_TIMEOUT by default
+
+        Returns:
+            dict: The snapshot now cached
+        """
+        key = PaymentIntentCache.CACHE_KEY.format(snapshot["id"])
+        final = snapshot["status"] in PaymentIntentCache.FINAL_STATUSES
+        if not final:
+            current = cache.get(key)
+            if current and current["status"] in PaymentIntentCache.FINAL_STATUSES:
+                return current
+        if final:
+            timeout = PaymentIntentCache.CACHE_TIMEOUT
+        cache.set(key, snapshot, timeout or PaymentIntentCache.EVENT_TIMEOUT)
+        return snapshot
+
+    @staticmethod
+    def update_from_event(event):
+        """
+        Feed a webhook event into the cache.
+
+        Args:
+            event (dict): A Stripe event
+        """
+        if event.get("type", "").startswith("payment_intent."):
+            PaymentIntentCache.remember(
+                PaymentIntentCache._snapshot(event["data"]["object"])
+            )
+
+    @staticmethod
+    def _from_events(payment_intent_id):
+        # A final event wins over any later one, which may arrive out of order
+        payload = (
+            StripeEvent.objects.filter(
+                object_id=payment_intent_id, event_type__startswith="payment_intent."
+            )
+            .order_by(
+                Case(
+                    When(event_type__in=PaymentIntentCache.FINAL_EVENTS, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                ),
+                "-id",
+            )
+            .values_list("payload", flat=True)
+            .first()
+        )
+        if payload is None:
+            return None
+        return PaymentIntentCache.remember(
+            PaymentIntentCache._snapshot(payload["data"]["object"])
+        )
+
+    @staticmethod
+    def _fetch(payment_intent_id):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        return PaymentIntentCache.remember(
+            PaymentIntentCache._snapshot(intent.to_dict()),
+            PaymentIntentCache.FETCH_TIMEOUT,
+        )
+
+    @staticmethod
+    def get(payment_intent_id, refresh=False):
+        """
+        Get the state of a PaymentIntent, from the cache or the stored
+        webhook events when possible. Otherwise one request fetches it from
+        Stripe while concurrent requests for it wait for the result.
+
+        Args:
+            payment_intent_id (str): Stripe PaymentIntent id
+            refresh (bool): Ignore a cached state that can still change
+
+        Returns:
+            dict: id, status, amount (in cents) and metadata of the intent
+
+        Raises:
+            stripe.error.StripeError: If Stripe cannot be reached
+        """
+        key = PaymentIntentCache.CACHE_KEY.format(payment_intent_id)
+        snapshot = cache.get(key)
+        if snapshot and (
+            not refresh or snapshot["status"] in PaymentIntentCache.FINAL_STATUSES
+        ):
+            return snapshot
+
+        if not refresh:
+            snapshot = PaymentIntentCache._from_events(payment_intent_id)
+            if snapshot:
+                return snapshot
+
+        lock = PaymentIntentCache.LOCK_KEY.format(payment_intent_id)
+        if cache.add(lock, 1, PaymentIntentCache.LOCK_TIMEOUT):
+            try:
+                return PaymentIntentCache._fetch(payment_intent_id)
+            finally:
+                cache.delete(lock)
+
+        # Another request is fetching this intent; wait for its result
+        deadline = time.monotonic() + PaymentIntentCache.WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PaymentIntentCache.POLL)
+            current = cache.get(key)
+            if current and current != snapshot:
+                return current
+            if not cache.get(lock):
+                break
+        return cache.get(key) or PaymentIntentCache._fetch(payment_intent_id)
@@ -1,3 +1,380 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart
+from cart.services.cart import CartOperations
+from products.models import Category, Product
+
+from .models import Order, OrderItem, Payment, StripeEvent
+from .services import identifiers
+from .services.events import StripeEventQueue
+from .services.fulfillment import FulfillmentService
+from .services.intents import PaymentIntentCache
+from .webhooks import handle_successful_payment
+
+
+def payment_intent_event(
+    event_id, payment_intent, event_type="payment_intent.succeeded"
+):
+    return json.dumps(
+        {
+            "id": event_id,
+            "type": event_type,
+            "data": {"object": payment_intent},
+        }
+    ).encode()
+
+
+class StripePaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.product = Product.objects.create(
+            name="Ebook",
+            category=category,
+            price=Decimal("12.50"),
+            product_type="digital",
+        )
+
+    def setUp(self):
+        self.cart = Cart.objects.create(session_key="session-a")
+        CartOperations.add_item(self.cart, self.product, 2)
+        self.payment_intent = {
+            "id": "pi_123",
+            "status": "succeeded",
+            "amount": 2500,
+            "receipt_email": "buyer@example.com",
+            "metadata": {"cart_id": str(self.cart.pk)},
+        }
+        patcher = mock.patch.object(FulfillmentService, "send_confirmation")
+        self.send_confirmation = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_payment_intent_creates_one_paid_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for event_id in ("evt_1", "evt_1", "evt_2"):
+                StripeEventQueue.enqueue(
+                    payment_intent_event(event_id, self.payment_intent)
+                )
+            self.assertEqual(StripeEventQueue.run(), (2, 0))
+            handle_successful_payment(self.payment_intent)
+
+        order = Order.objects.get()
+        self.assertEqual(order.stripe_payment_intent_id, "pi_123")
+        self.assertEqual(order.payment_status, "paid")
+        self.assertEqual(order.total, Decimal("25.00"))
+        self.assertEqual(order.items.get().quantity, 2)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.transaction_id, "pi_123")
+        self.assertEqual(payment.status, "completed")
+        self.send_confirmation.assert_called_once()
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(
+            list(StripeEvent.objects.values_list("event_id", "status")),
+            [("evt_1", "processed"), ("evt_2", "processed")],
+        )
+
+    def test_amount_mismatch_is_not_fulfilled(self):
+        self.payment_intent["amount"] = 100
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs(
+            "checkout.services.checkout", "ERROR"
+        ):
+            handle_successful_payment(self.payment_intent)
+
+        order = Order.objects.get()
+        self.assertNotEqual(order.payment_status, "paid")
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, "pending")
+        self.assertEqual(
+            payment.payment_data["amount_mismatch"],
+            {"expected": 2500, "received": 100},
+        )
+        self.send_confirmation.assert_not_called()
+
+    def test_checkout_page_returns_the_order_the_webhook_created(self):
+        user = get_user_model().objects.create_user(
+            username="buyer", email="buyer@example.com", password="secret"
+        )
+        self.payment_intent["metadata"]["email"] = user.email
+        get_cart = Cart.objects.get
+
+        def webhook_finishes_first(*args, **kwargs):
+            # The worker fulfills the payment while the page is checking
+            handle_successful_payment(self.payment_intent)
+            return get_cart(*args, **kwargs)
+
+        with mock.patch.object(
+            PaymentIntentCache, "get", return_value=self.payment_intent
+        ), mock.patch.object(
+            Cart.objects, "get", side_effect=webhook_finishes_first
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            response = APIClient().post(
+                "/api/v1/create-order/",
+                {"payment_intent_id": "pi_123"},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(response.data["order"]["order_number"], order.order_number)
+        self.assertEqual(order.payment_status, "paid")
+        self.assertEqual(Payment.objects.count(), 1)
+        self.send_confirmation.assert_called_once()
+
+    def test_failing_event_is_retried_until_failed(self):
+        StripeEventQueue.enqueue(payment_intent_event("evt_1", self.payment_intent))
+        handler = mock.Mock(side_effect=RuntimeError("Stripe is down"))
+
+        with mock.patch.dict(
+            "checkout.webhooks.EVENT_HANDLERS",
+            {"payment_intent.succeeded": handler},
+        ):
+            for attempt in range(1, StripeEventQueue.MAX_ATTEMPTS + 1):
+                with self.assertLogs("checkout.services.events", "ERROR"):
+                    self.assertEqual(StripeEventQueue.run(), (0, 1))
+                event = StripeEvent.objects.get()
+                self.assertEqual(event.attempts, attempt)
+                self.assertEqual(event.last_error, "Stripe is down")
+                self.assertIsNone(event.locked_until)
+                if attempt < StripeEventQueue.MAX_ATTEMPTS:
+                    self.assertEqual(event.status, "pending")
+                    self.assertGreater(event.available_at, timezone.now())
+                    # Nothing is due until the backoff has passed
+                    self.assertEqual(StripeEventQueue.run(), (0, 0))
+                    StripeEvent.objects.update(available_at=timezone.now())
+
+            self.assertEqual(event.status, "failed")
+            self.assertEqual(StripeEventQueue.run(), (0, 0))
+
+        self.assertEqual(handler.call_count, StripeEventQueue.MAX_ATTEMPTS)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.product = Product.objects.create(
+            name="Ebook",
+            category=category,
+            price=Decimal("12.50"),
+            product_type="digital",
+            download_limit=3,
+            download_expiry_days=7,
+        )
+
+    def make_order(self, items=1, **kwargs):
+        order = Order.objects.create(
+            guest_email="buyer@example.com",
+            subtotal=Decimal("12.50") * items,
+            has_digital_items=True,
+            **kwargs,
+        )
+        for _ in range(items):
+            OrderItem.objects.create(
+                order=order,
+                product=self.product,
+                product_name=self.product.name,
+                price=self.product.price,
+                is_digital=True,
+            )
+        return order
+
+
+class OrderIdentifierTests(OrderTestCase):
+    def test_permutation_is_a_keyed_bijection(self):
+        numbers = [identifiers.permute(value, 4) for value in range(10**4)]
+
+        self.assertEqual(len(set(numbers)), 10**4)
+        self.assertTrue(all(0 <= number < 10**4 for number in numbers))
+        self.assertNotEqual(numbers[:10], list(range(10)))
+        with override_settings(ORDER_NUMBER_KEY="another key"):
+            self.assertNotEqual(
+                [identifiers.permute(value, 4) for value in range(10)], numbers[:10]
+            )
+
+    def test_order_numbers_widen_with_the_sequence(self):
+        first, second = self.make_order(), self.make_order()
+
+        for order in (first, second):
+            self.assertRegex(order.order_number, r"^COR\d{8}$")
+        self.assertNotEqual(first.order_number, second.order_number)
+
+        with mock.patch.object(identifiers, "next_order_sequence", return_value=10**8):
+            self.assertRegex(identifiers.new_order_number(), r"^COR\d{10}$")
+
+    def test_colliding_order_number_is_drawn_again(self):
+        taken = self.make_order().order_number
+
+        with mock.patch.object(
+            Order, "generate_order_number", side_effect=[taken, "COR00000001"]
+        ):
+            order = self.make_order()
+
+        self.assertEqual(order.order_number, "COR00000001")
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_colliding_download_tokens_are_drawn_again(self):
+        taken = self.make_order()
+        FulfillmentService.setup_downloads(taken.items.all())
+        token = taken.items.get().download_token
+        order = self.make_order(items=2)
+
+        with mock.patch(
+            "checkout.services.fulfillment.new_download_token",
+            side_effect=[token, "fresh-a", "fresh-b", "fresh-c"],
+        ):
+            self.assertEqual(FulfillmentService.setup_downloads(order.items.all()), 2)
+
+        self.assertEqual(
+            set(order.items.values_list("download_token", flat=True)),
+            {"fresh-b", "fresh-c"},
+        )
+
+        with mock.patch(
+            "checkout.services.fulfillment.new_download_token", return_value=token
+        ), self.assertRaises(IntegrityError):
+            FulfillmentService.setup_downloads(self.make_order().items.all())
+
+
+class FulfillmentTests(OrderTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(FulfillmentService, "send_confirmation")
+        self.send_confirmation = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_order_is_fulfilled_once(self):
+        order = self.make_order(items=2)
+        stale = Order.objects.get(pk=order.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(FulfillmentService.fulfill(order))
+        tokens = list(order.items.values_list("download_token", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(FulfillmentService.fulfill(stale))
+            self.assertFalse(FulfillmentService.fulfill(order))
+
+        self.send_confirmation.assert_called_once_with(order)
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.status), ("paid", "delivered"))
+        self.assertEqual(
+            list(order.items.values_list("download_token", flat=True)), tokens
+        )
+        for item in order.items.all():
+            self.assertTrue(item.download_token)
+            self.assertEqual(item.max_downloads, 3)
+            self.assertEqual(
+                item.download_expires_at, order.updated_at + timedelta(days=7)
+            )
+
+    def test_failed_fulfillment_releases_the_claim(self):
+        order = self.make_order()
+
+        with mock.patch.object(
+            FulfillmentService, "setup_downloads", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            FulfillmentService.fulfill(order)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).payment_status, "pending")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(FulfillmentService.fulfill(order))
+        self.send_confirmation.assert_called_once_with(order)
+
+
+class PaymentIntentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch("stripe.PaymentIntent.retrieve")
+        self.retrieve = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.retrieve.return_value.to_dict.return_value = self.intent("processing")
+
+    def intent(self, status):
+        return {"id": "pi_123", "status": status, "amount": 2500, "metadata": {}}
+
+    def remembered_timeout(self, snapshot, timeout=None):
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            PaymentIntentCache.remember(snapshot, timeout)
+        if not cache_set.called:
+            return None
+        return cache_set.call_args.args[2]
+
+    def test_only_final_states_are_kept_long(self):
+        self.assertEqual(
+            self.remembered_timeout(self.intent("processing")),
+            PaymentIntentCache.EVENT_TIMEOUT,
+        )
+        self.assertEqual(
+            self.remembered_timeout(
+                self.intent("processing"), PaymentIntentCache.FETCH_TIMEOUT
+            ),
+            PaymentIntentCache.FETCH_TIMEOUT,
+        )
+        self.assertEqual(
+            self.remembered_timeout(self.intent("succeeded")),
+            PaymentIntentCache.CACHE_TIMEOUT,
+        )
+        # A late non-final state never replaces a final one
+        self.assertIsNone(self.remembered_timeout(self.intent("processing")))
+        self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "succeeded")
+
+    def test_stored_events_are_read_before_stripe(self):
+        for event_id, event_type, status in (
+            ("evt_1", "payment_intent.succeeded", "succeeded"),
+            ("evt_2", "payment_intent.processing", "processing"),
+        ):
+            StripeEventQueue.enqueue(
+                payment_intent_event(event_id, self.intent(status), event_type)
+            )
+
+        self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "succeeded")
+        self.retrieve.assert_not_called()
+
+    def test_stripe_is_fetched_once_and_refreshed_on_request(self):
+        self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "processing")
+        self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "processing")
+        self.assertEqual(self.retrieve.call_count, 1)
+
+        self.retrieve.return_value.to_dict.return_value = self.intent("succeeded")
+        self.assertEqual(
+            PaymentIntentCache.get("pi_123", refresh=True)["status"], "succeeded"
+        )
+        PaymentIntentCache.get("pi_123", refresh=True)
+        self.assertEqual(self.retrieve.call_count, 2)
+
+    def test_concurrent_misses_wait_for_one_fetch(self):
+        lock = PaymentIntentCache.LOCK_KEY.format("pi_123")
+        cache.add(lock, 1)
+
+        def other_request_finishes(seconds):
+            PaymentIntentCache.remember(self.intent("succeeded"))
+            cache.delete(lock)
+
+        with mock.patch(
+            "checkout.services.intents.time.sleep", side_effect=other_request_finishes
+        ):
+            self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "succeeded")
+        self.retrieve.assert_not_called()
+
+        # A fetch that gave up leaves the waiting request to fetch itself
+        cache.clear()
+        cache.add(lock, 1)
+        with mock.patch(
+            "checkout.services.intents.time.sleep",
+            side_effect=lambda seconds: cache.delete(lock),
+        ):
+            self.assertEqual(PaymentIntentCache.get("pi_123")["status"], "processing")
+        self.retrieve.assert_called_once_with("pi_123")
@@ -13,6 +13,7 @@ import os
 from .models import Order, OrderItem, Payment, OrderSettings
 from api.serializers import OrderSerializer, PaymentSerializer
 from .serializers import OrderSettingsSerializer
+from .services.intents import PaymentIntentCache
 import stripe
 import logging
 
@@ -63,8 +64,8 @@ def check_payment_status(request):
         )
 
     try:
-        # Retrieve payment intent from Stripe
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        # Cached or webhook-reported state; Stripe only on a miss
+        intent = PaymentIntentCache.get(payment_intent_id)
 
         # Check if order exists
         order = None
@@ -76,10 +77,10 @@ def check_payment_status(request):
 
         return Response(
             {
-                "payment_status": intent.status,
-                "payment_amount": intent.amount / 100,  # Convert from cents
+                "payment_status": intent["status"],
+                "payment_amount": intent["amount"] / 100,  # Convert from cents
                 "order": order_data,
-                "success": intent.status == "succeeded",
+                "success": intent["status"] == "succeeded",
             }
         )
 
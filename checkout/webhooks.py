@@ -2,12 +2,15 @@
 import stripe
 from django.conf import settings
 from django.http import HttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from checkout.models import Order, Payment
+from checkout.models import Order
+from checkout.services.checkout import CheckoutService
+from checkout.services.events import StripeEventQueue
+from checkout.services.intents import PaymentIntentCache
 from cart.models import Cart
 from accounts.models import User
-from courses.models import Enrollment
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,14 +23,16 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 @require_POST
 def stripe_webhook(request):
     """
-    Handle Stripe webhook events for digital product fulfillment.
+    Receive Stripe webhook events. Verified events are stored for the
+    process_stripe_events worker and acknowledged straight away; the
+    fulfillment itself never runs in the request. PaymentIntent events
+    also update the cached intent status that checkout polling reads.
     """
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE")
-    event = None
 
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError:
@@ -39,167 +44,86 @@ def stripe_webhook(request):
         logger.error("Invalid Stripe webhook signature")
         return HttpResponse(status=400)
 
-    # Handle the event
-    if event["type"] == "payment_intent.succeeded":
-        payment_intent = event["data"]["object"]
-        handle_successful_payment(payment_intent)
-    elif event["type"] == "payment_intent.payment_failed":
-        payment_intent = event["data"]["object"]
-        handle_failed_payment(payment_intent)
-    else:
-        logger.info(f"Unhandled Stripe event type: {event['type']}")
+    event = StripeEventQueue.enqueue(payload)
+    PaymentIntentCache.update_from_event(event)
+    logger.info(f"Queued Stripe event {event['id']} ({event.get('type')})")
 
     return HttpResponse(status=200)
 
 
-def handle_successful_payment(payment_intent):
+def _resolve_customer(payment_intent, cart):
     """
-    Process successful payment and fulfill digital order.
+    Find the customer for a payment: the user named in the metadata, the
+    cart's user, or an account with the payment email. Without one the
+    order is placed as a guest order.
     """
-    logger.info(f"Processing successful payment: {payment_intent['id']}")
-
-    try:
-        # Get cart from metadata - try cart_id first, then cart_token for backwards compatibility
-        cart_id = payment_intent.get("metadata", {}).get("cart_id")
-        cart_token = payment_intent.get("metadata", {}).get("cart_token")
-
-        if not cart_id and not cart_token:
-            logger.error("No cart_id or cart_token in payment intent metadata")
-            return
+    metadata = payment_intent.get("metadata") or {}
+    email = metadata.get("email") or payment_intent.get("receipt_email") or ""
 
-        # Find the cart
-        try:
-            if cart_id:
-                cart = Cart.objects.get(id=cart_id)
-            else:
-                cart = Cart.objects.get(cart_token=cart_token)
-        except Cart.DoesNotExist:
-            logger.error(f"Cart not found for id: {cart_id} or token: {cart_token}")
-            return
-
-        # Get or create user from payment details
-        email = payment_intent.get("receipt_email") or payment_intent.get(
-            "charges", {}
-        ).get("data", [{}])[0].get("billing_details", {}).get("email")
+    user = None
+    user_id = metadata.get("user_id")
+    if user_id:
+        user = User.objects.filter(id=user_id).first()
+    if user is None and cart.user_id:
+        user = cart.user
+    if user is None and email:
+        user = User.objects.filter(email=email).first()
+    return user, email or (user.email if user else "")
 
-        # Also check metadata for email
-        if not email:
-            email = payment_intent.get("metadata", {}).get("email")
 
-        if not email:
-            logger.error("No email found in payment intent")
-            return
-
-        # Check if user_id is in metadata (for authenticated users)
-        user_id = payment_intent.get("metadata", {}).get("user_id")
-
-        if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                logger.error(f"User not found for id: {user_id}")
-                return
-        else:
-            # Get or create user from email
-            user, created = User.objects.get_or_create(
-                email=email,
-                defaults={
-                    "username": email.split("@")[0],  # Simple username from email
-                    "first_name": payment_intent.get("metadata", {}).get(
-                        "first_name", ""
-                    )
-                    or payment_intent.get("charges", {})
-                    .get("data", [{}])[0]
-                    .get("billing_details", {})
-                    .get("name", "")
-                    .split()[0],
-                    "last_name": payment_intent.get("metadata", {}).get("last_name", "")
-                    or " ".join(
-                        payment_intent.get("charges", {})
-                        .get("data", [{}])[0]
-                        .get("billing_details", {})
-                        .get("name", "")
-                        .split()[1:]
-                    ),
-                },
+def handle_successful_payment(payment_intent):
+    """
+    Fulfill a succeeded payment intent. Safe to run any number of times:
+    the order is created once per payment intent, and the payment is
+    recorded and fulfilled once.
+    """
+    payment_intent_id = payment_intent["id"]
+    logger.info(f"Processing successful payment: {payment_intent_id}")
+
+    order = Order.objects.filter(stripe_payment_intent_id=payment_intent_id).first()
+    if order is None:
+        cart_id = (payment_intent.get("metadata") or {}).get("cart_id")
+        cart = Cart.objects.filter(id=cart_id).first() if cart_id else None
+        if cart is None:
+            logger.error(
+                f"Cart {cart_id} not found for payment intent {payment_intent_id}"
             )
+            return
 
-        # Create order
-        order = Order.objects.create(
-            user=user,
+        user, email = _resolve_customer(payment_intent, cart)
+        order = CheckoutService.create_order_for_cart(
+            cart,
+            user,
             email=email,
-            stripe_payment_intent_id=payment_intent["id"],
-            payment_status="paid",
-            order_status="completed",
-            subtotal=payment_intent["amount"] / 100,  # Convert from cents
-            total=payment_intent["amount"] / 100,
-            order_type="digital",
-        )
-
-        # Create payment record
-        Payment.objects.create(
-            order=order,
-            amount=payment_intent["amount"] / 100,
-            stripe_payment_intent_id=payment_intent["id"],
-            status="succeeded",
-            payment_method="card",
+            digital_delivery_email=email,
+            stripe_payment_intent_id=payment_intent_id,
         )
-
-        # Process cart items for digital fulfillment
-        for cart_item in cart.items.all():
-            # Create order item
-            order.items.create(
-                product=cart_item.product,
-                course=cart_item.course,
-                quantity=cart_item.quantity,
-                price=cart_item.unit_price,
-                subtotal=cart_item.total_price,
+        if order is None:
+            logger.error(
+                f"Cart {cart.id} is empty for payment intent {payment_intent_id}"
             )
+            return
 
-            # Handle course enrollments
-            if cart_item.course:
-                Enrollment.objects.get_or_create(
-                    user=user,
-                    course=cart_item.course,
-                    defaults={
-                        "payment_status": "paid",
-                        "payment_amount": cart_item.total_price,
-                        "stripe_payment_intent_id": payment_intent["id"],
-                    },
-                )
-                logger.info(
-                    f"Enrolled user {user.email} in course {cart_item.course.title}"
-                )
-
-            # For digital products, you might want to generate download links here
-            if cart_item.product and cart_item.product.product_type == "digital":
-                # TODO: Generate secure download link
-                logger.info(
-                    f"Digital product {cart_item.product.name} purchased by {user.email}"
-                )
-
-        # Clear the cart after successful order
-        cart.items.all().delete()
-        cart.is_active = False
-        cart.save()  # This will update totals
-
-        # TODO: Send order confirmation email with download links
-
-        logger.info(f"Order {order.id} created successfully for {email}")
-
-    except Exception as e:
-        logger.error(
-            f"Error processing payment intent {payment_intent['id']}: {str(e)}"
-        )
+    payment, created = CheckoutService.record_stripe_payment(
+        order, payment_intent_id, payment_intent.get("amount")
+    )
+    if created and payment.status == "completed":
+        logger.info(f"Order {order.order_number} fulfilled for {payment_intent_id}")
 
 
 def handle_failed_payment(payment_intent):
     """
-    Handle failed payment attempts.
+    Mark unpaid orders for a failed payment intent as failed.
     """
     logger.warning(f"Payment failed: {payment_intent['id']}")
 
-    # You might want to:
-    # - Send a notification to the customer
-    # - Update any pending order status
-    # - Log the failure for analytics
+    Order.objects.filter(stripe_payment_intent_id=payment_intent["id"]).exclude(
+        payment_status__in=["paid", "refunded"]
+    ).update(payment_status="failed", updated_at=timezone.now())
+
+
+# Handlers run by StripeEventQueue, by event type
+EVENT_HANDLERS = {
+    "payment_intent.succeeded": handle_successful_payment,
+    "payment_intent.payment_failed": handle_failed_payment,
+}
@@ -0,0 +1,309 @@
+# core/pagination.py
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import BigIntegerField, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Estimate the number of rows in a queryset without running COUNT(*).
+    Uses the planner's row estimate on PostgreSQL and falls back to an
+    exact count elsewhere.
+
+    Args:
+        queryset (QuerySet): The queryset to estimate
+
+    Returns:
+        int: Estimated number of rows
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetPage:
+    """
+    A page of results from KeysetPaginator.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor paginator that seeks on (sort field, id) instead of running
+    COUNT(*) and OFFSET. Cursors are opaque tokens that remember the sort
+    they were issued for and the last row seen.
+
+    Float annotations such as search rank are seeked on a scaled integer
+    key: PostgreSQL ranks are float4, which do not survive a round trip
+    through a JSON cursor and back as float8.
+    """
+
+    FLOAT_KEY_SCALE = 1_000_000
+
+    def __init__(self, queryset, per_page, ordering="-created_at", max_per_page=100):
+        self.ordering = ordering
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+        self.key = self.field
+        self.queryset = self._with_key(queryset)
+        try:
+            per_page = int(per_page)
+        except (TypeError, ValueError):
+            per_page = 12
+        self.per_page = max(1, min(per_page, max_per_page))
+
+    def _with_key(self, queryset):
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is None or not isinstance(annotation.output_field, FloatField):
+            return queryset
+        self.key = f"{self.field}_key"
+        return queryset.annotate(
+            **{self.key: Cast(F(self.field) * self.FLOAT_KEY_SCALE, BigIntegerField())}
+        )
+
+    @cached_property
+    def count(self):
+        """Estimated total, for templates that want to show a result count"""
+        return estimate_count(self.queryset)
+
+    def _encode_value(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def _decode_value(self, value):
+        try:
+            field = self.queryset.model._meta.get_field(self.key)
+        except FieldDoesNotExist:
+            # Annotations such as search rank are plain JSON numbers
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise InvalidPage("Invalid cursor")
+            return value
+        try:
+            return field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidPage("Invalid cursor")
+
+    def encode_cursor(self, obj, reverse=False):
+        """
+        Build an opaque cursor positioned on the given object.
+        """
+        payload = {
+            "o": self.ordering,
+            "v": self._encode_value(getattr(obj, self.key)),
+            "id": obj.pk,
+        }
+        if reverse:
+            payload["r"] = 1
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """
+        Decode a cursor into (value, id, reverse).
+
+        Raises:
+            InvalidPage: If the cursor is malformed or was issued for
+                a different sort order
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            ordering, value, pk = payload["o"], payload["v"], payload["id"]
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise InvalidPage("Invalid cursor")
+        if ordering != self.ordering:
+            raise InvalidPage("Cursor does not match the requested sort")
+        try:
+            pk = self.queryset.model._meta.pk.to_python(pk)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidPage("Invalid cursor")
+        return self._decode_value(value), pk, bool(payload.get("r"))
+
+    def _seek(self, queryset, value, pk, forward):
+        # Rows after the cursor in scan direction, ties broken on id
+        after = "lt" if self.descending == forward else "gt"
+        return queryset.filter(
+            Q(**{f"{self.key}__{after}": value})
+            | Q(**{self.key: value, f"pk__{after}": pk})
+        )
+
+    def _order(self, queryset, forward):
+        descending = self.descending == forward
+        prefix = "-" if descending else ""
+        return queryset.order_by(f"{prefix}{self.key}", f"{prefix}pk")
+
+    def page(self, cursor=None):
+        """
+        Return the page that follows (or precedes) the cursor.
+
+        Raises:
+            InvalidPage: If the cursor is invalid
+        """
+        queryset = self.queryset
+        reverse = False
+        if cursor:
+            value, pk, reverse = self.decode_cursor(cursor)
+            queryset = self._seek(queryset, value, pk, forward=not reverse)
+
+        queryset = self._order(queryset, forward=not reverse)
+        rows = list(queryset[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], reverse=True)
+
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        """
+        Return a page, falling back to the first page for an invalid cursor.
+        """
+        try:
+            return self.page(cursor)
+        except InvalidPage:
+            return self.page()
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination backed by KeysetPaginator.
+
+    Clients pick a sort with ?ordering= (one of `orderings`) and follow
+    the opaque next/previous links. ?count=estimate adds a planner-based
+    row estimate and ?count=exact an exact count.
+    """
+
+    page_size = 12
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    count_query_param = "count"
+    orderings = ("-created_at",)
+    ordering_aliases = {}
+    relevance_ordering = "-rank"
+
+    def get_page_size(self, request):
+        return request.query_params.get(self.page_size_query_param, self.page_size)
+
+    def get_ordering(self, request, queryset, view=None):
+        ordering = request.query_params.get(self.ordering_query_param)
+        ordering = self.ordering_aliases.get(ordering, ordering)
+        if ordering in self.orderings:
+            return ordering
+        # Keep search results in relevance order unless a sort was asked for
+        if self.relevance_ordering.lstrip("-") in queryset.query.annotations:
+            return self.relevance_ordering
+        return self.orderings[0]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.paginator = KeysetPaginator(
+            queryset,
+            self.get_page_size(request),
+            ordering=self.get_ordering(request, queryset, view),
+            max_per_page=self.max_page_size,
+        )
+        try:
+            self.page = self.paginator.page(
+                request.query_params.get(self.cursor_query_param)
+            )
+        except InvalidPage as exc:
+            raise NotFound(str(exc))
+
+        count_mode = request.query_params.get(self.count_query_param)
+        self.count = None
+        if count_mode == "exact":
+            self.count = queryset.count()
+        elif count_mode == "estimate":
+            self.count = self.paginator.count
+        return list(self.page)
+
+    def _get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self._get_link(self.page.next_cursor),
+            "previous": self._get_link(self.page.previous_cursor),
+            "results": data,
+        }
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
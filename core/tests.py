@@ -1,3 +1,105 @@
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.db.models import Case, FloatField, Value, When
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from products.models import Category, Product
+
+from .pagination import KeysetPaginator
+
+
+def cursor_of(link):
+    return parse_qs(urlparse(link).query)["cursor"][0]
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.products = [
+            Product.objects.create(
+                name=f"Product {i}", category=category, price=Decimal("10.00")
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+
+    def walk(self, url):
+        """Follow next links, then previous links back to the start"""
+        forward, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [row["id"] for row in response.data["results"]]
+            forward += page
+            pages.append(page)
+            previous, url = response.data["previous"], response.data["next"]
+
+        backward = pages[-1]
+        while previous:
+            response = self.client.get(previous)
+            backward = [row["id"] for row in response.data["results"]] + backward
+            previous = response.data["previous"]
+        return forward, backward
+
+    def test_cursor_links_round_trip(self):
+        forward, backward = self.walk("/api/v1/products/?page_size=2")
+
+        expected = [product.pk for product in reversed(self.products)]
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_ties_on_the_sort_value_are_broken_on_id(self):
+        forward, backward = self.walk("/api/v1/products/?ordering=price&page_size=1")
+
+        expected = [product.pk for product in self.products]
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_float_rank_pages_on_a_stable_key(self):
+        first, *rest = self.products
+        queryset = Product.objects.annotate(
+            rank=Case(
+                When(pk=first.pk, then=Value(0.1)),
+                default=Value(1 / 3),
+                output_field=FloatField(),
+            )
+        )
+
+        seen, cursor = [], None
+        while True:
+            page = KeysetPaginator(queryset, 1, ordering="-rank").page(cursor)
+            seen += [product.pk for product in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        previous = KeysetPaginator(queryset, 1, ordering="-rank").page(
+            page.previous_cursor
+        )
+
+        self.assertEqual(seen, [product.pk for product in reversed(rest)] + [first.pk])
+        self.assertEqual([product.pk for product in previous], [rest[0].pk])
+
+    def test_invalid_or_foreign_cursor(self):
+        response = self.client.get("/api/v1/products/?ordering=price&page_size=2")
+        price_cursor = cursor_of(response.data["next"])
+
+        for cursor in ("not-a-cursor", price_cursor):
+            response = self.client.get("/api/v1/products/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404)
 
-# Create your tests here.
+        paginator = KeysetPaginator(Product.objects.all(), 2)
+        for cursor in ("not-a-cursor", price_cursor):
+            page = paginator.get_page(cursor)
+            self.assertEqual(
+                [product.pk for product in page],
+                [product.pk for product in reversed(self.products[-2:])],
+            )
+            self.assertFalse(page.has_previous())
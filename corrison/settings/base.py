@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "rest_framework",
     "rest_framework_simplejwt",
@@ -155,9 +156,16 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
 # Session settings (keeping minimal for admin only)
+# Set SESSION_ENGINE to "django.contrib.sessions.backends.cache" to keep
+# sessions out of the database entirely
+SESSION_ENGINE = env("SESSION_ENGINE", default="django.contrib.sessions.backends.db")
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # 1 week
 SESSION_SAVE_EVERY_REQUEST = True
 
+# Cache alias serving cart reads (see cart.services.store); unset keeps
+# every cart read in the database
+CART_STORE_CACHE = env("CART_STORE_CACHE", default=None)
+
 CORS_SUPPORT_CREDENTIALS = True
 
 # Stripe settings
@@ -207,6 +215,12 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory by default. Point CACHE_URL at a shared backend such as
+# Redis (redis://127.0.0.1:6379/1) when sessions or carts live in the cache,
+# so every worker process sees the same entries.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 # Appointments settings
 CALENDAR_SETTINGS = {
     "DEFAULT_TIMEZONE": "UTC",
@@ -19,7 +19,7 @@ ALLOWED_HOSTS = [
 # Database in base.py is already set up to use environment variables
 
 # Session Configuration
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+SESSION_ENGINE = env("SESSION_ENGINE", default="django.contrib.sessions.backends.db")
 SESSION_COOKIE_NAME = "sessionid"  # Change back to standard name
 SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_HTTPONLY = True  # Change back to True for security
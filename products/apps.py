@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        try:
+            import products.signals  # noqa: F401
+        except ImportError:
+            pass
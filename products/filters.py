@@ -0,0 +1,16 @@
+# products/filters.py
+from rest_framework import filters
+from .services.search import get_search_backend
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that routes ?search= through the product search engine
+    instead of icontains scans over search_fields.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return get_search_backend().search(queryset, " ".join(search_terms))
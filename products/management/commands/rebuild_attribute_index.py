@@ -0,0 +1,13 @@
+# products/management/commands/rebuild_attribute_index.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.services.attributes import AttributeIndexService
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product attribute set table used by catalog filters"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = AttributeIndexService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} product attributes"))
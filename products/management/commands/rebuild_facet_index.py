@@ -0,0 +1,11 @@
+# products/management/commands/rebuild_facet_index.py
+from django.core.management.base import BaseCommand
+from products.services.facets import FacetIndexService
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized catalog filter facets from scratch"
+
+    def handle(self, *args, **options):
+        count = FacetIndexService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} facet rows"))
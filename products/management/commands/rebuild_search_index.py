@@ -0,0 +1,16 @@
+# products/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from products.services.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.index_products()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt product search index using {backend.__class__.__name__}"
+            )
+        )
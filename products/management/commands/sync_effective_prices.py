@@ -0,0 +1,17 @@
+# products/management/commands/sync_effective_prices.py
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.services.facets import FacetIndexService
+from products.services.merchandising import MerchandisingService
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored effective price and sale flag of every product"
+
+    def handle(self, *args, **options):
+        count = Product.objects.sync_effective_prices()
+        # Queryset updates skip the signals that keep facets and
+        # merchandising blocks fresh
+        FacetIndexService.rebuild()
+        MerchandisingService.refresh_all()
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} products"))
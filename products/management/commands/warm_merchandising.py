@@ -0,0 +1,11 @@
+# products/management/commands/warm_merchandising.py
+from django.core.management.base import BaseCommand
+from products.services.merchandising import MerchandisingService
+
+
+class Command(BaseCommand):
+    help = "Pre-warm the merchandising blocks and related product lists"
+
+    def handle(self, *args, **options):
+        count = MerchandisingService.warm()
+        self.stdout.write(self.style.SUCCESS(f"Warmed {count} merchandising entries"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_alter_product_in_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('on_sale_count', models.PositiveIntegerField(default=0)),
+                ('in_stock_count', models.PositiveIntegerField(default=0)),
+                ('attributes', models.JSONField(blank=True, default=list, help_text='Attribute values with the number of products offering each')),
+                ('category', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='facet', to='products.category')),
+            ],
+            options={
+                'verbose_name': 'Category Facet',
+                'verbose_name_plural': 'Category Facets',
+            },
+        ),
+    ]
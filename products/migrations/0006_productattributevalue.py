@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_attribute_index(apps, schema_editor):
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductAttributeValue = apps.get_model('products', 'ProductAttributeValue')
+    links = ProductVariant.attributes.through.objects.values_list(
+        'productvariant__product_id',
+        'attributevalue_id',
+        'attributevalue__attribute_id',
+    ).distinct()
+    ProductAttributeValue.objects.bulk_create(
+        [
+            ProductAttributeValue(
+                product_id=product_id,
+                attribute_id=attribute_id,
+                attribute_value_id=value_id,
+            )
+            for product_id, value_id, attribute_id in links
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttributeValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.attribute')),
+                ('attribute_value', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.attributevalue')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attribute_index', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Product Attribute Value',
+                'verbose_name_plural': 'Product Attribute Values',
+                'indexes': [models.Index(fields=['attribute_value', 'product'], name='product_attr_value_idx')],
+                'unique_together': {('product', 'attribute_value')},
+            },
+        ),
+        migrations.RunPython(populate_attribute_index, migrations.RunPython.noop),
+    ]
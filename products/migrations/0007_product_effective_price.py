@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+def populate_effective_prices(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    on_sale = models.Q(sale_price__isnull=False, sale_price__lt=models.F('price'))
+    Product.objects.update(
+        is_on_sale=models.Case(
+            models.When(on_sale, then=models.Value(True)),
+            default=models.Value(False),
+        ),
+        effective_price=models.Case(
+            models.When(on_sale, then=models.F('sale_price')),
+            default=models.F('price'),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productattributevalue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_id',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_on_sale',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='product_effective_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_on_sale'], name='products_pr_is_on_s_c25054_idx'),
+        ),
+        migrations.RunPython(populate_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+def populate_attribute_signatures(apps, schema_editor):
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    value_ids = {}
+    links = ProductVariant.attributes.through.objects.values_list(
+        'productvariant_id', 'attributevalue_id'
+    )
+    for variant_id, value_id in links:
+        value_ids.setdefault(variant_id, set()).add(value_id)
+
+    # Variants duplicating the options of an earlier one keep no signature
+    seen = set()
+    variants = list(ProductVariant.objects.order_by('pk'))
+    for variant in variants:
+        ids = sorted(value_ids.get(variant.pk, ()))
+        signature = ','.join(str(pk) for pk in ids) or None
+        if signature is not None and (variant.product_id, signature) in seen:
+            signature = None
+        seen.add((variant.product_id, signature))
+        variant.attribute_signature = signature
+    ProductVariant.objects.bulk_update(variants, ['attribute_signature'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='attribute_signature',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_attribute_signatures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(fields=('product', 'attribute_signature'), name='unique_variant_signature'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_productvariant_attribute_signature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='pricing_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
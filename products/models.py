@@ -1,9 +1,50 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Now, Substr
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from core.models import TimestampedModel, SluggedModel, PublishableModel, SEOModel
 
 
+class CategoryManager(models.Manager):
+    """
+    Custom manager for Category model.
+    """
+
+    def rebuild_paths(self):
+        """
+        Recompute every materialized path and depth from the parent links,
+        e.g. after loading fixtures written without them.
+
+        Returns:
+            int: Number of categories updated
+        """
+        categories = {category.pk: category for category in self.all()}
+        paths = {}
+
+        def path_for(category_id, seen=()):
+            if category_id not in paths:
+                parent_id = categories[category_id].parent_id
+                prefix = ""
+                if parent_id in categories and parent_id not in seen:
+                    prefix = path_for(parent_id, seen + (category_id,))
+                paths[category_id] = f"{prefix}{category_id}/"
+            return paths[category_id]
+
+        changed = []
+        for category in categories.values():
+            path = path_for(category.pk)
+            if category.path != path:
+                category.path = path
+                category.depth = path.count("/") - 1
+                changed.append(category)
+        self.bulk_update(changed, ["path", "depth"], batch_size=500)
+        return len(changed)
+
+
 class Category(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
     """
     Product category model.
@@ -15,6 +56,13 @@ class Category(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
     )
     image = models.ImageField(upload_to="categories", blank=True, null=True)
 
+    # Materialized path of ancestor ids, e.g. "1/5/12/", maintained in save()
+    # so a whole subtree is one indexed prefix query
+    path = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = CategoryManager()
+
     class Meta:
         verbose_name = _("Category")
         verbose_name_plural = _("Categories")
@@ -30,6 +78,59 @@ class Category(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
     def get_absolute_url(self):
         return reverse("products:category_detail", args=[self.slug])
 
+    def _stored_paths(self):
+        """Read this category's and its parent's paths from the database"""
+        ids = [pk for pk in (self.pk, self.parent_id) if pk]
+        stored = dict(Category.objects.filter(pk__in=ids).values_list("id", "path"))
+        if "" in stored.values():
+            # Rows loaded without paths; backfill them before relying on them
+            Category.objects.rebuild_paths()
+            stored = dict(Category.objects.filter(pk__in=ids).values_list("id", "path"))
+        parent_path = stored.get(self.parent_id, "") if self.parent_id else ""
+        old_path = stored.get(self.pk, "") if self.pk else ""
+        return parent_path, old_path
+
+    def _validate_parent(self, parent_path, old_path):
+        if self.parent_id and (
+            self.parent_id == self.pk or (old_path and parent_path.startswith(old_path))
+        ):
+            raise ValidationError(
+                {"parent": _("A category cannot be moved under its own subtree.")}
+            )
+
+    def clean(self):
+        super().clean()
+        self._validate_parent(*self._stored_paths())
+
+    def save(self, *args, **kwargs):
+        """Override save to keep the materialized paths of the subtree in step"""
+        # Read paths from the database, in-memory instances may be stale
+        parent_path, old_path = self._stored_paths()
+        self._validate_parent(parent_path, old_path)
+
+        super().save(*args, **kwargs)
+
+        new_path = f"{parent_path}{self.pk}/"
+        if new_path == old_path:
+            return
+
+        depth = new_path.count("/") - 1
+        Category.objects.filter(pk=self.pk).update(path=new_path, depth=depth)
+        if old_path:
+            # Re-root every descendant in one UPDATE
+            Category.objects.filter(path__startswith=old_path).exclude(
+                pk=self.pk
+            ).update(
+                path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+                depth=F("depth") + (depth - (old_path.count("/") - 1)),
+            )
+        self.path = new_path
+        self.depth = depth
+
+    def get_ancestor_ids(self):
+        """Returns the ids from this category up to the root, without a query"""
+        return [int(pk) for pk in reversed(self.path.split("/")[:-1])]
+
 
 class ProductManager(models.Manager):
     """
@@ -56,6 +157,29 @@ class ProductManager(models.Manager):
         """Returns only digital products"""
         return self.active().filter(product_type="digital")
 
+    def sync_effective_prices(self):
+        """
+        Recompute the stored is_on_sale and effective_price columns in a
+        single UPDATE. Use after bulk price changes that bypass save().
+        updated_at is bumped too, which retires cached representations.
+
+        Returns:
+            int: Number of products updated
+        """
+        on_sale = models.Q(sale_price__isnull=False, sale_price__lt=models.F("price"))
+        return self.update(
+            is_on_sale=models.Case(
+                models.When(on_sale, then=models.Value(True)),
+                default=models.Value(False),
+            ),
+            effective_price=models.Case(
+                models.When(on_sale, then=models.F("sale_price")),
+                default=models.F("price"),
+            ),
+            pricing_version=models.F("pricing_version") + 1,
+            updated_at=Now(),
+        )
+
     def in_stock(self):
         """Returns products that are in stock"""
         return self.active().filter(in_stock=True)
@@ -94,6 +218,15 @@ class Product(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
     sale_price = models.DecimalField(
         max_digits=10, decimal_places=2, blank=True, null=True
     )
+    # Denormalized from price and sale_price in save() so sale-aware
+    # filters and sorts can use an index
+    is_on_sale = models.BooleanField(default=False, editable=False)
+    effective_price = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )
+    # Bumped whenever a price of the product or one of its variants
+    # changes, so cart price snapshots know when to revalidate
+    pricing_version = models.PositiveIntegerField(default=0, editable=False)
 
     # Physical product fields
     requires_shipping = models.BooleanField(
@@ -142,6 +275,9 @@ class Product(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
     # Image fields
     main_image = models.ImageField(upload_to="products")
 
+    # Full-text search document, maintained by products.services.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
     # SEO fields (inherited from SEOModel)
 
     objects = ProductManager()
@@ -156,6 +292,18 @@ class Product(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
             models.Index(fields=["is_featured"]),
             models.Index(fields=["in_stock"]),
             models.Index(fields=["product_type"]),
+            # Keyset pagination seeks on (sort field, id)
+            models.Index(fields=["created_at", "id"], name="product_created_id"),
+            models.Index(
+                fields=["effective_price", "id"], name="product_effective_price_id"
+            ),
+            models.Index(fields=["is_on_sale"]),
+            models.Index(fields=["name", "id"], name="product_name_id"),
+            # Only created on PostgreSQL, see migration 0004
+            GinIndex(fields=["search_vector"], name="product_search_vector_gin"),
+            GinIndex(
+                fields=["name"], name="product_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
         ]
 
     def __str__(self):
@@ -181,29 +329,62 @@ class Product(SluggedModel, TimestampedModel, PublishableModel, SEOModel):
             self.download_expiry_days = None
             self.requires_shipping = True
 
-        super().save(*args, **kwargs)
-
-    @property
-    def is_on_sale(self):
-        """
-        Returns True if product has a sale price and it's lower than the regular price.
-        """
-        return self.sale_price is not None and self.sale_price < self.price
+        # Keep the denormalized price columns in step
+        self.is_on_sale = self.sale_price is not None and self.sale_price < self.price
+        self.effective_price = self.current_price
+        prices = (self.price, self.sale_price)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"price", "sale_price"} & set(update_fields):
+            update_fields = {*update_fields, "is_on_sale", "effective_price"}
+        bump = False
+        if not self._state.adding and not kwargs.get("force_insert"):
+            # pricing_version is only bumped in the database, so a stale
+            # instance never overwrites a concurrent bump, e.g. from a
+            # variant save
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = {
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                }
+            update_fields = set(update_fields) - {"pricing_version"}
+            bump = prices != getattr(self, "_loaded_prices", None) and bool(
+                {"price", "sale_price"} & update_fields
+            )
+        if update_fields is not None:
+            kwargs["update_fields"] = update_fields
+
+        with transaction.atomic(using=kwargs.get("using")):
+            if bump:
+                # Bumped before the save, so post_save receivers see it
+                stored = Product.objects.filter(pk=self.pk)
+                stored.update(pricing_version=F("pricing_version") + 1)
+                self.pricing_version = stored.values_list(
+                    "pricing_version", flat=True
+                ).get()
+            super().save(*args, **kwargs)
+        self._loaded_prices = prices
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Prices as loaded, to tell in save() whether they changed
+        instance._loaded_prices = (
+            instance.__dict__.get("price"),
+            instance.__dict__.get("sale_price"),
+        )
+        return instance
 
     @property
     def current_price(self):
         """
         Returns the current price (sale price if available, otherwise regular price).
         """
-        if self.is_on_sale:
+        if self.sale_price is not None and self.sale_price < self.price:
             return self.sale_price
         return self.price
 
-    @property
-    def effective_price(self):
-        """Returns current price for API serialization"""
-        return self.current_price
-
     @property
     def is_digital(self):
         """Returns True if this is a digital product"""
@@ -317,11 +498,22 @@ class ProductVariant(TimestampedModel, PublishableModel):
     attributes = models.ManyToManyField(
         AttributeValue, related_name="variants", blank=True
     )
+    # Sorted attribute value ids, e.g. "3,7,12", maintained by
+    # products.services.attributes so a selection resolves in one lookup
+    attribute_signature = models.CharField(
+        max_length=255, null=True, blank=True, editable=False
+    )
 
     class Meta:
         verbose_name = _("Product Variant")
         verbose_name_plural = _("Product Variants")
         unique_together = [("product", "sku")]  # SKU unique per product
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "attribute_signature"],
+                name="unique_variant_signature",
+            ),
+        ]
 
     def __str__(self):
         if self.name:
@@ -333,6 +525,24 @@ class ProductVariant(TimestampedModel, PublishableModel):
             else self.product.name
         )
 
+    def save(self, *args, **kwargs):
+        adjustment_changed = self.price_adjustment != getattr(
+            self, "_loaded_price_adjustment", None
+        )
+        super().save(*args, **kwargs)
+        self._loaded_price_adjustment = self.price_adjustment
+        if adjustment_changed:
+            # Variant prices derive from the product's pricing
+            Product.objects.filter(pk=self.product_id).update(
+                pricing_version=models.F("pricing_version") + 1
+            )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price_adjustment = instance.__dict__.get("price_adjustment")
+        return instance
+
     @property
     def price(self):
         """
@@ -353,3 +563,79 @@ class ProductVariant(TimestampedModel, PublishableModel):
     def effective_digital_file(self):
         """Returns the digital file for this variant or falls back to product file"""
         return self.digital_file or self.product.digital_file
+
+
+class ProductAttributeValue(models.Model):
+    """
+    Set table of the attribute values offered by each product's variants.
+    Maintained by products.services.attributes so attribute filters can
+    intersect on integer ids instead of joining through variants.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="attribute_index", on_delete=models.CASCADE
+    )
+    attribute = models.ForeignKey(
+        Attribute, related_name="+", on_delete=models.CASCADE
+    )
+    attribute_value = models.ForeignKey(
+        AttributeValue, related_name="+", on_delete=models.CASCADE
+    )
+
+    class Meta:
+        verbose_name = _("Product Attribute Value")
+        verbose_name_plural = _("Product Attribute Values")
+        unique_together = ("product", "attribute_value")
+        indexes = [
+            models.Index(
+                fields=["attribute_value", "product"], name="product_attr_value_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.attribute_value_id}"
+
+
+class CategoryFacet(TimestampedModel):
+    """
+    Materialized filter facets for a category subtree.
+    A row with no category holds the facets for the whole catalog.
+    """
+
+    category = models.OneToOneField(
+        Category,
+        null=True,
+        blank=True,
+        related_name="facet",
+        on_delete=models.CASCADE,
+    )
+    product_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    on_sale_count = models.PositiveIntegerField(default=0)
+    in_stock_count = models.PositiveIntegerField(default=0)
+    attributes = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Attribute values with the number of products offering each",
+    )
+
+    class Meta:
+        verbose_name = _("Category Facet")
+        verbose_name_plural = _("Category Facets")
+
+    def __str__(self):
+        if self.category_id:
+            return f"Facets for {self.category}"
+        return "Facets for all products"
+
+    def as_filters(self):
+        """
+        Returns the facets in the format used by the catalog filter sidebar.
+        """
+        return {
+            "price_range": {"min": self.min_price, "max": self.max_price},
+            "on_sale": {"count": self.on_sale_count},
+            "in_stock": {"count": self.in_stock_count},
+            "attributes": self.attributes,
+        }
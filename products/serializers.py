@@ -1,6 +1,54 @@
 # products/serializers.py
+import hashlib
+
+from django.db import models
 from rest_framework import serializers
 from .models import Product, Category, ProductVariant, ProductImage
+from .services.representations import ProductRepresentationCache
+
+# Host used for media URLs when there is no request in the context
+FALLBACK_MEDIA_HOST = "https://corrison.corrisonapi.com"
+
+# Media URL fields in a product representation, top level and nested
+PRODUCT_URL_FIELDS = ("main_image", "digital_file", "digital_file_url")
+NESTED_URL_FIELDS = {
+    "category": ("image",),
+    "images": ("image",),
+    "variants": ("digital_file", "effective_digital_file"),
+}
+
+
+def get_media_host(request=None):
+    """Return the scheme and host that media paths are resolved against"""
+    if request is None:
+        return FALLBACK_MEDIA_HOST
+    return request.build_absolute_uri("/").rstrip("/")
+
+
+def rewrite_media_urls(data, rewrite):
+    """
+    Return a copy of a product representation with every media URL passed
+    through rewrite. Only the dicts holding URLs are copied.
+    """
+    data = dict(data)
+    for field in PRODUCT_URL_FIELDS:
+        if data.get(field):
+            data[field] = rewrite(data[field])
+
+    for name, fields in NESTED_URL_FIELDS.items():
+        value = data.get(name)
+        if not value:
+            continue
+        items = [value] if isinstance(value, dict) else value
+        rewritten = []
+        for item in items:
+            item = dict(item)
+            for field in fields:
+                if item.get(field):
+                    item[field] = rewrite(item[field])
+            rewritten.append(item)
+        data[name] = rewritten[0] if isinstance(value, dict) else rewritten
+    return data
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -36,15 +84,44 @@ class ProductVariantSerializer(serializers.ModelSerializer):
     def get_effective_digital_file(self, obj):
         """Return the effective digital file URL for this variant"""
         file = obj.effective_digital_file
-        if file:
-            return (
-                self.context["request"].build_absolute_uri(file.url)
-                if hasattr(file, "url")
-                else None
-            )
+        if file and hasattr(file, "url"):
+            request = self.context.get("request")
+            if request:
+                return request.build_absolute_uri(file.url)
+            return f"{FALLBACK_MEDIA_HOST}{file.url}"
         return None
 
 
+class CachedProductListSerializer(serializers.ListSerializer):
+    """
+    Assembles product lists from cached per-product representations,
+    serializing only the products that miss the cache.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        products = list(iterable)
+
+        fieldset = self.child.get_fieldset_key()
+        representations = ProductRepresentationCache.get_many(products, fieldset)
+        missing = {
+            product: self.child.build_representation(product)
+            for product in products
+            if product.pk not in representations
+        }
+        if missing:
+            ProductRepresentationCache.set_many(missing, fieldset)
+            representations.update(
+                {product.pk: data for product, data in missing.items()}
+            )
+
+        host = get_media_host(self.context.get("request"))
+        return [
+            self.child.with_media_host(representations[product.pk], host)
+            for product in products
+        ]
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
@@ -59,6 +136,9 @@ class ProductSerializer(serializers.ModelSerializer):
     # Fixed main_image field
     main_image = serializers.SerializerMethodField()
 
+    # Relations that sparse fieldsets only include when expanded
+    EXPANDABLE_FIELDS = ("category", "images", "variants")
+
     class Meta:
         model = Product
         fields = [
@@ -93,38 +173,38 @@ class ProductSerializer(serializers.ModelSerializer):
             "dimensions",
         ]
         read_only_fields = ["id"]  # Explicitly mark id as read-only
+        list_serializer_class = CachedProductListSerializer
 
-    def get_main_image(self, obj):
-        """Return main image URL with fallback to primary ProductImage"""
-        request = self.context.get(
-            "request"
-        )  # FIXED: Use .get() instead of direct access
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset: only these fields are serialized
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
-        # First try the main_image field
-        if obj.main_image:
-            if request:
-                return request.build_absolute_uri(obj.main_image.url)
-            else:
-                # No request context, build absolute URL manually
-                return f"https://corrison.corrisonapi.com{obj.main_image.url}"
-
-        # Fallback to primary ProductImage
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
-            if request:
-                return request.build_absolute_uri(primary_image.image.url)
-            else:
-                return f"https://corrison.corrisonapi.com{primary_image.image.url}"
+    def get_fieldset_key(self):
+        """Identify this serializer's field set for the representation cache"""
+        names = ",".join(self.fields)
+        if names == ",".join(ProductSerializer.Meta.fields):
+            return "full"
+        return hashlib.md5(names.encode()).hexdigest()[:12]
 
-        # Fallback to first image if no primary
-        first_image = obj.images.first()
-        if first_image:
-            if request:
-                return request.build_absolute_uri(first_image.image.url)
-            else:
-                return f"https://corrison.corrisonapi.com{first_image.image.url}"
+    def get_main_image(self, obj):
+        """Return main image URL with fallback to primary ProductImage"""
+        image = obj.main_image
+        if not image:
+            # Images are ordered primary first, so this falls back to the
+            # primary image, then the first one, using any prefetch
+            images = list(obj.images.all())
+            image = images[0].image if images else None
+        if not image:
+            return None
 
-        return None
+        request = self.context.get("request")
+        if request:
+            return request.build_absolute_uri(image.url)
+        return f"{FALLBACK_MEDIA_HOST}{image.url}"
 
     def get_digital_file_url(self, obj):
         """Return the digital file URL if it exists"""
@@ -136,12 +216,32 @@ class ProductSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.digital_file.url)
             elif hasattr(obj.digital_file, "url"):
                 # Fallback when no request context
-                return f"https://corrison.corrisonapi.com{obj.digital_file.url}"
+                return f"{FALLBACK_MEDIA_HOST}{obj.digital_file.url}"
         return None
 
     def to_representation(self, instance):
-        """Convert price fields to floats"""
+        """Serve the cached representation, filling in the request host"""
+        fieldset = self.get_fieldset_key()
+        data = ProductRepresentationCache.get(instance, fieldset)
+        if data is None:
+            data = self.build_representation(instance)
+            ProductRepresentationCache.set_many({instance: data}, fieldset)
+        return self.with_media_host(data)
+
+    def with_media_host(self, data, host=None):
+        """Resolve the host-relative media URLs of a cached representation"""
+        host = host or get_media_host(self.context.get("request"))
+        return rewrite_media_urls(
+            data, lambda url: f"{host}{url}" if url.startswith("/") else url
+        )
+
+    def build_representation(self, instance):
+        """
+        Serialize a product with prices as floats and host-relative media
+        URLs, ready to be cached.
+        """
         data = super().to_representation(instance)
+        host = get_media_host(self.context.get("request"))
 
         # Convert price fields to floats
         if "price" in data and data["price"] is not None:
@@ -168,4 +268,22 @@ class ProductSerializer(serializers.ModelSerializer):
             except (ValueError, TypeError):
                 data["effective_price"] = 0.0
 
-        return data
+        return rewrite_media_urls(
+            data, lambda url: url[len(host) :] if url.startswith(f"{host}/") else url
+        )
+
+
+class ProductListSerializer(ProductSerializer):
+    """
+    Lightweight product card for list endpoints and storefront grids.
+    """
+
+    class Meta(ProductSerializer.Meta):
+        fields = [
+            "id",
+            "name",
+            "slug",
+            "price",
+            "current_price",
+            "main_image",
+        ]
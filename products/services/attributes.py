@@ -0,0 +1,242 @@
+# products/services/attributes.py
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from products.models import AttributeValue, ProductAttributeValue, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+
+class AttributeIndexService:
+    """
+    Maintains the ProductAttributeValue set table and the variant attribute
+    signatures, and resolves attribute selections against them.
+    """
+
+    @staticmethod
+    def _rows_for(product_ids=None):
+        links = ProductVariant.attributes.through.objects.all()
+        if product_ids is not None:
+            links = links.filter(productvariant__product_id__in=product_ids)
+
+        return [
+            ProductAttributeValue(
+                product_id=product_id,
+                attribute_id=attribute_id,
+                attribute_value_id=value_id,
+            )
+            for product_id, value_id, attribute_id in links.values_list(
+                "productvariant__product_id",
+                "attributevalue_id",
+                "attributevalue__attribute_id",
+            ).distinct()
+        ]
+
+    @staticmethod
+    def sync_products(product_ids):
+        """
+        Recompute the attribute set of the given products.
+
+        Args:
+            product_ids (iterable): Ids of products whose variants changed
+        """
+        product_ids = [pk for pk in set(product_ids) if pk is not None]
+        if not product_ids:
+            return
+        ProductAttributeValue.objects.filter(product_id__in=product_ids).delete()
+        ProductAttributeValue.objects.bulk_create(
+            AttributeIndexService._rows_for(product_ids), ignore_conflicts=True
+        )
+
+    @staticmethod
+    def rebuild():
+        """
+        Rebuild the whole set table from the variant attribute links.
+
+        Returns:
+            int: Number of rows written
+        """
+        rows = AttributeIndexService._rows_for()
+        ProductAttributeValue.objects.all().delete()
+        ProductAttributeValue.objects.bulk_create(
+            rows, batch_size=1000, ignore_conflicts=True
+        )
+        return len(rows)
+
+    @staticmethod
+    def filter_products(queryset, selection):
+        """
+        Restrict a product queryset to products offering every selected
+        attribute value, using one IN subquery over integer ids.
+
+        Args:
+            queryset (QuerySet): Product queryset to filter
+            selection (dict): Dictionary of attribute_id: value
+
+        Returns:
+            QuerySet: The filtered queryset
+        """
+        selection = {
+            int(attr_id): value
+            for attr_id, value in selection.items()
+            if str(attr_id).isdigit() and value
+        }
+        if not selection:
+            return queryset
+
+        conditions = Q()
+        for attr_id, value in selection.items():
+            conditions |= Q(attribute_id=attr_id, value=value)
+        value_ids = list(
+            AttributeValue.objects.filter(conditions).values_list("id", flat=True)
+        )
+        if len(value_ids) < len(selection):
+            # At least one selected value does not exist
+            return queryset.none()
+
+        matching = (
+            ProductAttributeValue.objects.filter(attribute_value_id__in=value_ids)
+            .values("product_id")
+            .annotate(matched=Count("attribute_value_id"))
+            .filter(matched=len(value_ids))
+            .values("product_id")
+        )
+        return queryset.filter(id__in=matching)
+
+    @staticmethod
+    def build_signature(value_ids):
+        """
+        Build the canonical signature of a set of attribute value ids.
+
+        Args:
+            value_ids (iterable): Attribute value ids
+
+        Returns:
+            str: Sorted, comma separated ids, or None for an empty set
+        """
+        return ",".join(str(pk) for pk in sorted({int(pk) for pk in value_ids})) or None
+
+    @staticmethod
+    def sync_variant_signatures(variant_ids):
+        """
+        Recompute the attribute signature of the given variants.
+
+        A variant whose options duplicate another variant of the same
+        product keeps no signature, since it could never be resolved.
+
+        Args:
+            variant_ids (iterable): Ids of variants whose attributes changed
+        """
+        variant_ids = [pk for pk in set(variant_ids) if pk is not None]
+        if not variant_ids:
+            return
+
+        value_ids = defaultdict(list)
+        links = ProductVariant.attributes.through.objects.filter(
+            productvariant_id__in=variant_ids
+        ).values_list("productvariant_id", "attributevalue_id")
+        for variant_id, value_id in links:
+            value_ids[variant_id].append(value_id)
+
+        for variant_id in variant_ids:
+            signature = AttributeIndexService.build_signature(value_ids[variant_id])
+            variants = ProductVariant.objects.filter(pk=variant_id)
+            try:
+                with transaction.atomic():
+                    variants.update(attribute_signature=signature)
+            except IntegrityError:
+                logger.warning(
+                    f"Variant {variant_id} has the same options as another variant"
+                )
+                variants.update(attribute_signature=None)
+
+    @staticmethod
+    def resolve_variant(product, selection):
+        """
+        Resolve the active variant matching an attribute selection with one
+        equality lookup on the variant signature. Partial selections fall
+        back to the first variant offering every selected value.
+
+        Args:
+            product (Product): The product
+            selection (dict): Dictionary of attribute_id: value_id
+
+        Returns:
+            ProductVariant: The product variant or None if not found
+        """
+        try:
+            signature = AttributeIndexService.build_signature(selection.values())
+        except (TypeError, ValueError):
+            return None
+
+        variants = ProductVariant.objects.filter(product=product, is_active=True)
+        if signature is None:
+            variant = variants.order_by("pk").first()
+        else:
+            variant = variants.filter(attribute_signature=signature).first()
+
+        if variant is None and signature is not None:
+            wanted = set(signature.split(","))
+            candidates = (
+                variants.exclude(attribute_signature=None)
+                .order_by("pk")
+                .values_list("pk", "attribute_signature")
+            )
+            for pk, candidate in candidates:
+                if wanted <= set(candidate.split(",")):
+                    variant = variants.filter(pk=pk).first()
+                    break
+
+        if variant is not None:
+            variant.product = product
+        return variant
+
+    @staticmethod
+    def get_variant_matrix(product):
+        """
+        Build the whole variant matrix of a product in two queries, for the
+        client to resolve option selections without further requests.
+
+        Args:
+            product (Product): The product
+
+        Returns:
+            dict: The product's attributes with their values, and active
+                variants keyed by attribute signature
+        """
+        attributes = {}
+        rows = (
+            ProductAttributeValue.objects.filter(product=product)
+            .select_related("attribute", "attribute_value")
+            .order_by("attribute_id", "attribute_value__value")
+        )
+        for row in rows:
+            attribute = attributes.setdefault(
+                row.attribute_id,
+                {"id": row.attribute_id, "name": row.attribute.name, "values": []},
+            )
+            attribute["values"].append(
+                {"id": row.attribute_value_id, "value": row.attribute_value.value}
+            )
+
+        # Variant prices are the product's stored prices plus the adjustment
+        variants = {}
+        for variant in ProductVariant.objects.filter(
+            product=product, is_active=True
+        ).exclude(attribute_signature=None):
+            variants[variant.attribute_signature] = {
+                "id": variant.id,
+                "sku": variant.sku,
+                "price": product.price + variant.price_adjustment,
+                "effective_price": product.effective_price + variant.price_adjustment,
+                "is_on_sale": product.is_on_sale,
+                "stock_qty": variant.stock_qty,
+            }
+
+        return {
+            "product_id": product.id,
+            "attributes": list(attributes.values()),
+            "variants": variants,
+        }
@@ -1,7 +1,11 @@
 # products/services/catalog.py
-from django.db.models import Count, Q
-from django.core.paginator import Paginator
-from products.models import Product, Category, ProductVariant, AttributeValue
+from core.pagination import KeysetPaginator
+from products.models import Product, Category, ProductVariant
+from products.services.attributes import AttributeIndexService
+from products.services.categories import CategoryTreeService
+from products.services.facets import FacetIndexService
+from products.services.merchandising import MerchandisingService
+from products.services.search import get_search_backend
 
 
 class CatalogService:
@@ -10,6 +14,15 @@ class CatalogService:
     This separates business logic from views.
     """
     
+    # Catalog sort options and the keyset ordering each one paginates on
+    SORT_ORDERINGS = {
+        'newest': '-created_at',
+        'price_low': 'effective_price',
+        'price_high': '-effective_price',
+        'name_asc': 'name',
+        'name_desc': '-name',
+    }
+    
     @staticmethod
     def get_featured_products(limit=8):
         """
@@ -19,11 +32,9 @@ class CatalogService:
             limit (int): Number of products to return
             
         Returns:
-            QuerySet: A queryset of featured products
+            list: Featured products, from the merchandising cache
         """
-        return Product.objects.active().filter(
-            is_featured=True
-        ).select_related('category').prefetch_related('images')[:limit]
+        return MerchandisingService.get_block_products('featured', limit)
     
     @staticmethod
     def get_new_arrivals(limit=8):
@@ -34,11 +45,9 @@ class CatalogService:
             limit (int): Number of products to return
             
         Returns:
-            QuerySet: A queryset of new products
+            list: New products, from the merchandising cache
         """
-        return Product.objects.active().order_by(
-            '-created_at'
-        ).select_related('category').prefetch_related('images')[:limit]
+        return MerchandisingService.get_block_products('new_arrivals', limit)
     
     @staticmethod
     def get_on_sale_products(limit=8):
@@ -49,11 +58,9 @@ class CatalogService:
             limit (int): Number of products to return
             
         Returns:
-            QuerySet: A queryset of sale products
+            list: Sale products, from the merchandising cache
         """
-        return Product.objects.active().filter(
-            sale_price__isnull=False
-        ).select_related('category').prefetch_related('images')[:limit]
+        return MerchandisingService.get_block_products('on_sale', limit)
     
     @staticmethod
     def get_product_by_slug(slug):
@@ -88,14 +95,9 @@ class CatalogService:
             limit (int): Number of products to return
             
         Returns:
-            QuerySet: A queryset of related products
+            list: Related products, precomputed per product
         """
-        # Get products in the same category, excluding the current product
-        return Product.objects.active().filter(
-            category=product.category
-        ).exclude(
-            id=product.id
-        ).select_related('category').prefetch_related('images')[:limit]
+        return MerchandisingService.get_related_products(product, limit)
     
     @staticmethod
     def get_product_variants(product):
@@ -128,12 +130,21 @@ class CatalogService:
         Returns:
             ProductVariant: The product variant or None if not found
         """
-        variants = ProductVariant.objects.filter(product=product, is_active=True)
-        
-        for attr_id, value_id in attribute_values.items():
-            variants = variants.filter(attributes__id=value_id)
+        # One equality lookup on the stored attribute signature
+        return AttributeIndexService.resolve_variant(product, attribute_values)
+    
+    @staticmethod
+    def get_variant_matrix(product):
+        """
+        Get a product's whole variant matrix in one compact payload.
         
-        return variants.first()
+        Args:
+            product (Product): The product
+            
+        Returns:
+            dict: Attributes with their values and variants keyed by signature
+        """
+        return AttributeIndexService.get_variant_matrix(product)
     
     @staticmethod
     def get_categories(parent=None, include_inactive=False):
@@ -159,6 +170,16 @@ class CatalogService:
             
         return queryset.prefetch_related('children')
     
+    @staticmethod
+    def get_category_tree():
+        """
+        Get the nested tree of active categories for navigation menus.
+        
+        Returns:
+            list: Cached root category dicts with nested children
+        """
+        return CategoryTreeService.get_tree()
+    
     @staticmethod
     def get_category_by_slug(slug):
         """
@@ -178,18 +199,18 @@ class CatalogService:
             return None
     
     @staticmethod
-    def get_products_by_category(category_slug, page=1, per_page=12, **filters):
+    def get_products_by_category(category_slug, cursor=None, per_page=12, **filters):
         """
-        Get products in a specific category with pagination.
+        Get products in a specific category with keyset pagination.
         
         Args:
             category_slug (str): Category slug
-            page (int): Page number
+            cursor (str, optional): Opaque cursor from a previous page
             per_page (int): Number of products per page
             **filters: Additional filters
             
         Returns:
-            tuple: (Paginator, Page, QuerySet, bool) - paginator, current page, queryset, has_filters
+            tuple: (KeysetPaginator, KeysetPage, QuerySet, bool) - paginator, current page, queryset, has_filters
         """
         has_filters = bool(filters)
         
@@ -202,12 +223,10 @@ class CatalogService:
         if category_slug:
             try:
                 category = Category.objects.get(slug=category_slug, is_active=True)
-                # Get all child categories as well
-                categories = [category]
-                children = category.children.filter(is_active=True)
-                categories.extend(children)
-                
-                queryset = queryset.filter(category__in=categories)
+                # Include the whole active subtree, at any depth
+                queryset = queryset.filter(
+                    category_id__in=CategoryTreeService.get_subtree_ids(category)
+                )
             except Category.DoesNotExist:
                 queryset = queryset.none()
         
@@ -216,76 +235,70 @@ class CatalogService:
         max_price = filters.get('max_price')
         
         if min_price:
-            queryset = queryset.filter(price__gte=min_price)
+            queryset = queryset.filter(effective_price__gte=min_price)
             
         if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        # Apply sort order
-        sort = filters.get('sort', 'newest')
+            queryset = queryset.filter(effective_price__lte=max_price)
         
-        if sort == 'newest':
-            queryset = queryset.order_by('-created_at')
-        elif sort == 'price_low':
-            queryset = queryset.order_by('price')
-        elif sort == 'price_high':
-            queryset = queryset.order_by('-price')
-        elif sort == 'name_asc':
-            queryset = queryset.order_by('name')
-        elif sort == 'name_desc':
-            queryset = queryset.order_by('-name')
-        else:
-            queryset = queryset.order_by('-created_at')
+        # Sort order is applied by the keyset paginator
+        ordering = CatalogService.SORT_ORDERINGS.get(
+            filters.get('sort', 'newest'), '-created_at'
+        )
         
         # Apply other filters
         if filters.get('on_sale'):
-            queryset = queryset.filter(sale_price__isnull=False)
+            queryset = queryset.filter(is_on_sale=True)
             
         if filters.get('in_stock'):
             queryset = queryset.filter(in_stock=True, stock_qty__gt=0)
             
-        # Apply attribute filters
-        attribute_filters = {k: v for k, v in filters.items() if k.startswith('attr_')}
+        # Apply attribute filters as one semi-join on the attribute index
+        attribute_filters = {
+            k.replace('attr_', ''): v for k, v in filters.items() if k.startswith('attr_')
+        }
         
-        for attr_key, attr_value in attribute_filters.items():
-            attr_id = attr_key.replace('attr_', '')
-            queryset = queryset.filter(
-                variants__attributes__attribute_id=attr_id,
-                variants__attributes__value=attr_value
-            ).distinct()
+        if attribute_filters:
+            queryset = AttributeIndexService.filter_products(
+                queryset, attribute_filters
+            )
         
         # Paginate the results
-        paginator = Paginator(queryset, per_page)
-        current_page = paginator.get_page(page)
+        paginator = KeysetPaginator(queryset, per_page, ordering=ordering)
+        current_page = paginator.get_page(cursor)
         
         return paginator, current_page, queryset, has_filters
     
     @staticmethod
-    def search_products(query, page=1, per_page=12):
+    def search_products(query, cursor=None, per_page=12, product_type=None):
         """
-        Search for products.
+        Search for products, best matches first.
         
         Args:
             query (str): Search query
-            page (int): Page number
+            cursor (str, optional): Opaque cursor from a previous page
             per_page (int): Number of products per page
+            product_type (str, optional): Restrict to physical or digital products
             
         Returns:
-            tuple: (Paginator, Page, QuerySet) - paginator, current page, queryset
+            tuple: (KeysetPaginator, KeysetPage, QuerySet) - paginator, current page, queryset
         """
+        ordering = '-rank'
         if not query:
             queryset = Product.objects.none()
+            ordering = '-created_at'
         else:
-            queryset = Product.objects.active().filter(
-                Q(name__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(sku__icontains=query) |
-                Q(category__name__icontains=query)
-            ).select_related('category').prefetch_related('images').distinct()
+            queryset = Product.objects.active()
+            if product_type:
+                queryset = queryset.filter(product_type=product_type)
+            
+            # Relevance-ordered matches from the configured search engine
+            queryset = get_search_backend().search(
+                queryset, query
+            ).select_related('category').prefetch_related('images')
         
-        # Paginate the results
-        paginator = Paginator(queryset, per_page)
-        current_page = paginator.get_page(page)
+        # Paginate the results on relevance
+        paginator = KeysetPaginator(queryset, per_page, ordering=ordering)
+        current_page = paginator.get_page(cursor)
         
         return paginator, current_page, queryset
     
@@ -300,70 +313,6 @@ class CatalogService:
         Returns:
             dict: Dictionary of available filters
         """
-        # Start with all active products
-        queryset = Product.objects.active()
-        
-        # Filter by category if provided
-        if category:
-            # Get all child categories as well
-            categories = [category]
-            children = category.children.filter(is_active=True)
-            categories.extend(children)
-            
-            queryset = queryset.filter(category__in=categories)
-        
-        # Get min and max prices
-        try:
-            min_price = queryset.order_by('price').first().price
-            max_price = queryset.order_by('-price').first().price
-        except AttributeError:
-            min_price = 0
-            max_price = 0
-        
-        # Get on sale count
-        on_sale_count = queryset.filter(sale_price__isnull=False).count()
-        
-        # Get in stock count
-        in_stock_count = queryset.filter(in_stock=True, stock_qty__gt=0).count()
-        
-        # Get available attributes
-        attribute_values = AttributeValue.objects.filter(
-            variants__product__in=queryset
-        ).select_related('attribute').values(
-            'attribute__id', 'attribute__name', 'value'
-        ).annotate(
-            product_count=Count('variants__product', distinct=True)
-        )
-        
-        # Organize attribute values by attribute
-        attributes = {}
-        for av in attribute_values:
-            attr_id = av['attribute__id']
-            attr_name = av['attribute__name']
-            
-            if attr_id not in attributes:
-                attributes[attr_id] = {
-                    'id': attr_id,
-                    'name': attr_name,
-                    'values': []
-                }
-            
-            attributes[attr_id]['values'].append({
-                'value': av['value'],
-                'product_count': av['product_count']
-            })
-        
-        return {
-            'price_range': {
-                'min': min_price,
-                'max': max_price
-            },
-            'on_sale': {
-                'count': on_sale_count
-            },
-            'in_stock': {
-                'count': in_stock_count
-            },
-            'attributes': list(attributes.values())
-        }
+        # Facets are materialized per category subtree by FacetIndexService
+        return FacetIndexService.get_facets(category)
     
\ No newline at end of file
@@ -0,0 +1,115 @@
+# products/services/categories.py
+from django.core.cache import cache
+from products.models import Category
+
+
+class CategoryTreeService:
+    """
+    Subtree lookups on the materialized Category.path and a cached,
+    serialized category tree for menus and the categories API.
+    """
+
+    CACHE_KEY = "products:category_tree"
+    CACHE_TIMEOUT = 60 * 60
+
+    @staticmethod
+    def filter_subtree(rows, root_path, active_only=True):
+        """
+        Pick the ids of a subtree out of (id, path, is_active) rows.
+        The root is always included; an inactive category hides its whole
+        branch when active_only is set.
+
+        Args:
+            rows (iterable): (id, path, is_active) tuples
+            root_path (str): Materialized path of the subtree root
+            active_only (bool): Skip inactive branches
+
+        Returns:
+            list: Category ids in the subtree, root first
+        """
+        if not root_path:
+            # A root without a path would match every category
+            return []
+        ids = []
+        hidden = []
+        # Sorting on path puts every category after its ancestors
+        for cat_id, path, is_active in sorted(rows, key=lambda row: row[1]):
+            if not path.startswith(root_path):
+                continue
+            if path != root_path:
+                if any(path.startswith(prefix) for prefix in hidden):
+                    continue
+                if active_only and not is_active:
+                    hidden.append(path)
+                    continue
+            ids.append(cat_id)
+        return ids
+
+    @staticmethod
+    def get_subtree_ids(category, active_only=True):
+        """
+        Get the ids of a category and its descendants in one indexed query.
+
+        Args:
+            category (Category): Root category
+            active_only (bool): Skip inactive branches
+
+        Returns:
+            list: Category ids in the subtree
+        """
+        if not category.path:
+            Category.objects.rebuild_paths()
+            category.refresh_from_db(fields=["path", "depth"])
+        rows = Category.objects.filter(path__startswith=category.path).values_list(
+            "id", "path", "is_active"
+        )
+        return CategoryTreeService.filter_subtree(rows, category.path, active_only)
+
+    @staticmethod
+    def _build():
+        nodes = {}
+        roots = []
+        rows = Category.objects.filter(is_active=True).order_by("depth", "name")
+        for category in rows:
+            node = {
+                "id": category.id,
+                "name": category.name,
+                "slug": category.slug,
+                "description": category.description,
+                "image": category.image.url if category.image else None,
+                "parent": category.parent_id,
+                "children": [],
+            }
+            if category.parent_id is None:
+                roots.append(node)
+            elif category.parent_id in nodes:
+                nodes[category.parent_id]["children"].append(node)
+            else:
+                # Under an inactive category
+                continue
+            nodes[category.id] = node
+        return roots
+
+    @staticmethod
+    def get_tree():
+        """
+        Get the nested tree of active categories, cached until a category
+        changes. Image URLs are host-relative.
+
+        Returns:
+            list: Root category dicts, each with a list of children
+        """
+        tree = cache.get(CategoryTreeService.CACHE_KEY)
+        if tree is None:
+            tree = CategoryTreeService._build()
+            cache.set(
+                CategoryTreeService.CACHE_KEY, tree, CategoryTreeService.CACHE_TIMEOUT
+            )
+        return tree
+
+    @staticmethod
+    def invalidate():
+        """
+        Drop the cached tree after a category change.
+        """
+        cache.delete(CategoryTreeService.CACHE_KEY)
@@ -0,0 +1,487 @@
+# products/services/facets.py
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from products.models import Category, CategoryFacet, Product, ProductAttributeValue
+from products.services.categories import CategoryTreeService
+
+_pending = threading.local()
+
+
+class FacetIndexService:
+    """
+    Maintains the materialized catalog filter facets stored in CategoryFacet.
+    Each row covers a category and all of its active descendants, so reading
+    the facets for a catalog page is a single cache hit or primary-key query.
+    Product changes are applied to the stored rows as deltas when the
+    transaction commits.
+    """
+
+    CACHE_KEY = "products:facets:{}"
+    CACHE_TIMEOUT = 60 * 5
+
+    @staticmethod
+    def _cache_key(category_id):
+        return FacetIndexService.CACHE_KEY.format(category_id or "all")
+
+    @staticmethod
+    def _category_tree():
+        """
+        Load the materialized category paths in one query.
+
+        Returns:
+            dict: Mapping of category id to (path, is_active)
+        """
+        return {
+            row[0]: (row[1], row[2])
+            for row in Category.objects.values_list("id", "path", "is_active")
+        }
+
+    @staticmethod
+    def get_subtree_ids(category_id, tree=None):
+        """
+        Get the ids of a category and all of its active descendants.
+
+        Args:
+            category_id (int): Root category id
+            tree (dict, optional): Preloaded category tree
+
+        Returns:
+            list: Category ids in the subtree
+        """
+        if tree is None:
+            category = Category.objects.filter(pk=category_id).first()
+            if category is None:
+                return [category_id]
+            return CategoryTreeService.get_subtree_ids(category)
+
+        if category_id not in tree or not tree[category_id][0]:
+            return [category_id]
+        return CategoryTreeService.filter_subtree(
+            [(cat_id, path, is_active) for cat_id, (path, is_active) in tree.items()],
+            tree[category_id][0],
+        )
+
+    @staticmethod
+    def get_ancestor_ids(category_id, tree=None):
+        """
+        Get the ids of a category and all of its ancestors.
+
+        Args:
+            category_id (int): Category id
+            tree (dict, optional): Preloaded category tree
+
+        Returns:
+            list: Category ids from the category up to the root
+        """
+        tree = tree if tree is not None else FacetIndexService._category_tree()
+        if category_id not in tree:
+            return []
+        return [int(pk) for pk in reversed(tree[category_id][0].split("/")[:-1])]
+
+    @staticmethod
+    def compute_facets(category_ids=None):
+        """
+        Compute facets from the live product tables.
+
+        Args:
+            category_ids (list, optional): Restrict to these categories
+
+        Returns:
+            dict: Field values for a CategoryFacet row
+        """
+        queryset = Product.objects.active()
+        if category_ids is not None:
+            queryset = queryset.filter(category_id__in=category_ids)
+
+        totals = queryset.aggregate(
+            product_count=Count("id"),
+            min_price=Min("effective_price"),
+            max_price=Max("effective_price"),
+            on_sale_count=Count("id", filter=Q(is_on_sale=True)),
+            in_stock_count=Count("id", filter=Q(in_stock=True, stock_qty__gt=0)),
+        )
+
+        # The set table holds one row per (product, value), so no DISTINCT
+        attribute_values = (
+            ProductAttributeValue.objects.filter(product__in=queryset)
+            .values("attribute_id", "attribute__name", "attribute_value__value")
+            .annotate(product_count=Count("product_id"))
+            .order_by("attribute_id", "attribute_value__value")
+        )
+
+        attributes = {}
+        for av in attribute_values:
+            attr_id = av["attribute_id"]
+            if attr_id not in attributes:
+                attributes[attr_id] = {
+                    "id": attr_id,
+                    "name": av["attribute__name"],
+                    "values": [],
+                }
+            attributes[attr_id]["values"].append(
+                {
+                    "value": av["attribute_value__value"],
+                    "product_count": av["product_count"],
+                }
+            )
+
+        return {
+            "product_count": totals["product_count"],
+            "min_price": totals["min_price"] or 0,
+            "max_price": totals["max_price"] or 0,
+            "on_sale_count": totals["on_sale_count"],
+            "in_stock_count": totals["in_stock_count"],
+            "attributes": list(attributes.values()),
+        }
+
+    @staticmethod
+    def refresh(category_id=None, tree=None):
+        """
+        Recompute and store the facets for one category subtree.
+
+        Args:
+            category_id (int, optional): Category id, None for the whole catalog
+            tree (dict, optional): Preloaded category tree
+
+        Returns:
+            CategoryFacet: The updated facet row
+        """
+        category_ids = None
+        if category_id is not None:
+            category_ids = FacetIndexService.get_subtree_ids(category_id, tree)
+
+        facet, created = CategoryFacet.objects.update_or_create(
+            category_id=category_id,
+            defaults=FacetIndexService.compute_facets(category_ids),
+        )
+        cache.set(
+            FacetIndexService._cache_key(category_id),
+            facet.as_filters(),
+            FacetIndexService.CACHE_TIMEOUT,
+        )
+        return facet
+
+    @staticmethod
+    def _counting_rows(category_id, tree):
+        """
+        Facet rows a product in the given category counts towards: its own
+        category, each ancestor up to the first inactive category on the
+        way, and the whole-catalog row.
+        """
+        rows = [None]
+        if category_id not in tree:
+            return rows
+        for pk in FacetIndexService.get_ancestor_ids(category_id, tree):
+            rows.append(pk)
+            if pk not in tree or not tree[pk][1]:
+                break
+        return rows
+
+    @staticmethod
+    def _contributions(product_ids):
+        """
+        What each active product adds to the facets of the rows it counts
+        towards, in two queries.
+
+        Args:
+            product_ids (iterable): Product ids
+
+        Returns:
+            dict: Mapping of product id to its contribution
+        """
+        product_ids = [pk for pk in product_ids if pk is not None]
+        if not product_ids:
+            return {}
+        contributions = {
+            pk: {
+                "category_id": category_id,
+                "price": price,
+                "on_sale": is_on_sale,
+                "in_stock": in_stock and stock_qty > 0,
+                "values": set(),
+            }
+            for pk, category_id, price, is_on_sale, in_stock, stock_qty in (
+                Product.objects.active()
+                .filter(pk__in=product_ids)
+                .values_list(
+                    "id",
+                    "category_id",
+                    "effective_price",
+                    "is_on_sale",
+                    "in_stock",
+                    "stock_qty",
+                )
+            )
+        }
+        values = ProductAttributeValue.objects.filter(
+            product_id__in=list(contributions)
+        ).values_list(
+            "product_id", "attribute_id", "attribute__name", "attribute_value__value"
+        )
+        for pk, attr_id, name, value in values:
+            contributions[pk]["values"].add((attr_id, name, value))
+        return contributions
+
+    @staticmethod
+    def _deltas(before, after, tree):
+        """
+        Sum the changes between two sets of product contributions per
+        facet row.
+        """
+        deltas = {}
+        for pk in set(before) | set(after):
+            old, new = before.get(pk), after.get(pk)
+            if old == new:
+                continue
+            for sign, contribution in ((-1, old), (1, new)):
+                if contribution is None:
+                    continue
+                for row in FacetIndexService._counting_rows(
+                    contribution["category_id"], tree
+                ):
+                    delta = deltas.setdefault(
+                        row,
+                        {
+                            "product_count": 0,
+                            "on_sale_count": 0,
+                            "in_stock_count": 0,
+                            "values": {},
+                            "added_prices": [],
+                            "removed_prices": [],
+                        },
+                    )
+                    delta["product_count"] += sign
+                    delta["on_sale_count"] += sign * contribution["on_sale"]
+                    delta["in_stock_count"] += sign * contribution["in_stock"]
+                    for attr_id, name, value in contribution["values"]:
+                        key = (attr_id, name, value)
+                        delta["values"][key] = delta["values"].get(key, 0) + sign
+                    prices = "added_prices" if sign > 0 else "removed_prices"
+                    delta[prices].append(contribution["price"])
+        return deltas
+
+    @staticmethod
+    def _apply(facet, delta):
+        """
+        Apply a delta to a facet row in memory.
+
+        Returns:
+            bool: False if the row has to be recomputed instead, because a
+                removed price was on the edge of its price range
+        """
+        old_count = facet.product_count
+        for field in ("product_count", "on_sale_count", "in_stock_count"):
+            setattr(facet, field, getattr(facet, field) + delta[field])
+        if min(facet.product_count, facet.on_sale_count, facet.in_stock_count) < 0:
+            return False
+
+        # A price that is removed and added back leaves the range alone
+        added = list(delta["added_prices"])
+        removed = []
+        for price in delta["removed_prices"]:
+            if price in added:
+                added.remove(price)
+            else:
+                removed.append(price)
+        if facet.product_count == 0:
+            facet.min_price = facet.max_price = 0
+        elif old_count == 0:
+            facet.min_price = min(delta["added_prices"])
+            facet.max_price = max(delta["added_prices"])
+        elif any(p <= facet.min_price or p >= facet.max_price for p in removed):
+            return False
+        elif added:
+            facet.min_price = min(facet.min_price, *added)
+            facet.max_price = max(facet.max_price, *added)
+
+        counts = {}
+        names = {}
+        for attribute in facet.attributes:
+            names[attribute["id"]] = attribute["name"]
+            for value in attribute["values"]:
+                counts[(attribute["id"], value["value"])] = value["product_count"]
+        for (attr_id, name, value), change in delta["values"].items():
+            names[attr_id] = name
+            counts[(attr_id, value)] = counts.get((attr_id, value), 0) + change
+        if any(count < 0 for count in counts.values()):
+            return False
+
+        attributes = {}
+        for (attr_id, value), count in sorted(counts.items()):
+            if count:
+                attributes.setdefault(
+                    attr_id, {"id": attr_id, "name": names[attr_id], "values": []}
+                )["values"].append({"value": value, "product_count": count})
+        facet.attributes = list(attributes.values())
+        return True
+
+    @staticmethod
+    def apply_changes(before, product_ids):
+        """
+        Update the stored facet rows for changed products. Each product's
+        contribution before the change is replaced by its current one, so
+        only the rows it counts towards are written, with one bulk UPDATE.
+        A row is recomputed only when a removed price bounded its range.
+
+        Args:
+            before (dict): Contributions of the products before the change
+            product_ids (iterable): Ids of the changed products
+        """
+        tree = FacetIndexService._category_tree()
+        after = FacetIndexService._contributions(product_ids)
+        deltas = FacetIndexService._deltas(before, after, tree)
+        if not deltas:
+            return
+
+        rows = Q(category_id__in=[row for row in deltas if row is not None])
+        if None in deltas:
+            rows |= Q(category__isnull=True)
+        # Rows that do not exist yet are computed when first read
+        facets = list(CategoryFacet.objects.select_for_update().filter(rows))
+
+        updated = []
+        for facet in facets:
+            if FacetIndexService._apply(facet, deltas[facet.category_id]):
+                updated.append(facet)
+            else:
+                FacetIndexService.refresh(facet.category_id, tree)
+        if not updated:
+            return
+
+        CategoryFacet.objects.bulk_update(
+            updated,
+            [
+                "product_count",
+                "min_price",
+                "max_price",
+                "on_sale_count",
+                "in_stock_count",
+                "attributes",
+                "updated_at",
+            ],
+        )
+        cache.set_many(
+            {
+                FacetIndexService._cache_key(facet.category_id): facet.as_filters()
+                for facet in updated
+            },
+            FacetIndexService.CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def rebuild():
+        """
+        Rebuild the whole facet index from scratch.
+
+        Returns:
+            int: Number of facet rows written
+        """
+        tree = FacetIndexService._category_tree()
+        for category_id in tree:
+            FacetIndexService.refresh(category_id, tree)
+        FacetIndexService.refresh(None, tree)
+        return len(tree) + 1
+
+    @staticmethod
+    def _state(reset=True):
+        """
+        Pending changes of the current transaction, with the flush queued
+        to run when it commits. The first flush takes the changes and the
+        rest find nothing to do. Outside a transaction, reset starts a new
+        change.
+        """
+        state = getattr(_pending, "state", None)
+        in_atomic_block = transaction.get_connection().in_atomic_block
+        if state is None or (reset and not in_atomic_block):
+            state = _pending.state = {"before": {}, "rebuild": False}
+        if in_atomic_block:
+            transaction.on_commit(FacetIndexService._flush)
+        return state
+
+    @staticmethod
+    def track(*product_ids):
+        """
+        Remember the contribution of products about to change. Call before
+        the change is written; later changes in the same transaction keep
+        the first snapshot.
+
+        Args:
+            *product_ids (int): Ids of products about to change
+        """
+        state = FacetIndexService._state()
+        new_ids = [
+            pk for pk in product_ids if pk is not None and pk not in state["before"]
+        ]
+        if new_ids:
+            contributions = FacetIndexService._contributions(new_ids)
+            for pk in new_ids:
+                state["before"][pk] = contributions.get(pk)
+
+    @staticmethod
+    def schedule_refresh(*product_ids):
+        """
+        Queue a facet update for changed products once the current
+        transaction commits. Outside a transaction it is applied at once.
+
+        Args:
+            *product_ids (int): Ids of products that changed
+        """
+        state = FacetIndexService._state(reset=False)
+        for pk in product_ids:
+            if pk is not None:
+                # Untracked products are new
+                state["before"].setdefault(pk, None)
+        if not transaction.get_connection().in_atomic_block:
+            FacetIndexService._flush()
+
+    @staticmethod
+    def schedule_rebuild():
+        """
+        Queue a full rebuild once the current transaction commits.
+        """
+        FacetIndexService._state(reset=False)["rebuild"] = True
+        if not transaction.get_connection().in_atomic_block:
+            FacetIndexService._flush()
+
+    @staticmethod
+    def _flush():
+        state = getattr(_pending, "state", None)
+        _pending.state = None
+        if state is None:
+            return
+
+        if state["rebuild"]:
+            FacetIndexService.rebuild()
+        elif state["before"]:
+            with transaction.atomic():
+                FacetIndexService.apply_changes(state["before"], state["before"])
+
+    @staticmethod
+    def get_facets(category=None):
+        """
+        Get the facets for a category subtree, or the whole catalog.
+
+        Args:
+            category (Category, optional): Category to get facets for
+
+        Returns:
+            dict: Dictionary of available filters
+        """
+        category_id = category.id if category else None
+        key = FacetIndexService._cache_key(category_id)
+
+        filters = cache.get(key)
+        if filters is not None:
+            return filters
+
+        facet = CategoryFacet.objects.filter(category_id=category_id).first()
+        if facet is None:
+            facet = FacetIndexService.refresh(category_id)
+            return facet.as_filters()
+
+        filters = facet.as_filters()
+        cache.set(key, filters, FacetIndexService.CACHE_TIMEOUT)
+        return filters
@@ -0,0 +1,353 @@
+# products/services/merchandising.py
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from products.models import Product
+from products.serializers import ProductListSerializer, get_media_host
+
+_pending = threading.local()
+
+
+class MerchandisingService:
+    """
+    Caches the storefront merchandising blocks (featured, new arrivals,
+    on sale) and each product's related products as precomputed id lists
+    plus serialized product cards. The product signals refresh only the
+    blocks a changed product is in or now belongs in, with CACHE_TIMEOUT
+    as a safety net. Requests for more products than are cached fall
+    through to a query.
+    """
+
+    CACHE_KEY = "products:merch:{}"
+    RELATED_CACHE_KEY = "products:merch:related:{}"
+    CACHE_TIMEOUT = 60 * 30
+    BLOCK_SIZE = 12
+    RELATED_SIZE = 8
+    BLOCKS = ("featured", "new_arrivals", "on_sale")
+
+    @staticmethod
+    def _block_queryset(name):
+        queryset = Product.objects.active()
+        if name == "featured":
+            queryset = queryset.filter(is_featured=True)
+        elif name == "on_sale":
+            queryset = queryset.filter(is_on_sale=True)
+        elif name != "new_arrivals":
+            raise ValueError(f"Unknown merchandising block: {name}")
+        return queryset.order_by("-created_at", "-id")
+
+    @staticmethod
+    def _qualifies(name, product):
+        """Whether a product passes a block's filter, without a query"""
+        if not product.is_active:
+            return False
+        if name == "featured":
+            return product.is_featured
+        if name == "on_sale":
+            return product.is_on_sale
+        return True
+
+    @staticmethod
+    def _entry(queryset, size):
+        """
+        Build a cache entry of product ids and host-relative cards. A full
+        entry also records the sort key of its last product, which a
+        product has to beat to enter it.
+        """
+        products = list(queryset.prefetch_related("images")[:size])
+        serializer = ProductListSerializer()
+        return {
+            "ids": [product.id for product in products],
+            "cards": [serializer.build_representation(p) for p in products],
+            "cutoff": (
+                (products[-1].created_at, products[-1].id)
+                if len(products) == size
+                else None
+            ),
+        }
+
+    @staticmethod
+    def refresh_block(name):
+        """
+        Recompute and cache one merchandising block.
+
+        Args:
+            name (str): One of BLOCKS
+
+        Returns:
+            dict: The block entry with ids and cards
+        """
+        entry = MerchandisingService._entry(
+            MerchandisingService._block_queryset(name),
+            MerchandisingService.BLOCK_SIZE,
+        )
+        cache.set(
+            MerchandisingService.CACHE_KEY.format(name),
+            entry,
+            MerchandisingService.CACHE_TIMEOUT,
+        )
+        return entry
+
+    @staticmethod
+    def get_block(name):
+        """
+        Get a merchandising block, computing it on a cache miss.
+
+        Args:
+            name (str): One of BLOCKS
+
+        Returns:
+            dict: The block entry with ids and cards
+        """
+        entry = cache.get(MerchandisingService.CACHE_KEY.format(name))
+        if entry is None:
+            entry = MerchandisingService.refresh_block(name)
+        return entry
+
+    @staticmethod
+    def refresh_related(product):
+        """
+        Recompute and cache the related products of one product: the
+        newest active products in the same category.
+
+        Args:
+            product (Product): The product
+
+        Returns:
+            dict: The related entry with ids and cards
+        """
+        queryset = (
+            Product.objects.active()
+            .filter(category_id=product.category_id)
+            .exclude(id=product.id)
+            .order_by("-created_at", "-id")
+        )
+        entry = MerchandisingService._entry(queryset, MerchandisingService.RELATED_SIZE)
+        cache.set(
+            MerchandisingService.RELATED_CACHE_KEY.format(product.id),
+            entry,
+            MerchandisingService.CACHE_TIMEOUT,
+        )
+        return entry
+
+    @staticmethod
+    def get_related(product):
+        """
+        Get the precomputed related products of a product.
+
+        Args:
+            product (Product): The product
+
+        Returns:
+            dict: The related entry with ids and cards
+        """
+        entry = cache.get(MerchandisingService.RELATED_CACHE_KEY.format(product.id))
+        if entry is None:
+            entry = MerchandisingService.refresh_related(product)
+        return entry
+
+    @staticmethod
+    def get_cards(entry, limit=None, request=None):
+        """
+        Get the serialized cards of an entry with the request host filled in.
+
+        Args:
+            entry (dict): A block or related entry
+            limit (int, optional): Maximum number of cards
+            request (HttpRequest, optional): Request to resolve media URLs for
+
+        Returns:
+            list: Product cards
+        """
+        serializer = ProductListSerializer()
+        host = get_media_host(request)
+        return [
+            serializer.with_media_host(card, host) for card in entry["cards"][:limit]
+        ]
+
+    @staticmethod
+    def get_block_products(name, limit=None):
+        """
+        Get the products of a merchandising block. Up to BLOCK_SIZE come
+        from the cached block; a larger limit is served by a query.
+
+        Args:
+            name (str): One of BLOCKS
+            limit (int, optional): Maximum number of products
+
+        Returns:
+            list: Products
+        """
+        if limit is not None and limit > MerchandisingService.BLOCK_SIZE:
+            return list(
+                MerchandisingService._block_queryset(name)
+                .select_related("category")
+                .prefetch_related("images")[:limit]
+            )
+        return MerchandisingService.get_products(
+            MerchandisingService.get_block(name), limit
+        )
+
+    @staticmethod
+    def get_related_products(product, limit=None):
+        """
+        Get the related products of a product. Up to RELATED_SIZE come from
+        the precomputed list; a larger limit is served by a query.
+
+        Args:
+            product (Product): The product
+            limit (int, optional): Maximum number of products
+
+        Returns:
+            list: Products
+        """
+        if limit is not None and limit > MerchandisingService.RELATED_SIZE:
+            return list(
+                Product.objects.active()
+                .filter(category_id=product.category_id)
+                .exclude(id=product.id)
+                .select_related("category")
+                .prefetch_related("images")
+                .order_by("-created_at", "-id")[:limit]
+            )
+        return MerchandisingService.get_products(
+            MerchandisingService.get_related(product), limit
+        )
+
+    @staticmethod
+    def get_products(entry, limit=None):
+        """
+        Load the products of an entry, in cached order, with one query.
+
+        Args:
+            entry (dict): A block or related entry
+            limit (int, optional): Maximum number of products
+
+        Returns:
+            list: Products
+        """
+        ids = entry["ids"][:limit]
+        products = (
+            Product.objects.active()
+            .select_related("category")
+            .prefetch_related("images")
+            .in_bulk(ids)
+        )
+        return [products[pk] for pk in ids if pk in products]
+
+    @staticmethod
+    def affected_blocks(product_ids):
+        """
+        Find the cached blocks that changes to the given products can
+        alter: blocks that list one of them, or that one of them now
+        qualifies for and would rank in.
+
+        Args:
+            product_ids (iterable): Ids of changed products
+
+        Returns:
+            list: Names of the affected blocks
+        """
+        product_ids = set(product_ids)
+        products = list(
+            Product.objects.filter(pk__in=product_ids).only(
+                "id", "is_active", "is_featured", "is_on_sale", "created_at"
+            )
+        )
+        entries = cache.get_many(
+            [
+                MerchandisingService.CACHE_KEY.format(n)
+                for n in MerchandisingService.BLOCKS
+            ]
+        )
+
+        affected = []
+        for name in MerchandisingService.BLOCKS:
+            entry = entries.get(MerchandisingService.CACHE_KEY.format(name))
+            if entry is None:
+                # Computed on the next read
+                continue
+            cutoff = entry.get("cutoff")
+            if product_ids.intersection(entry["ids"]) or any(
+                MerchandisingService._qualifies(name, product)
+                and (cutoff is None or (product.created_at, product.id) > cutoff)
+                for product in products
+            ):
+                affected.append(name)
+        return affected
+
+    @staticmethod
+    def refresh_products(product_ids, category_ids):
+        """
+        Refresh the blocks affected by changed products and drop the related
+        lists of products in their categories, which are recomputed on
+        next use.
+
+        Args:
+            product_ids (iterable): Ids of changed products
+            category_ids (iterable): Ids of categories whose products changed
+        """
+        for name in MerchandisingService.affected_blocks(product_ids):
+            MerchandisingService.refresh_block(name)
+
+        related_ids = Product.objects.filter(
+            category_id__in=list(category_ids)
+        ).values_list("id", flat=True)
+        cache.delete_many(
+            [MerchandisingService.RELATED_CACHE_KEY.format(pk) for pk in related_ids]
+        )
+
+    @staticmethod
+    def refresh_all():
+        """
+        Refresh every block and drop every related list, after changes
+        that bypassed the product signals.
+        """
+        for name in MerchandisingService.BLOCKS:
+            MerchandisingService.refresh_block(name)
+        product_ids = Product.objects.values_list("id", flat=True)
+        cache.delete_many(
+            [MerchandisingService.RELATED_CACHE_KEY.format(pk) for pk in product_ids]
+        )
+
+    @staticmethod
+    def warm():
+        """
+        Pre-warm every block and the related lists of all active products.
+
+        Returns:
+            int: Number of cache entries written
+        """
+        for name in MerchandisingService.BLOCKS:
+            MerchandisingService.refresh_block(name)
+        count = len(MerchandisingService.BLOCKS)
+        for product in Product.objects.active().only("id", "category_id"):
+            MerchandisingService.refresh_related(product)
+            count += 1
+        return count
+
+    @staticmethod
+    def schedule_refresh(product_ids, category_ids):
+        """
+        Queue a refresh once the current transaction commits. Refreshes
+        queued in the same transaction are coalesced into one pass.
+
+        Args:
+            product_ids (iterable): Ids of changed products
+            category_ids (iterable): Ids of categories whose products changed
+        """
+        pending = getattr(_pending, "changes", None)
+        if pending is None:
+            pending = _pending.changes = (set(), set())
+        pending[0].update(product_ids)
+        pending[1].update(cid for cid in category_ids if cid is not None)
+        transaction.on_commit(MerchandisingService._flush)
+
+    @staticmethod
+    def _flush():
+        changes = getattr(_pending, "changes", None)
+        if changes is None:
+            return
+        _pending.changes = None
+        MerchandisingService.refresh_products(*changes)
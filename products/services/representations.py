@@ -0,0 +1,102 @@
+# products/services/representations.py
+from django.core.cache import cache
+from django.utils import timezone
+from products.models import Product
+
+
+class ProductRepresentationCache:
+    """
+    Caches the serialized representation of each product, keyed by product
+    id and updated_at. Any change to a product or to the rows nested in its
+    representation bumps updated_at, so stale entries are never read and
+    simply expire.
+
+    Cached representations hold host-relative media URLs; serializers fill
+    in the request host on the way out. Each serializer field set (full,
+    list or a sparse fieldset) is cached separately.
+    """
+
+    CACHE_KEY = "products:repr:v{}:{}:{}:{}"
+    # Bump when the serialized shape changes
+    VERSION = 1
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def get_key(product, fieldset="full"):
+        return ProductRepresentationCache.CACHE_KEY.format(
+            ProductRepresentationCache.VERSION,
+            fieldset,
+            product.pk,
+            product.updated_at.timestamp() if product.updated_at else 0,
+        )
+
+    @staticmethod
+    def get(product, fieldset="full"):
+        """
+        Get the cached representation of one product.
+
+        Args:
+            product (Product): The product
+            fieldset (str): Key of the serializer field set
+
+        Returns:
+            dict: The representation, or None on a miss
+        """
+        return cache.get(ProductRepresentationCache.get_key(product, fieldset))
+
+    @staticmethod
+    def get_many(products, fieldset="full"):
+        """
+        Get the cached representations of several products in one round trip.
+
+        Args:
+            products (iterable): Products to look up
+            fieldset (str): Key of the serializer field set
+
+        Returns:
+            dict: Mapping of product id to representation, hits only
+        """
+        keys = {ProductRepresentationCache.get_key(p, fieldset): p.pk for p in products}
+        return {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+
+    @staticmethod
+    def set_many(representations, fieldset="full"):
+        """
+        Store representations.
+
+        Args:
+            representations (dict): Mapping of Product to representation
+            fieldset (str): Key of the serializer field set
+        """
+        cache.set_many(
+            {
+                ProductRepresentationCache.get_key(product, fieldset): data
+                for product, data in representations.items()
+            },
+            ProductRepresentationCache.CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def invalidate(product_ids):
+        """
+        Retire the cached representations of the given products by bumping
+        their updated_at in one UPDATE.
+
+        Args:
+            product_ids (iterable): Ids of products whose nested rows changed
+        """
+        product_ids = {pk for pk in product_ids if pk is not None}
+        if product_ids:
+            Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+
+    @staticmethod
+    def invalidate_category(category_id):
+        """
+        Retire the cached representations of every product in a category.
+
+        Args:
+            category_id (int): Id of the category that changed
+        """
+        Product.objects.filter(category_id=category_id).update(
+            updated_at=timezone.now()
+        )
@@ -0,0 +1,334 @@
+# products/services/search.py
+import bisect
+import difflib
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+from products.models import Product, ProductVariant
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens, ignoring any HTML markup.
+    """
+    if not text:
+        return []
+    return TOKEN_RE.findall(strip_tags(text).lower())
+
+
+def load_documents(product_ids=None):
+    """
+    Load the searchable text for products in two queries.
+
+    Args:
+        product_ids (iterable, optional): Restrict to these products
+
+    Returns:
+        dict: Mapping of product id to a dict of name, category, skus
+            and description
+    """
+    products = Product.objects.all()
+    variants = ProductVariant.objects.exclude(sku="")
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+        variants = variants.filter(product_id__in=product_ids)
+
+    documents = {
+        pk: {
+            "name": name or "",
+            "category": category_name or "",
+            "skus": [],
+            "description": strip_tags(description or ""),
+        }
+        for pk, name, category_name, description in products.values_list(
+            "id", "name", "category__name", "description"
+        )
+    }
+    for product_id, sku in variants.values_list("product_id", "sku"):
+        if product_id in documents:
+            documents[product_id]["skus"].append(sku)
+    return documents
+
+
+class BaseSearchBackend:
+    """
+    Interface for product search engines.
+    """
+
+    def search(self, queryset, query):
+        """
+        Filter a product queryset down to matches, ordered by relevance.
+
+        Args:
+            queryset (QuerySet): Product queryset to search within
+            query (str): Search query
+
+        Returns:
+            QuerySet: Matching products, best matches first
+        """
+        raise NotImplementedError
+
+    def index_products(self, product_ids=None):
+        """
+        Refresh the search index for the given products, or all of them.
+
+        Args:
+            product_ids (iterable, optional): Products whose text changed
+        """
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        """
+        Drop deleted products from the index.
+
+        Args:
+            product_ids (iterable): Ids of deleted products
+        """
+
+
+# Builds the stored search vector of products from their name, variant
+# SKUs, category name and description, weighted A, A, B and C
+SEARCH_VECTOR_SQL = """
+    UPDATE products_product AS p SET search_vector =
+        setweight(to_tsvector(%s::regconfig, coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector(%s::regconfig, coalesce((
+            SELECT string_agg(v.sku, ' ') FROM products_productvariant v
+            WHERE v.product_id = p.id
+        ), '')), 'A') ||
+        setweight(to_tsvector(%s::regconfig, coalesce(c.name, '')), 'B') ||
+        setweight(to_tsvector(%s::regconfig, coalesce(p.description, '')), 'C')
+    FROM products_category AS c
+    WHERE c.id = p.category_id
+"""
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search on the stored, GIN-indexed Product.search_vector,
+    with trigram similarity on the product name for typo tolerance.
+    """
+
+    config = "english"
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(query, config=self.config, search_type="websearch")
+        return (
+            queryset.filter(
+                Q(search_vector=search_query) | Q(name__trigram_similar=query)
+            )
+            .annotate(
+                rank=SearchRank(F("search_vector"), search_query)
+                + TrigramSimilarity("name", query)
+            )
+            .order_by("-rank", "-id")
+        )
+
+    def index_products(self, product_ids=None):
+        # One set-based UPDATE, the statement migration 0004 populated with
+        sql = SEARCH_VECTOR_SQL
+        params = [self.config] * 4
+        if product_ids is not None:
+            product_ids = list(product_ids)
+            if not product_ids:
+                return
+            sql += " AND p.id = ANY(%s)"
+            params.append(product_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Pure-Python inverted index for development databases without
+    full-text search; production should run PostgresSearchBackend. The
+    index is built lazily per process and updated incrementally by the
+    product signals. Every update bumps a version in the shared cache, so
+    other processes rebuild on their next search instead of serving stale
+    results; max_age is a safety net.
+    """
+
+    max_age = 60 * 5
+    weights = {"name": 4, "skus": 4, "category": 2, "description": 1}
+    VERSION_KEY = "products:search:version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._documents = {}
+        self._vocabulary = None
+        self._built_at = 0
+        self._version = None
+
+    def _shared_version(self):
+        return cache.get_or_set(self.VERSION_KEY, 0, None)
+
+    def _bump_version(self):
+        try:
+            return cache.incr(self.VERSION_KEY)
+        except ValueError:
+            cache.set(self.VERSION_KEY, 1, None)
+            return 1
+
+    def _ensure_index(self):
+        with self._lock:
+            version = self._shared_version()
+            if (
+                self._postings is None
+                or version != self._version
+                or time.time() - self._built_at > self.max_age
+            ):
+                self._postings = defaultdict(dict)
+                self._documents = {}
+                self._vocabulary = None
+                self._add(load_documents())
+                self._built_at = time.time()
+                self._version = version
+
+    def _add(self, documents):
+        for pk, document in documents.items():
+            scores = defaultdict(int)
+            for field, weight in self.weights.items():
+                value = document[field]
+                text = " ".join(value) if isinstance(value, list) else value
+                for token in tokenize(text):
+                    scores[token] += weight
+            for token, score in scores.items():
+                self._postings[token][pk] = score
+            self._documents[pk] = set(scores)
+        self._vocabulary = None
+
+    def _remove(self, product_ids):
+        for pk in product_ids:
+            for token in self._documents.pop(pk, ()):
+                postings = self._postings.get(token)
+                if postings is not None:
+                    postings.pop(pk, None)
+                    if not postings:
+                        del self._postings[token]
+        self._vocabulary = None
+
+    def _match_token(self, token):
+        """
+        Score products for one query token: exact and prefix matches first,
+        found by bisecting the sorted vocabulary, falling back to the
+        closest spellings that share the token's first letter for typos.
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+
+        scores = defaultdict(int)
+        index = bisect.bisect_left(vocabulary, token)
+        while index < len(vocabulary) and vocabulary[index].startswith(token):
+            indexed = vocabulary[index]
+            bonus = 2 if indexed == token else 1
+            for pk, score in self._postings[indexed].items():
+                scores[pk] += score * bonus
+            index += 1
+
+        if not scores:
+            start = bisect.bisect_left(vocabulary, token[0])
+            end = bisect.bisect_left(vocabulary, chr(ord(token[0]) + 1))
+            for indexed in difflib.get_close_matches(
+                token, vocabulary[start:end], n=3, cutoff=0.75
+            ):
+                for pk, score in self._postings[indexed].items():
+                    scores[pk] += score
+        return scores
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        self._ensure_index()
+        with self._lock:
+            results = None
+            for token in tokens:
+                scores = self._match_token(token)
+                if results is None:
+                    results = scores
+                else:
+                    results = {
+                        pk: results[pk] + score
+                        for pk, score in scores.items()
+                        if pk in results
+                    }
+                if not results:
+                    return queryset.none()
+
+        ranking = Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in results.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return (
+            queryset.filter(pk__in=list(results))
+            .annotate(rank=ranking)
+            .order_by("-rank", "-id")
+        )
+
+    def _update(self, product_ids, documents=None):
+        with self._lock:
+            current = self._version
+            version = self._bump_version()
+            if self._postings is None:
+                return
+            if product_ids is None:
+                self._postings = None
+                return
+            self._remove(product_ids)
+            if documents is not None:
+                self._add(documents)
+            if current == version - 1:
+                # Nothing else changed since this index was built
+                self._version = version
+
+    def index_products(self, product_ids=None):
+        if product_ids is None:
+            self._update(None)
+        else:
+            product_ids = list(product_ids)
+            self._update(product_ids, load_documents(product_ids))
+
+    def remove_products(self, product_ids):
+        self._update(list(product_ids))
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Get the configured product search backend.
+    Uses settings.PRODUCT_SEARCH_BACKEND when set, otherwise PostgreSQL
+    full-text search or the inverted index depending on the database.
+
+    Returns:
+        BaseSearchBackend: The search backend instance
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, "PRODUCT_SEARCH_BACKEND", None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == "postgresql":
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = InvertedIndexSearchBackend()
+    return _backend
@@ -0,0 +1,309 @@
+# products/signals.py
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from .models import (
+    AttributeValue,
+    Category,
+    Product,
+    ProductAttributeValue,
+    ProductImage,
+    ProductVariant,
+)
+from .services.attributes import AttributeIndexService
+from .services.categories import CategoryTreeService
+from .services.facets import FacetIndexService
+from .services.merchandising import MerchandisingService
+from .services.representations import ProductRepresentationCache
+from .services.search import get_search_backend
+
+
+# Attribute index receivers run first: facet refreshes read the set table
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def sync_variant_attribute_index(sender, instance, raw=False, **kwargs):
+    """
+    Keep the product's attribute set in step with its variants
+    """
+    if raw:
+        return
+    AttributeIndexService.sync_products([instance.product_id])
+
+
+@receiver(m2m_changed, sender=ProductVariant.attributes.through)
+def sync_attribute_index(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep product attribute sets and variant signatures in step with variant
+    attribute links
+    """
+    if action == "pre_clear" and not isinstance(instance, ProductVariant):
+        # Reverse clear: remember the variants before the links are gone
+        instance._cleared_variant_ids = list(
+            instance.variants.values_list("id", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if isinstance(instance, ProductVariant):
+        variant_ids = [instance.pk]
+        product_ids = [instance.product_id]
+    else:
+        # Reverse side: pk_set holds the affected variant ids
+        if action == "post_clear":
+            variant_ids = getattr(instance, "_cleared_variant_ids", [])
+        else:
+            variant_ids = list(pk_set or [])
+        product_ids = ProductVariant.objects.filter(pk__in=variant_ids).values_list(
+            "product_id", flat=True
+        )
+
+    AttributeIndexService.sync_products(list(product_ids))
+    AttributeIndexService.sync_variant_signatures(variant_ids)
+
+
+@receiver(post_save, sender=AttributeValue)
+def sync_attribute_value_index(sender, instance, created, raw=False, **kwargs):
+    """
+    Follow an attribute value that was moved to a different attribute
+    """
+    if created or raw:
+        return
+    ProductAttributeValue.objects.filter(attribute_value=instance).exclude(
+        attribute_id=instance.attribute_id
+    ).update(attribute_id=instance.attribute_id)
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, **kwargs):
+    """
+    Remember the stored category so a moved product refreshes both subtrees
+    """
+    instance._previous_category_id = None
+    if instance.pk and not kwargs.get("raw"):
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("category_id", flat=True)
+            .first()
+        )
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def track_product_facets(sender, instance, **kwargs):
+    """
+    Snapshot what the product adds to the facet index before it changes
+    """
+    FacetIndexService.track(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_product_facets(sender, instance, **kwargs):
+    """
+    Apply the product's change to the facet index
+    """
+    FacetIndexService.schedule_refresh(instance.pk)
+
+
+@receiver(pre_save, sender=ProductVariant)
+@receiver(pre_delete, sender=ProductVariant)
+def track_variant_facets(sender, instance, **kwargs):
+    """
+    Variants feed the attribute facets of the parent product
+    """
+    FacetIndexService.track(instance.product_id)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_variant_facets(sender, instance, **kwargs):
+    """
+    Variant changes affect the attribute facets of the parent product
+    """
+    FacetIndexService.schedule_refresh(instance.product_id)
+
+
+@receiver(m2m_changed, sender=ProductVariant.attributes.through)
+def refresh_variant_attribute_facets(sender, instance, action, pk_set, **kwargs):
+    """
+    Snapshot and refresh attribute facets when variant attributes are added
+    or removed
+    """
+    if action.startswith("pre_"):
+        track = True
+    elif action in ("post_add", "post_remove", "post_clear"):
+        track = False
+    else:
+        return
+
+    if isinstance(instance, ProductVariant):
+        product_ids = [instance.product_id]
+    else:
+        # Reverse side: pk_set holds the affected variant ids, a reverse
+        # clear affects every variant of the value
+        variants = ProductVariant.objects.filter(
+            pk__in=pk_set if pk_set else instance.variants.values("pk")
+        )
+        if not track and action == "post_clear":
+            variants = ProductVariant.objects.filter(
+                pk__in=getattr(instance, "_cleared_variant_ids", [])
+            )
+        product_ids = set(variants.values_list("product_id", flat=True))
+
+    if track:
+        FacetIndexService.track(*product_ids)
+    else:
+        FacetIndexService.schedule_refresh(*product_ids)
+
+
+def _backfill_category_paths():
+    if Category.objects.filter(path="").exists():
+        Category.objects.rebuild_paths()
+
+
+@receiver(post_save, sender=Category)
+def backfill_category_path(sender, instance, raw=False, **kwargs):
+    """
+    Fixtures load categories without save(), so fill in missing paths
+    before anything reads them
+    """
+    if raw and not instance.path:
+        transaction.on_commit(_backfill_category_paths)
+
+
+@receiver(pre_save, sender=Category)
+def remember_previous_category_state(sender, instance, raw=False, **kwargs):
+    """
+    Remember the stored parent and active flag to tell moves apart from
+    plain edits
+    """
+    instance._previous_facet_state = None
+    if instance.pk and not raw:
+        instance._previous_facet_state = (
+            Category.objects.filter(pk=instance.pk)
+            .values_list("parent_id", "is_active")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def rebuild_category_facets(sender, instance, created=None, **kwargs):
+    """
+    Category moves and (de)activation change subtree membership
+    """
+    # Deletes send no created flag
+    previous = getattr(instance, "_previous_facet_state", None)
+    if created is False and previous == (instance.parent_id, instance.is_active):
+        return
+    FacetIndexService.schedule_rebuild()
+
+
+@receiver(post_save, sender=Product)
+def index_product_search(sender, instance, raw=False, **kwargs):
+    """
+    Keep the product's search document in sync with its text fields
+    """
+    if raw:
+        return
+    transaction.on_commit(lambda: get_search_backend().index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search(sender, instance, **kwargs):
+    """
+    Drop deleted products from the search index
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_products([pk]))
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def index_variant_search(sender, instance, **kwargs):
+    """
+    Variant SKUs are part of the product's search document
+    """
+    product_id = instance.product_id
+    transaction.on_commit(lambda: get_search_backend().index_products([product_id]))
+
+
+@receiver(post_save, sender=Category)
+def index_category_search(sender, instance, created, raw=False, **kwargs):
+    """
+    Category names are part of the search document of their products
+    """
+    if created or raw:
+        return
+    product_ids = list(instance.products.values_list("id", flat=True))
+    if product_ids:
+        transaction.on_commit(lambda: get_search_backend().index_products(product_ids))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_product_representation(sender, instance, raw=False, **kwargs):
+    """
+    Images and variants are nested in the cached product representation
+    """
+    if raw:
+        return
+    ProductRepresentationCache.invalidate([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_representations(sender, instance, created, raw=False, **kwargs):
+    """
+    The category is nested in the cached representation of its products
+    """
+    if created or raw:
+        return
+    ProductRepresentationCache.invalidate_category(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    """
+    Drop the cached category tree once the change is committed
+    """
+    transaction.on_commit(CategoryTreeService.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_product_merchandising(sender, instance, raw=False, **kwargs):
+    """
+    Refresh the merchandising blocks and related lists the product is in
+    """
+    if raw:
+        return
+    MerchandisingService.schedule_refresh(
+        [instance.pk],
+        [instance.category_id, getattr(instance, "_previous_category_id", None)],
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_image_merchandising(sender, instance, raw=False, **kwargs):
+    """
+    Product images can feed the main image of cached product cards
+    """
+    if raw:
+        return
+    category_id = (
+        Product.objects.filter(pk=instance.product_id)
+        .values_list("category_id", flat=True)
+        .first()
+    )
+    MerchandisingService.schedule_refresh([instance.product_id], [category_id])
@@ -1,3 +1,561 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_save
+from django.core.management import call_command
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import (
+    Attribute,
+    AttributeValue,
+    Category,
+    CategoryFacet,
+    Product,
+    ProductVariant,
+)
+from .services.attributes import AttributeIndexService
+from .services.categories import CategoryTreeService
+from .services.facets import FacetIndexService
+from .services.merchandising import MerchandisingService
+from .services.search import InvertedIndexSearchBackend
+
+
+class CatalogTestCase(TestCase):
+    """Starts every test with an empty cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class PricingVersionTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Downloads")
+        cls.product = Product.objects.create(
+            name="Ebook", category=category, price=Decimal("10.00")
+        )
+
+    def stored_version(self):
+        return Product.objects.values_list("pricing_version", flat=True).get(
+            pk=self.product.pk
+        )
+
+    def test_price_changes_bump_the_version_before_receivers_run(self):
+        seen = []
+
+        def receiver(instance, **kwargs):
+            seen.append(instance.pricing_version)
+
+        post_save.connect(receiver, sender=Product)
+        self.addCleanup(post_save.disconnect, receiver, sender=Product)
+        version = self.stored_version()
+
+        self.product.sale_price = Decimal("5.00")
+        self.product.save()
+        self.product.name = "Ebook, 2nd edition"
+        self.product.save()
+
+        self.assertEqual(seen, [version + 1, version + 1])
+        self.assertEqual(self.stored_version(), version + 1)
+
+    def test_stale_instance_keeps_a_concurrent_bump(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductVariant.objects.create(
+            product=self.product,
+            name="EPUB",
+            sku="EBOOK-EPUB",
+            price_adjustment=Decimal("2.00"),
+        )
+        version = self.stored_version()
+
+        stale.name = "Ebook, 2nd edition"
+        stale.save()
+        self.assertEqual(self.stored_version(), version)
+
+        stale.price = Decimal("12.00")
+        stale.save(update_fields=["price"])
+        self.assertEqual(stale.pricing_version, version + 1)
+        self.assertEqual(self.stored_version(), version + 1)
+
+
+class SyncEffectivePricesTests(CatalogTestCase):
+    def test_sync_retires_cached_representations_and_blocks(self):
+        category = Category.objects.create(name="Downloads")
+        product = Product.objects.create(
+            name="Ebook", category=category, price=Decimal("10.00")
+        )
+        client = APIClient()
+        response = client.get("/api/v1/products/")
+        self.assertEqual(response.data["results"][0]["current_price"], 10.0)
+        self.assertEqual(MerchandisingService.get_block("on_sale")["ids"], [])
+
+        Product.objects.filter(pk=product.pk).update(sale_price=Decimal("4.00"))
+        call_command("sync_effective_prices", stdout=StringIO())
+
+        response = client.get("/api/v1/products/")
+        self.assertEqual(response.data["results"][0]["current_price"], 4.0)
+        self.assertEqual(MerchandisingService.get_block("on_sale")["ids"], [product.pk])
+
+
+class FacetIndexTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Category.objects.create(name="Root")
+        cls.child = Category.objects.create(name="Child", parent=cls.root)
+        cls.other = Category.objects.create(name="Other")
+        color = Attribute.objects.create(name="Color")
+        red = AttributeValue.objects.create(attribute=color, value="Red")
+        blue = AttributeValue.objects.create(attribute=color, value="Blue")
+        cls.products = []
+        for i, category in enumerate([cls.root, cls.child, cls.child, cls.other]):
+            product = Product.objects.create(
+                name=f"Product {i}",
+                category=category,
+                price=Decimal(10 + i),
+                product_type="physical",
+                stock_qty=i,
+            )
+            variant = ProductVariant.objects.create(
+                product=product, name=f"Variant {i}", sku=f"SKU-{i}"
+            )
+            variant.attributes.add(red if i % 2 else blue)
+            cls.products.append(product)
+        FacetIndexService.rebuild()
+
+    def assertFacetsMatchLiveTables(self):
+        facets = CategoryFacet.objects.all()
+        self.assertEqual(len(facets), 4)
+        for facet in facets:
+            category_ids = None
+            if facet.category_id is not None:
+                category_ids = FacetIndexService.get_subtree_ids(facet.category_id)
+            expected = FacetIndexService.compute_facets(category_ids)
+            with self.subTest(category=facet.category_id):
+                self.assertEqual(
+                    {
+                        "product_count": facet.product_count,
+                        "min_price": Decimal(facet.min_price),
+                        "max_price": Decimal(facet.max_price),
+                        "on_sale_count": facet.on_sale_count,
+                        "in_stock_count": facet.in_stock_count,
+                        "attributes": facet.attributes,
+                    },
+                    {
+                        **expected,
+                        "min_price": Decimal(expected["min_price"]),
+                        "max_price": Decimal(expected["max_price"]),
+                    },
+                )
+
+    def test_product_changes_are_applied_as_deltas(self):
+        first, second, third, fourth = Product.objects.order_by("pk")
+        changes = [
+            ("price", lambda: setattr(second, "price", Decimal("50.00"))),
+            ("sale", lambda: setattr(third, "sale_price", Decimal("1.00"))),
+            ("stock", lambda: setattr(second, "stock_qty", 0)),
+            ("deactivate", lambda: setattr(first, "is_active", False)),
+            ("move", lambda: setattr(third, "category", self.other)),
+        ]
+        for name, change in changes:
+            with self.subTest(name):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                    for product in (first, second, third):
+                        product.save()
+                self.assertFacetsMatchLiveTables()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fourth.delete()
+        self.assertFacetsMatchLiveTables()
+
+    def test_only_category_moves_and_activation_rebuild(self):
+        with mock.patch.object(FacetIndexService, "rebuild") as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.child.name = "Renamed"
+                self.child.save()
+            rebuild.assert_not_called()
+
+            for change in (
+                lambda: setattr(self.child, "parent", self.other),
+                lambda: setattr(self.child, "is_active", False),
+            ):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                    self.child.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name="New")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.other.delete()
+
+        self.assertEqual(rebuild.call_count, 4)
+
+
+class InvertedIndexSearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ebooks = Category.objects.create(name="Ebooks")
+        cls.guide = Product.objects.create(
+            name="Python Guide",
+            category=cls.ebooks,
+            price=Decimal("10.00"),
+            description="<p>Learn <b>Django</b> step by step</p>",
+        )
+        cls.course = Product.objects.create(
+            name="Django Course",
+            category=cls.ebooks,
+            price=Decimal("20.00"),
+        )
+        ProductVariant.objects.create(product=cls.course, name="Video", sku="DJ-VID")
+
+    def setUp(self):
+        super().setUp()
+        self.backend = InvertedIndexSearchBackend()
+
+    def search(self, query, backend=None):
+        backend = backend or self.backend
+        return list(
+            backend.search(Product.objects.all(), query).values_list("id", flat=True)
+        )
+
+    def test_matches_are_ranked_by_field_weight(self):
+        # Name matches outrank description matches, markup is ignored
+        self.assertEqual(self.search("django"), [self.course.pk, self.guide.pk])
+        self.assertEqual(self.search("dj-vid"), [self.course.pk])
+        self.assertEqual(self.search("ebooks"), [self.course.pk, self.guide.pk])
+        self.assertEqual(self.search("python django"), [self.guide.pk])
+        self.assertEqual(self.search("python course"), [])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_prefixes_and_typos_match(self):
+        self.assertEqual(self.search("pyth"), [self.guide.pk])
+        self.assertEqual(self.search("pyhton"), [self.guide.pk])
+        self.assertEqual(self.search("xython"), [])
+
+    def test_updates_reach_other_processes(self):
+        other = InvertedIndexSearchBackend()
+        self.assertEqual(self.search("guide", other), [self.guide.pk])
+
+        Product.objects.filter(pk=self.guide.pk).update(name="Flask Handbook")
+        self.backend.index_products([self.guide.pk])
+        self.assertEqual(self.search("guide"), [])
+        self.assertEqual(self.search("handbook", other), [self.guide.pk])
+
+        Product.objects.filter(pk=self.course.pk).delete()
+        self.backend.remove_products([self.course.pk])
+        self.assertEqual(self.search("django"), [self.guide.pk])
+        self.assertEqual(self.search("django", other), [self.guide.pk])
+
+
+class AttributeFilterTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Merch")
+        cls.color = Attribute.objects.create(name="Color")
+        cls.size = Attribute.objects.create(name="Size")
+        cls.red = AttributeValue.objects.create(attribute=cls.color, value="Red")
+        cls.blue = AttributeValue.objects.create(attribute=cls.color, value="Blue")
+        cls.large = AttributeValue.objects.create(attribute=cls.size, value="L")
+        cls.shirt = Product.objects.create(
+            name="Shirt", category=category, price=Decimal("20.00")
+        )
+        cls.mug = Product.objects.create(
+            name="Mug", category=category, price=Decimal("8.00")
+        )
+        cls.red_shirt = ProductVariant.objects.create(
+            product=cls.shirt, name="Red", sku="SHIRT-RED"
+        )
+        cls.red_shirt.attributes.add(cls.red)
+        ProductVariant.objects.create(
+            product=cls.shirt, name="Blue L", sku="SHIRT-BLUE-L"
+        ).attributes.add(cls.blue, cls.large)
+        ProductVariant.objects.create(
+            product=cls.mug, name="Red", sku="MUG-RED"
+        ).attributes.add(cls.red)
+
+    def filter(self, selection):
+        return set(
+            AttributeIndexService.filter_products(
+                Product.objects.all(), selection
+            ).values_list("id", flat=True)
+        )
+
+    def test_products_must_offer_every_selected_value(self):
+        self.assertEqual(
+            self.filter({self.color.pk: "Red"}), {self.shirt.pk, self.mug.pk}
+        )
+        self.assertEqual(self.filter({self.color.pk: "Blue"}), {self.shirt.pk})
+        # Values may come from different variants of the product
+        self.assertEqual(
+            self.filter({self.color.pk: "Red", str(self.size.pk): "L"}), {self.shirt.pk}
+        )
+
+    def test_unknown_values_match_nothing_and_blank_keys_are_ignored(self):
+        self.assertEqual(self.filter({self.color.pk: "Green"}), set())
+        self.assertEqual(
+            self.filter({"color": "Red", self.size.pk: ""}),
+            {self.shirt.pk, self.mug.pk},
+        )
+
+    def test_index_follows_variant_attribute_changes(self):
+        self.red_shirt.attributes.remove(self.red)
+        self.assertEqual(self.filter({self.color.pk: "Red"}), {self.mug.pk})
+
+        self.red_shirt.attributes.add(self.red)
+        self.assertEqual(
+            self.filter({self.color.pk: "Red"}), {self.shirt.pk, self.mug.pk}
+        )
+
+        self.red_shirt.delete()
+        self.assertEqual(self.filter({self.color.pk: "Red"}), {self.mug.pk})
+
+
+class CategoryPathTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = Category.objects.create(name="Root")
+        self.child = Category.objects.create(name="Child", parent=self.root)
+        self.grand = Category.objects.create(name="Grand", parent=self.child)
+        self.other = Category.objects.create(name="Other")
+
+    def assertPaths(self, expected):
+        paths = {
+            category.pk: (category.path, category.depth)
+            for category in Category.objects.all()
+        }
+        self.assertEqual(
+            paths,
+            {
+                category.pk: ("".join(f"{c.pk}/" for c in chain), len(chain) - 1)
+                for category, chain in expected.items()
+            },
+        )
+
+    def test_move_re_roots_the_subtree(self):
+        self.child.parent = self.other
+        self.child.save()
+
+        self.assertPaths(
+            {
+                self.root: [self.root],
+                self.other: [self.other],
+                self.child: [self.other, self.child],
+                self.grand: [self.other, self.child, self.grand],
+            }
+        )
+        self.assertEqual(
+            set(CategoryTreeService.get_subtree_ids(self.other)),
+            {self.other.pk, self.child.pk, self.grand.pk},
+        )
+
+        self.child.parent = None
+        self.child.save()
+
+        self.assertPaths(
+            {
+                self.root: [self.root],
+                self.other: [self.other],
+                self.child: [self.child],
+                self.grand: [self.child, self.grand],
+            }
+        )
+
+    def test_cannot_move_under_own_subtree(self):
+        for parent in (self.root, self.grand):
+            self.root.parent = parent
+            with self.subTest(parent=parent.name):
+                with self.assertRaises(ValidationError) as raised:
+                    self.root.full_clean()
+                self.assertIn("parent", raised.exception.message_dict)
+                with self.assertRaises(ValidationError):
+                    self.root.save()
+        self.assertIsNone(Category.objects.get(pk=self.root.pk).parent_id)
+
+    def test_rebuild_paths_backfills_missing_paths(self):
+        Category.objects.update(path="", depth=0)
+
+        Category.objects.rebuild_paths()
+
+        self.assertPaths(
+            {
+                self.root: [self.root],
+                self.other: [self.other],
+                self.child: [self.root, self.child],
+                self.grand: [self.root, self.child, self.grand],
+            }
+        )
+
+
+class VariantSignatureTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Merch")
+        color = Attribute.objects.create(name="Color")
+        size = Attribute.objects.create(name="Size")
+        cls.red = AttributeValue.objects.create(attribute=color, value="Red")
+        cls.blue = AttributeValue.objects.create(attribute=color, value="Blue")
+        cls.large = AttributeValue.objects.create(attribute=size, value="L")
+        cls.shirt = Product.objects.create(
+            name="Shirt", category=category, price=Decimal("20.00")
+        )
+        cls.red_large = ProductVariant.objects.create(
+            product=cls.shirt, name="Red L", sku="SHIRT-RED-L"
+        )
+        cls.red_large.attributes.add(cls.large, cls.red)
+        cls.blue_large = ProductVariant.objects.create(
+            product=cls.shirt,
+            name="Blue L",
+            sku="SHIRT-BLUE-L",
+            price_adjustment=Decimal("2.00"),
+        )
+        cls.blue_large.attributes.add(cls.blue, cls.large)
+
+    def resolve(self, selection):
+        return AttributeIndexService.resolve_variant(self.shirt, selection)
+
+    def test_signature_is_kept_in_step_with_attributes(self):
+        self.red_large.refresh_from_db()
+        self.assertEqual(
+            self.red_large.attribute_signature,
+            AttributeIndexService.build_signature([self.red.pk, self.large.pk]),
+        )
+
+        self.red_large.attributes.remove(self.large)
+        self.red_large.refresh_from_db()
+        self.assertEqual(self.red_large.attribute_signature, str(self.red.pk))
+
+    def test_selection_resolves_to_a_variant(self):
+        selection = {"2": str(self.large.pk), "1": self.blue.pk}
+        self.assertEqual(self.resolve(selection), self.blue_large)
+        # Partial selections fall back to the first variant offering them
+        self.assertEqual(self.resolve({"2": self.large.pk}), self.red_large)
+        self.assertEqual(self.resolve({}), self.red_large)
+        self.assertIsNone(self.resolve({"1": "red"}))
+
+        self.blue_large.is_active = False
+        self.blue_large.save()
+        self.assertIsNone(self.resolve(selection))
+
+    def test_duplicate_options_leave_no_signature(self):
+        duplicate = ProductVariant.objects.create(
+            product=self.shirt, name="Red L again", sku="SHIRT-RED-L-2"
+        )
+        with self.assertLogs("products.services.attributes", "WARNING"):
+            duplicate.attributes.add(self.red, self.large)
+
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.attribute_signature)
+        self.assertEqual(
+            self.resolve({"1": self.red.pk, "2": self.large.pk}), self.red_large
+        )
+
+    def test_variant_matrix_is_keyed_by_signature(self):
+        matrix = AttributeIndexService.get_variant_matrix(self.shirt)
+
+        signature = AttributeIndexService.build_signature([self.blue.pk, self.large.pk])
+        self.assertEqual(matrix["variants"][signature]["id"], self.blue_large.pk)
+        self.assertEqual(matrix["variants"][signature]["price"], Decimal("22.00"))
+        self.assertEqual(
+            [attribute["name"] for attribute in matrix["attributes"]],
+            ["Color", "Size"],
+        )
+
+
+class MerchandisingRefreshTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ebooks = Category.objects.create(name="Ebooks")
+        cls.courses = Category.objects.create(name="Courses")
+        cls.oldest, cls.older, cls.newest = [
+            Product.objects.create(
+                name=f"Product {i}", category=cls.ebooks, price=Decimal("10.00")
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(MerchandisingService, "BLOCK_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in MerchandisingService.BLOCKS:
+            MerchandisingService.get_block(name)
+        for product in (self.oldest, self.older, self.newest):
+            MerchandisingService.get_related(product)
+        patcher = mock.patch.object(
+            MerchandisingService,
+            "refresh_block",
+            wraps=MerchandisingService.refresh_block,
+        )
+        self.refresh_block = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def refreshed(self):
+        return {call.args[0] for call in self.refresh_block.call_args_list}
+
+    def test_only_affected_blocks_are_refreshed(self):
+        self.assertEqual(
+            MerchandisingService.get_block("new_arrivals")["ids"],
+            [self.newest.pk, self.older.pk],
+        )
+
+        # Too old for the full new arrivals block, now on sale
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oldest.sale_price = Decimal("5.00")
+            self.oldest.save()
+
+        self.assertEqual(self.refreshed(), {"on_sale"})
+        self.assertEqual(
+            MerchandisingService.get_block("on_sale")["ids"], [self.oldest.pk]
+        )
+
+        self.refresh_block.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.newest.is_active = False
+            self.newest.save()
+
+        self.assertEqual(self.refreshed(), {"new_arrivals"})
+        self.assertEqual(
+            MerchandisingService.get_block("new_arrivals")["ids"],
+            [self.older.pk, self.oldest.pk],
+        )
+
+    def test_changes_in_one_transaction_are_coalesced(self):
+        with mock.patch.object(
+            MerchandisingService,
+            "refresh_products",
+            wraps=MerchandisingService.refresh_products,
+        ) as refresh_products:
+            with self.captureOnCommitCallbacks(execute=True):
+                for product in (self.oldest, self.older):
+                    product.is_featured = True
+                    product.save()
+
+        refresh_products.assert_called_once()
+        self.assertEqual(self.refreshed(), {"featured", "new_arrivals"})
+        self.assertEqual(
+            MerchandisingService.get_block("featured")["ids"],
+            [self.older.pk, self.oldest.pk],
+        )
+
+    def test_moves_drop_related_lists_of_both_categories(self):
+        other = Product.objects.create(
+            name="Course", category=self.courses, price=Decimal("30.00")
+        )
+        MerchandisingService.get_related(other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.newest.category = self.courses
+            self.newest.save()
 
-# Create your tests here.
+        self.assertEqual(
+            MerchandisingService.get_related(self.oldest)["ids"], [self.older.pk]
+        )
+        self.assertEqual(
+            MerchandisingService.get_related(other)["ids"], [self.newest.pk]
+        )
@@ -4,7 +4,6 @@ from django.http import JsonResponse
 from django.contrib import messages
 from .models import Product
 from .services.catalog import CatalogService
-from django.core.paginator import Paginator
 
 
 def catalog(request):
@@ -13,7 +12,7 @@ def catalog(request):
     """
     # Get query parameters
     category_slug = request.GET.get("category")
-    page = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor")
     per_page = request.GET.get("per_page", 12)
     sort = request.GET.get("sort", "newest")
     min_price = request.GET.get("min_price")
@@ -42,7 +41,7 @@ def catalog(request):
     # Get products
     paginator, current_page, queryset, has_filters = (
         CatalogService.get_products_by_category(
-            category_slug, page, per_page, **filters
+            category_slug, cursor, per_page, **filters
         )
     )
 
@@ -89,6 +88,7 @@ def product_detail(request, slug):
     context = {
         "product": product,
         "variants": variants,
+        "variant_matrix": CatalogService.get_variant_matrix(product),
         "related_products": related_products,
         "is_digital": is_digital,  # Add digital product flags
         "is_downloadable": is_downloadable,
@@ -103,19 +103,19 @@ def search(request):
     Product search view.
     """
     query = request.GET.get("q", "")
-    page = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor")
     per_page = request.GET.get("per_page", 12)
     product_type = request.GET.get("product_type")  # Add product type filter to search
 
     # Search products
     paginator, current_page, queryset = CatalogService.search_products(
-        query, page, per_page, product_type=product_type
+        query, cursor, per_page, product_type=product_type
     )
 
     context = {
         "query": query,
         "products": current_page,
-        "result_count": queryset.count(),
+        "result_count": paginator.count,
         "paginator": paginator,
         "product_type": product_type,  # Add product type to context
     }
@@ -130,7 +130,10 @@ def category_list(request):
     # Get all active parent categories
     categories = CatalogService.get_categories()
 
-    context = {"categories": categories}
+    context = {
+        "categories": categories,
+        "category_tree": CatalogService.get_category_tree(),
+    }
 
     return render(request, "products/categories.html", context)
 
@@ -147,7 +150,7 @@ def category_detail(request, slug):
         return redirect("products:catalog")
 
     # Get query parameters
-    page = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor")
     per_page = request.GET.get("per_page", 12)
     sort = request.GET.get("sort", "newest")
     min_price = request.GET.get("min_price")
@@ -176,7 +179,7 @@ def category_detail(request, slug):
     # Get products in this category
     paginator, current_page, queryset, has_filters = (
         CatalogService.get_products_by_category(
-            category.slug, page, per_page, **filters
+            category.slug, cursor, per_page, **filters
         )
     )
 
@@ -246,7 +249,7 @@ def digital_products(request):
     """
     View for digital products only.
     """
-    page = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor")
     per_page = request.GET.get("per_page", 12)
     sort = request.GET.get("sort", "newest")
 
@@ -258,7 +261,7 @@ def digital_products(request):
 
     # Get digital products
     paginator, current_page, queryset, has_filters = (
-        CatalogService.get_products_by_category(None, page, per_page, **filters)
+        CatalogService.get_products_by_category(None, cursor, per_page, **filters)
     )
 
     context = {
@@ -275,7 +278,7 @@ def physical_products(request):
     """
     View for physical products only.
     """
-    page = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor")
     per_page = request.GET.get("per_page", 12)
     sort = request.GET.get("sort", "newest")
 
@@ -287,7 +290,7 @@ def physical_products(request):
 
     # Get physical products
     paginator, current_page, queryset, has_filters = (
-        CatalogService.get_products_by_category(None, page, per_page, **filters)
+        CatalogService.get_products_by_category(None, cursor, per_page, **filters)
     )
 
     context = {